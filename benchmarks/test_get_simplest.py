@@ -0,0 +1,72 @@
+"""
+Benchmarks of Shape.get_simplest() for wide unions of intersections.
+
+The shape is an union of overlapping boxes, each one is an intersection of
+planes with some redundant ones. Many subsets of the boxes cover the same
+region, so there are many coverings to be compared.
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_get_simplest.py
+
+Results (time in ms), enumeration of all the coverings with NumPy tables and
+product of all child variants vs branch and bound search on bitsets:
+
+    Boxes    enumeration    branch and bound
+    10             5.3             4.6
+    20           460.3             8.2
+    30        134670.7            26.2
+"""
+import pytest
+
+from mckit.body import Shape
+from mckit.box import Box
+from mckit.surface import create_surface
+
+WIDTHS = [10, 20, 30]
+
+
+def create_shape(n):
+    names = iter(range(1, 10000))
+
+    def plane(kind, value):
+        return create_surface(kind, value, name=next(names))
+
+    y0, y1, z0, z1 = plane("PY", 0), plane("PY", 1), plane("PZ", 0), plane("PZ", 1)
+    # Redundant plane far from the boxes.
+    far = plane("PY", 100)
+    boxes = []
+    for i in range(n):
+        x0, x1 = plane("PX", i), plane("PX", i + 6)
+        boxes.append(
+            Shape(
+                "I",
+                Shape("S", x0),
+                Shape("C", x1),
+                Shape("S", y0),
+                Shape("C", y1),
+                Shape("S", z0),
+                Shape("C", z1),
+                Shape("C", far),
+            )
+        )
+    shape = Shape("U", *boxes)
+    shape.collect_statistics(Box([n / 2 + 2.5, 0.5, 0.5], n + 7, 3, 3), 0.001)
+    return shape
+
+
+SHAPES = {n: create_shape(n) for n in WIDTHS}
+
+
+@pytest.mark.parametrize("n", WIDTHS)
+def test_get_simplest(benchmark, n):
+    result = benchmark(SHAPES[n].get_simplest)
+    assert result[0].complexity() < SHAPES[n].complexity()
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,126 @@
+"""
+Benchmarks of point location in C-lite cells: testing the cells one by one vs
+testing only the cells found with the grid over their bounding boxes (see
+Universe.locator()).
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_locator.py --benchmark-group-by=func
+
+Results on a single core machine (150 cells, 100000 points uniformly distributed
+in the bounding box of the model, min time in ms):
+
+    Name                              Min
+    test_test_points[sequential]    992.4
+    test_test_points[locator]       327.1
+
+A point is tested against 5 of 150 cells on average. Building the locator
+takes 19 s, most of it is spent on the bounding boxes of a few large cells, so it
+pays back for large point sets or repeated queries.
+
+Location of the same points through the filling universes (see
+Universe.locate_points(), 78 universes, depth 2, 31794 points are in filled
+cells):
+
+    first call    344 s
+    next calls    1.05 s
+
+The first call builds the locators of all the filling universes (about 6000
+cells, 50 ms per cell bounding box on average), the next ones reuse them.
+
+Location of 100 tracks of 1000 points along random chords of the bounding box
+(see Universe.track_points(), min time in ms):
+
+    Name                                 Min
+    test_track_points[test_points]     581.1
+    test_track_points[surfaces]        426.6
+    test_track_points[boxes]           303.1
+
+Cells sharing surfaces have 75 neighbours on average, with touching bounding boxes
+16. The results differ from test_points() for 249 points, all of them are in
+overlapping cells.
+"""
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+from mckit import Universe
+from mckit.box import Box
+from mckit.constants import MCNP_ENCODING
+from mckit.parser.mcnp_input_sly_parser import from_text
+from mckit.utils.resource import path_resolver
+
+data_filename_resolver = path_resolver("benchmarks")
+with ZipFile(data_filename_resolver("data/4M.zip")) as data_archive:
+    CLITE_TEXT = data_archive.read("clite.i").decode(encoding=MCNP_ENCODING)
+
+CLITE: Universe = from_text(CLITE_TEXT).universe
+BBOX = CLITE.bounding_box(tol=10)
+POINTS = Box(BBOX.center, *BBOX.dimensions).generate_random_points(100000)
+
+
+def run_sequential(points):
+    result = np.full(points.shape[0], -1, dtype=np.int32)
+    index = np.arange(points.shape[0])
+    for i, c in enumerate(CLITE):
+        if index.size == 0:
+            break
+        inside = c.shape.test_points(points) == +1
+        result[index[inside]] = i
+        index = index[~inside]
+        points = points[~inside]
+    return result
+
+
+def run_locator(points):
+    return CLITE.test_points(points)
+
+
+@pytest.mark.parametrize("method", ["sequential", "locator"])
+def test_test_points(benchmark, method):
+    run = run_sequential if method == "sequential" else run_locator
+    CLITE.locator()
+    result = benchmark.pedantic(run, args=(POINTS,), rounds=3, iterations=1)
+    np.testing.assert_array_equal(result, run_sequential(POINTS))
+
+
+def test_locate_points(benchmark):
+    CLITE.locate_points(POINTS)
+    path = benchmark.pedantic(
+        CLITE.locate_points, args=(POINTS,), rounds=3, iterations=1
+    )
+    np.testing.assert_array_equal(path[:, 0], run_sequential(POINTS))
+
+
+def make_tracks(n_tracks, n_points):
+    box = Box(BBOX.center, *BBOX.dimensions)
+    start = box.generate_random_points(n_tracks)
+    end = box.generate_random_points(n_tracks)
+    t = np.linspace(0, 1, n_points)[None, :, None]
+    return (start[:, None, :] + t * (end - start)[:, None, :]).reshape(-1, 3)
+
+
+TRACKS = make_tracks(100, 1000)
+
+
+@pytest.mark.parametrize("method", ["test_points", "surfaces", "boxes"])
+def test_track_points(benchmark, method):
+    CLITE.locator()
+    if method == "test_points":
+        run, kwargs = CLITE.test_points, {}
+    else:
+        run = CLITE.track_points
+        kwargs = {"adjacency": CLITE.adjacency(use_boxes=method == "boxes")}
+    result = benchmark.pedantic(
+        run, args=(TRACKS,), kwargs=kwargs, rounds=3, iterations=1
+    )
+    assert result.shape == (TRACKS.shape[0],)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,61 @@
+"""
+Benchmarks of classification of mesh voxels with respect to a cell.
+
+The voxels are tested either one by one with Shape.test_box() on the boxes
+obtained with RectMesh.get_voxel(), or with a single call to RectMesh.classify_voxels(),
+which passes all the voxels to Shape.test_boxes().
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_mesh_classification.py
+
+Results on a single core machine (min time in ms for 40x40x40 mesh):
+
+    Name                        Min       Mean
+    test_voxels_one_by_one    270.0      286.2
+    test_classify_voxels       49.2       53.8
+
+On multicore machines test_boxes() distributes the voxels among OpenMP threads.
+"""
+from itertools import product
+
+import numpy as np
+import pytest
+
+from mckit.body import Shape
+from mckit.fmesh import RectMesh
+from mckit.surface import create_surface
+
+N = 40
+BINS = np.linspace(-20, 20, N + 1)
+MESH = RectMesh(BINS, BINS, BINS)
+SHAPE = Shape(
+    "I",
+    Shape("C", create_surface("S", 1, 2, 3, 15)),
+    Shape("S", create_surface("C/Z", 0, 0, 5)),
+    Shape("C", create_surface("PZ", 10)),
+)
+
+
+def voxels_one_by_one():
+    return [
+        SHAPE.test_box(MESH.get_voxel(*index)) for index in product(range(N), repeat=3)
+    ]
+
+
+def test_voxels_one_by_one(benchmark):
+    result = benchmark(voxels_one_by_one)
+    assert len(result) == N**3
+
+
+def test_classify_voxels(benchmark):
+    result = benchmark(MESH.classify_voxels, SHAPE)
+    assert np.array_equal(result.ravel(), voxels_one_by_one())
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,76 @@
+"""
+Benchmarks of repeated computations for C-lite cells with and without the
+octree of box test results kept in the shape (see Shape.enable_octree()).
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_octree.py --benchmark-group-by=func
+
+Results on a single core machine (time in s, the box is the bounding box of the
+cell enlarged by 20%, min_volume 0.1; bounding_box - tol 0.5, test_points -
+200000 points):
+
+                     no octree   first call   next calls
+    volume, cell 21     0.73        0.92         0.19
+    volume, cell 41     0.88        1.09         0.36
+    volume, cell 86    15.9        21.6         17.9
+    bounding_box        0.004       0.005        0.004
+    test_points         0.047       0.061        0.051
+
+The next volume computations take the results from the octree and test only the
+boxes, which were not kept. For cell 86 the tree reaches the default limit of
+10^6 boxes, and most of the boxes are tested again. Storing the results makes the
+first call slower. The boxes of bounding_box() search are not the parts of the
+subdivision of the root box, the octree only shrinks the start box to the parts
+not known to be outside. test_points() doesn't gain: the points are located in
+the tree, but for a fine tree most of the points fall into the boxes, which
+intersect the boundary of the shape, and are tested as before.
+"""
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+from mckit import Universe
+from mckit.box import Box
+from mckit.constants import MCNP_ENCODING
+from mckit.parser.mcnp_input_sly_parser import from_text
+from mckit.utils.resource import path_resolver
+
+data_filename_resolver = path_resolver("benchmarks")
+with ZipFile(data_filename_resolver("data/4M.zip")) as data_archive:
+    CLITE_TEXT = data_archive.read("clite.i").decode(encoding=MCNP_ENCODING)
+
+CLITE: Universe = from_text(CLITE_TEXT).universe
+MIN_VOLUME = 0.1
+
+
+def make_box(shape):
+    bb = shape.bounding_box(tol=1)
+    return Box(bb.center, *(np.array(bb.dimensions) * 1.2))
+
+
+@pytest.mark.parametrize("cell_no", [20, 40])
+@pytest.mark.parametrize("octree", [False, True])
+def test_volume(benchmark, cell_no, octree):
+    shape = CLITE[cell_no].shape
+    box = make_box(shape)
+    expected = shape.volume(box, min_volume=MIN_VOLUME)
+    if octree:
+        shape.enable_octree(box)
+        shape.volume(box, min_volume=MIN_VOLUME)
+    try:
+        result = benchmark.pedantic(
+            shape.volume, args=(box, MIN_VOLUME), rounds=3, iterations=1
+        )
+    finally:
+        shape.disable_octree()
+    assert result == expected
+
+
+if __name__ == "__main__":
+    pytest.main()
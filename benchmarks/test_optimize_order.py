@@ -0,0 +1,77 @@
+"""
+Benchmarks of evaluation of C-lite cells with arguments in the original order
+and in the order found by Shape.optimize_order().
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_optimize_order.py --benchmark-group-by=func
+
+Results on a single core machine (min time in ms; test_points - 200000 points for
+100 cells, bounding_box - 40 cells):
+
+    Name                            Min
+    test_test_points[original]    4942.2
+    test_test_points[optimized]   1406.6
+    test_bounding_box[original]   1691.1
+    test_bounding_box[optimized]   919.9
+
+Optimization of 100 cells takes 2.3 s.
+"""
+from zipfile import ZipFile
+
+import numpy as np
+import pytest
+
+from mckit import Universe
+from mckit.box import Box
+from mckit.constants import MCNP_ENCODING
+from mckit.parser.mcnp_input_sly_parser import from_text
+from mckit.utils.resource import path_resolver
+
+data_filename_resolver = path_resolver("benchmarks")
+with ZipFile(data_filename_resolver("data/4M.zip")) as data_archive:
+    CLITE_TEXT = data_archive.read("clite.i").decode(encoding=MCNP_ENCODING)
+
+CLITE: Universe = from_text(CLITE_TEXT).universe
+BOX = Box([0, 0, 0], 2000, 2000, 2000)
+POINTS = BOX.generate_random_points(200000)
+SHAPES = {"original": [c.shape for c in list(CLITE)[:100]]}
+SHAPES["optimized"] = [s.optimize_order(BOX) for s in SHAPES["original"]]
+
+
+def run_test_points(shapes):
+    return [s.test_points(POINTS) for s in shapes]
+
+
+def run_bounding_box(shapes):
+    return [s.bounding_box(box=BOX, tol=100) for s in shapes[:40]]
+
+
+@pytest.mark.parametrize("order", SHAPES.keys())
+def test_test_points(benchmark, order):
+    result = benchmark.pedantic(
+        run_test_points, args=(SHAPES[order],), rounds=3, iterations=1
+    )
+    assert len(result) == len(SHAPES[order])
+
+
+@pytest.mark.parametrize("order", SHAPES.keys())
+def test_bounding_box(benchmark, order):
+    result = benchmark.pedantic(
+        run_bounding_box, args=(SHAPES[order],), rounds=3, iterations=1
+    )
+    assert len(result) == 40
+
+
+def test_same_results():
+    original, optimized = SHAPES["original"], SHAPES["optimized"]
+    for a, b in zip(run_test_points(original), run_test_points(optimized)):
+        assert np.array_equal(a, b)
+
+
+if __name__ == "__main__":
+    pytest.main()
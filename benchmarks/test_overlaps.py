@@ -0,0 +1,72 @@
+"""
+Benchmarks of search for overlapping cells and gaps in C-lite (see
+Universe.check_overlaps()) and of subtraction of C-lite cells from C-lite
+(see Universe.subtract()).
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_overlaps.py --benchmark-group-by=func
+
+Results on a single core machine (150 cells, the locator is built beforehand in
+22 s, time in s):
+
+    jobs    time
+    1       5.69
+    4       6.72
+
+The bounding boxes leave 1628 of 11175 pairs of cells to be checked, 29 pairs
+overlap. 764 pairs are suspects: ultimate_test_box() doesn't prove them to be
+disjoint, but no random point hits their intersection, almost all of them are
+neighbours sharing surfaces. Threads don't help on a single core.
+
+Subtraction of 10 cells (40-49) from C-lite without simplification: the bounding
+boxes leave 159 of 1500 pairs, ultimate_test_box() proves 64 of them to be
+disjoint, so 95 complements are added instead of 1500. The contacts are found in
+0.09 s, the subtraction takes 0.65 s.
+"""
+from zipfile import ZipFile
+
+import pytest
+
+from mckit import Universe
+from mckit.constants import MCNP_ENCODING
+from mckit.parser.mcnp_input_sly_parser import from_text
+from mckit.utils.resource import path_resolver
+
+data_filename_resolver = path_resolver("benchmarks")
+with ZipFile(data_filename_resolver("data/4M.zip")) as data_archive:
+    CLITE_TEXT = data_archive.read("clite.i").decode(encoding=MCNP_ENCODING)
+
+CLITE: Universe = from_text(CLITE_TEXT).universe
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_check_overlaps(benchmark, jobs):
+    CLITE.locator()
+    report = benchmark.pedantic(
+        CLITE.check_overlaps, kwargs={"jobs": jobs}, rounds=1, iterations=1
+    )
+    assert len(report.overlaps) == 29
+    assert len(report.suspects) == 764
+
+
+def test_subtract(benchmark):
+    other = Universe(CLITE[40:50], name_rule="clash")
+    CLITE.locator()
+    other.locator()
+    result = benchmark.pedantic(
+        CLITE.subtract,
+        args=(other,),
+        kwargs={"simplify": False},
+        rounds=3,
+        iterations=1,
+    )
+    assert len(result) == len(CLITE)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,116 @@
+"""
+Benchmarks of simplification of C-lite cells in the global box with statistics
+collected in the whole box, inside bounding boxes of the cells, progressively
+from coarse to fine boxes and in one subdivision of the box for all the cells.
+
+To use it install plugin pytest-benchmark (https://pytest-benchmark.readthedocs.io/en/latest/index.html#)
+    conda install pytest-benchmark
+    or
+    pip install pytest-benchmark
+
+Run:
+    pytest benchmarks/test_simplify.py --benchmark-group-by=func
+
+Results on a single core machine (time in s for cells 3-40, total complexity of
+the simplified cells):
+
+    min_volume   whole box   bounding box   complexity
+    1.0             3.56         3.69        378 / 374
+    0.1             7.03         7.36        378 / 374
+
+The bounding box doesn't give speedup for C-lite: the boxes far from a cell are
+excluded at the first levels of subdivision, and almost all the work is done near
+the cell's surfaces, where the boxes are split until min_volume. The seed box is
+chosen from the same subdivision process, so these boxes are the same in both
+modes, and the cost of the bounding box and of the final check (see Body.simplify())
+is not paid back. The mode is useful when a cell's surfaces produce inconclusive
+box tests far from the cell. Simplified cells are a bit simpler, because the rows
+of statistics outside of the bounding box are not required to be covered.
+
+Progressive collection (time in s, the complexity is the same as in the whole box):
+
+    cells    min_volume   whole box   progressive
+    3-40        1.0          3.65         2.12
+    3-40        0.1          7.56         3.26
+    85-92       1.0         19.12         2.28
+    1-2         1.0         29.65         3.81
+
+Most of the cells get their simplest form already with boxes 512 times larger
+than min_volume, and then only the boxes, where the remaining surfaces intersect,
+are refined once to check it.
+
+Statistics collection for cells 3-150 with min_volume 10, cell by cell vs in one
+subdivision for all the cells (see simplify_shared()):
+
+                       cell by cell    shared
+    time, s                448.4        452.2
+    optimizer runs         97815        45975
+    prefilter tests       500728       260841
+
+Shared surfaces are tested once per box, so the expensive box tests of GQ, cones
+and tori are halved. But for C-lite most of the time is spent on evaluation of
+the cells' shapes and on variation of surface senses in the smallest boxes,
+which are the same in both modes. The results of simplification are the same.
+"""
+from zipfile import ZipFile
+
+import pytest
+
+from mckit import Universe
+from mckit.body import simplify_shared
+from mckit.box import GLOBAL_BOX
+from mckit.constants import MCNP_ENCODING
+from mckit.parser.mcnp_input_sly_parser import from_text
+from mckit.utils.resource import path_resolver
+
+data_filename_resolver = path_resolver("benchmarks")
+with ZipFile(data_filename_resolver("data/4M.zip")) as data_archive:
+    CLITE_TEXT = data_archive.read("clite.i").decode(encoding=MCNP_ENCODING)
+
+CLITE: Universe = from_text(CLITE_TEXT).universe
+CELLS = list(CLITE)[2:40]
+
+
+def run_simplify(min_volume, use_bounding_box, progressive=False):
+    return [
+        c.simplify(
+            box=GLOBAL_BOX,
+            min_volume=min_volume,
+            use_bounding_box=use_bounding_box,
+            progressive=progressive,
+        )
+        for c in CELLS
+    ]
+
+
+@pytest.mark.parametrize("min_volume", [1.0, 0.1])
+@pytest.mark.parametrize("use_bounding_box", [False, True])
+def test_simplify(benchmark, min_volume, use_bounding_box):
+    result = benchmark.pedantic(
+        run_simplify, args=(min_volume, use_bounding_box), rounds=1, iterations=1
+    )
+    assert len(result) == len(CELLS)
+
+
+@pytest.mark.parametrize("min_volume", [1.0, 0.1])
+def test_simplify_progressive(benchmark, min_volume):
+    result = benchmark.pedantic(
+        run_simplify, args=(min_volume, False, True), rounds=1, iterations=1
+    )
+    assert len(result) == len(CELLS)
+
+
+def run_simplify_shared(min_volume):
+    return list(simplify_shared(CELLS, box=GLOBAL_BOX, min_volume=min_volume))
+
+
+@pytest.mark.parametrize("min_volume", [1.0, 0.1])
+def test_simplify_shared(benchmark, min_volume):
+    result = benchmark.pedantic(
+        run_simplify_shared, args=(min_volume,), rounds=1, iterations=1
+    )
+    assert len(result) == len(CELLS)
+
+
+if __name__ == "__main__":
+    pytest.main()
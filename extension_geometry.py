@@ -2,7 +2,7 @@ import os
 
 from functools import partial
 
-from extension_utils import SYSTEM_WINDOWS, extra_compile_args
+from extension_utils import SYSTEM_WINDOWS, extra_compile_args, extra_link_args
 from setuptools import Extension
 
 # See MKL linking options for various versions of MKL and OS:
@@ -20,7 +20,16 @@ _sources_root = os.path.join("mckit", "src")
 _sources = list(
     map(
         partial(os.path.join, _sources_root),
-        ["geometrymodule.c", "box.c", "surface.c", "shape.c", "rbtree.c"],  # noqa
+        [
+            "geometrymodule.c",
+            "box.c",
+            "surface.c",
+            "shape.c",
+            "statset.c",
+            "octree.c",
+            "evalctx.c",
+            "kstat.c",
+        ],
     )
 )
 
@@ -29,5 +38,6 @@ geometry_extension = Extension(
     sources=_sources,
     libraries=_libraries,
     extra_compile_args=extra_compile_args,
+    extra_link_args=extra_link_args,
     language="c",
 )
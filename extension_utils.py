@@ -6,8 +6,18 @@ import shutil
 from pathlib import Path
 
 SYSTEM_WINDOWS = platform.system() == "Windows"
+SYSTEM_MACOS = platform.system() == "Darwin"
 
 extra_compile_args = ["/O2"] if SYSTEM_WINDOWS else ["-O3", "-w"]
+extra_link_args = []
+
+# OpenMP distributes batch geometry kernels among threads.
+# Apple clang doesn't support it out of the box, the kernels run sequentially there.
+if SYSTEM_WINDOWS:
+    extra_compile_args.append("/openmp")
+elif not SYSTEM_MACOS:
+    extra_compile_args.append("-fopenmp")
+    extra_link_args.append("-fopenmp")
 
 
 def create_directory(path: Path, clean: bool = True) -> Path:
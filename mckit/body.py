@@ -3,9 +3,9 @@ import typing as tp
 from typing import Iterable, List, NewType, Optional, Set, Union
 
 import os
+import time
 
 from copy import deepcopy
-from functools import reduce
 from itertools import groupby, permutations, product
 from multiprocessing import Pool
 
@@ -20,13 +20,176 @@ from .constants import MIN_BOX_VOLUME
 
 # noinspection PyUnresolvedReferences,PyPackageRequirements
 from .geometry import Shape as _Shape
+from .geometry import collect_statistics as _collect_statistics
 from .printer import CELL_OPTION_GROUPS, print_card, print_option
-from .surface import Surface
+from .surface import BOX, RCC, Cone, Cylinder, GQuadratic, Plane, Sphere, Surface, Torus
 from .transformation import Transformation
 from .utils import filter_dict
 
 __all__ = ["Shape", "Body", "simplify", "GLOBAL_BOX", "Card", "TGeometry", "TGeometry"]
 
+# Option of the cell, which simplification was stopped by the budget.
+NOT_FULLY_SIMPLIFIED = "not_fully_simplified"
+
+# Relative costs of surface tests used to order arguments of shapes. The costs
+# of point tests are measured; GQ and Torus are penalized additionally, because
+# their box tests require numerical optimization.
+_SURFACE_COST = {
+    Plane: 1.0,
+    Sphere: 3.0,
+    Cylinder: 4.0,
+    Cone: 4.0,
+    RCC: 12.0,
+    BOX: 15.0,
+    GQuadratic: 20.0,
+    Torus: 30.0,
+}
+
+
+class _Deadline:
+    """Wall clock time limit of anytime computation. None - no limit."""
+
+    def __init__(self, seconds=None):
+        self.time = None if seconds is None else time.monotonic() + seconds
+        self.expired = False
+
+    def check(self):
+        """Checks if the time is over. Once expired, the deadline stays expired."""
+        if not self.expired and self.time is not None:
+            self.expired = time.monotonic() > self.time
+        return self.expired
+
+    def remaining(self):
+        """Gets the remaining time in seconds, 0 - no limit."""
+        if self.time is None:
+            return 0.0
+        return max(self.time - time.monotonic(), 1e-9)
+
+
+# Margin added to the bounding box, which seeds simplification, relative to the
+# linear size of min_volume box. The bounding box is found with the same tolerance.
+SEED_BOX_MARGIN = 2.0
+
+
+def _local_box(box, lo, hi):
+    """Creates box with the basis of box and local coordinates in ranges [lo, hi]."""
+    basis = np.array([box.ex, box.ey, box.ez])
+    center = box.center + 0.5 * (lo + hi) @ basis
+    return Box(center, *(hi - lo), ex=box.ex, ey=box.ey, ez=box.ez)
+
+
+def _seed_box(shape, box, min_volume):
+    """Gets box around the shape, where statistics is collected.
+
+    Returns
+    -------
+    seed : Box
+        Inflated bounding box of the shape.
+    min_volume : float
+        Minimal volume for the seed box.
+    rest : list[Box]
+        Boxes, which cover the rest part of the box.
+    """
+    tol = SEED_BOX_MARGIN * min_volume ** (1 / 3)
+    bb = shape.bounding_box(box=box, tol=tol)
+    half = 0.5 * np.asarray(box.dimensions)
+    basis = np.array([box.ex, box.ey, box.ez])
+    center = basis @ (bb.center - box.center)
+    bb_lo = center - 0.5 * np.asarray(bb.dimensions) - tol
+    bb_hi = center + 0.5 * np.asarray(bb.dimensions) + tol
+    # The seed is the smallest part of the box in the same subdivision process
+    # (see Box.split()), which contains the bounding box. So the boxes tested are
+    # the same, as if statistics was collected in the whole box.
+    lo, hi = -half, half.copy()
+    while True:
+        d = np.argmax(hi - lo)
+        middle = 0.5 * (lo[d] + hi[d])
+        if bb_hi[d] <= middle:
+            hi[d] = middle
+        elif bb_lo[d] >= middle:
+            lo[d] = middle
+        else:
+            break
+    seed = _local_box(box, lo, hi)
+    rest = []
+    # The rest is split into slabs: two for every axis.
+    outer_lo, outer_hi = -half, half.copy()
+    for d in range(3):
+        for a, b in ((outer_lo[d], lo[d]), (hi[d], outer_hi[d])):
+            if b > a:
+                part_lo, part_hi = outer_lo.copy(), outer_hi.copy()
+                part_lo[d], part_hi[d] = a, b
+                rest.append(_local_box(box, part_lo, part_hi))
+        outer_lo[d], outer_hi[d] = lo[d], hi[d]
+    return seed, min_volume, rest
+
+
+# Progressive collection of statistics starts from boxes PROGRESSIVE_RATIO ** PROGRESSIVE_LEVELS
+# times larger than min_volume, every next pass reduces the volume PROGRESSIVE_RATIO times.
+PROGRESSIVE_LEVELS = 3
+PROGRESSIVE_RATIO = 8
+
+
+def _progressive_simplest(shape, box, min_volume, trim_size, max_boxes, deadline):
+    """Finds the simplest variant of the shape collecting statistics from coarse to fine boxes.
+
+    The first pass stops splitting of boxes at the coarse volume. Next passes
+    refine only the boxes, where surfaces of the current simplest variant
+    intersect, with volume reduced by PROGRESSIVE_RATIO. The process stops when the
+    set of these surfaces doesn't change. The statistics of every pass may have
+    extra rows, which can only prevent removal of arguments, so the variant found
+    is valid anyway.
+
+    Returns
+    -------
+    shape : Shape
+        The simplest variant found or None, if the budget is exhausted in the first pass.
+    complete : bool
+        Whether the process is not stopped by the budget.
+    """
+    simplest, refine = None, None
+    for level in range(PROGRESSIVE_LEVELS, -1, -1):
+        complete = shape.collect_statistics(
+            box,
+            min_volume,
+            max_boxes=max_boxes,
+            budget_seconds=deadline.remaining(),
+            coarse_volume=min_volume * PROGRESSIVE_RATIO**level,
+            refine=refine,
+        )
+        if not complete:
+            return simplest, False
+        simplest = shape._get_simplest(trim_size, {}, deadline)[0]
+        if deadline.expired:
+            return simplest, False
+        surfaces = simplest.get_surfaces()
+        if refine is not None and surfaces == set(refine):
+            break
+        refine = list(surfaces)
+    return simplest, True
+
+
+def _bounded_product(variants, limit):
+    """Generates combinations of shape variants with total complexity not greater than limit.
+
+    Every list of variants must be sorted by complexity.
+    """
+    complexities = [[v.complexity() for v in vs] for vs in variants]
+    # The least complexity of the rest variants.
+    rest = np.cumsum([c[0] for c in complexities][::-1])[::-1].tolist() + [0]
+
+    def combine(k, total):
+        if k == len(variants):
+            yield ()
+            return
+        for v, c in zip(variants[k], complexities[k]):
+            if total + c + rest[k + 1] > limit:
+                break
+            for tail in combine(k + 1, total + c):
+                yield (v,) + tail
+
+    return combine(0, 0)
+
 
 # noinspection PyProtectedMember
 class Shape(_Shape):
@@ -48,6 +211,9 @@ class Shape(_Shape):
         Geometry elements. It can be either Shape or Surface instances. But
         no arguments must be specified for 'E' or 'R' opc. Only one argument
         must present for 'C' or 'S' opc values.
+    keep_order : bool
+        Keep the order of the arguments instead of sorting them by hash. The
+        shapes created from this one keep their order too.
 
     Properties
     ----------
@@ -57,17 +223,38 @@ class Shape(_Shape):
         Operation code, complement to the opc.
     args : tuple
         A tuple of shape's arguments.
+    octree_size : int
+        The number of boxes, which test results are kept in the octree.
 
     Methods
     -------
     test_box(box)
         Tests if the box intersects the shape.
-    volume(box, min_volume)
-        Calculates the volume of the shape with desired accuracy.
+    test_boxes(centers, dims, basis, threads)
+        Tests locations of many boxes at once. The boxes have common basis
+        (rows ex, ey, ez, default - global axes) and either common or own
+        dimensions. The boxes are distributed among threads if the geometry
+        module is built with OpenMP. Returns int8 array of test_box() results.
+    volume(box, min_volume, atol, rtol)
+        Calculates the volume of the shape with desired accuracy. If atol or
+        rtol is given, the largest uncertain boxes are refined first until
+        the tolerance is reached, and (volume, max_error) is returned.
+    volume_mc(box, n_points, seed, target_rel_err)
+        Estimates the volume of the shape and its standard deviation by
+        Monte Carlo method.
     bounding_box(box, tol)
         Finds bounding box for the shape with desired accuracy.
-    test_points(points)
-        Tests the senses of the points.
+    test_points(points, out)
+        Tests the senses of the points. If out (contiguous int8 array) is
+        given, the results are written to it.
+    enable_octree(box, max_boxes)
+        Keeps the results of box tests in the subdivision of the box, so that
+        volume(), bounding_box(), test_box() and ultimate_test_box() starting
+        from this box reuse them, and test_points() tests surfaces only for
+        the points in the boxes, which intersect the shape's boundary. At most
+        max_boxes results are kept.
+    disable_octree()
+        Drops the kept results.
     is_complement(other)
         Checks if other is a complement to the shape.
     complement()
@@ -84,10 +271,13 @@ class Shape(_Shape):
         Gets all Surface objects that bounds the shape.
     complexity()
         Gets the complexity of the shape description.
-    get_simplest()
-        Gets the simplest description of the shape.
+    get_simplest(trim_size, budget_seconds)
+        Gets the simplest description of the shape. If the time budget is
+        exceeded, the best description found so far is returned.
     replace_surfaces(replace_dict)
         Creates new Shape object by replacing surfaces.
+    optimize_order(box, n_points)
+        Gets equivalent shape with arguments ordered for faster evaluation.
     """
 
     _opc_hash = {
@@ -99,21 +289,23 @@ class Shape(_Shape):
         "C": ~hash("S"),
     }
 
-    def __init__(self, opc, *args):
-        opc, args = Shape._clean_args(opc, *args)
+    def __init__(self, opc, *args, keep_order=False):
+        opc, args = Shape._clean_args(opc, *args, keep_order=keep_order)
         _Shape.__init__(self, opc, *args)
         self._calculate_hash(opc, *args)
+        self._keep_order = keep_order
 
     def __iter__(self):
         return iter(self.args)
 
     def __getstate__(self):
-        return self.opc, self.args, self._hash
+        return self.opc, self.args, self._hash, self._keep_order
 
     def __setstate__(self, state):
-        opc, args, hash_value = state
+        opc, args, hash_value, *keep_order = state
         _Shape.__init__(self, opc, *args)
         self._hash = hash_value
+        self._keep_order = bool(keep_order and keep_order[0])
 
     def __str__(self):
         words = print_card(self._get_words("U"))
@@ -159,8 +351,12 @@ class Shape(_Shape):
         return words
 
     @classmethod
-    def _clean_args(cls, opc, *args):
-        """Performs cleaning of input arguments."""
+    def _clean_args(cls, opc, *args, keep_order=False):
+        """Performs cleaning of input arguments.
+
+        The arguments are sorted by hash unless keep_order is True. Then the
+        arguments of nested shapes take the place of the nested shape.
+        """
         args = [a.shape if isinstance(a, Body) else a for a in args]
         cls._verify_opc(opc, *args)
         if opc == "I" or opc == "U":
@@ -172,7 +368,10 @@ class Shape(_Shape):
             while i < len(args):
                 if args[i].opc == opc:
                     a = args.pop(i)
-                    args.extend(a.args)
+                    if keep_order:
+                        args[i:i] = a.args
+                    else:
+                        args.extend(a.args)
                 else:
                     i += 1
 
@@ -191,8 +390,11 @@ class Shape(_Shape):
                         else:
                             return "R", []
                 i += 1
-            args = list(set(args))
-            args.sort(key=hash)
+            if keep_order:
+                args = list(dict.fromkeys(args))
+            else:
+                args = list(set(args))
+                args.sort(key=hash)
             if len(args) == 0:
                 opc = "E" if opc == "U" else "R"
         if (
@@ -291,7 +493,7 @@ class Shape(_Shape):
         else:
             opc = self.invert_opc
             c_args = [a.complement() for a in args]
-            return Shape(opc, *c_args)
+            return Shape(opc, *c_args, keep_order=self._keep_order)
 
     def is_complement(self, other):
         """Checks if this shape is complement to the other.
@@ -331,7 +533,7 @@ class Shape(_Shape):
         result : Shape
             New shape.
         """
-        return Shape("I", self, *other)
+        return Shape("I", self, *other, keep_order=self._keep_order)
 
     def union(self, *other):
         """Gets union with other shape.
@@ -345,7 +547,7 @@ class Shape(_Shape):
         -------
         result : Shape
             New shape."""
-        return Shape("U", self, *other)
+        return Shape("U", self, *other, keep_order=self._keep_order)
 
     def transform(self, tr):
         """Transforms the shape.
@@ -369,7 +571,7 @@ class Shape(_Shape):
                 # TODO dvp: check if call of apply_transformation() should be moved to caller site
                 #           it would be better to change only transformations instead of the surfaces
             args.append(a)
-        return Shape(opc, *args)
+        return Shape(opc, *args, keep_order=self._keep_order)
 
     def complexity(self):
         """Gets complexity of shape.
@@ -442,7 +644,7 @@ class Shape(_Shape):
                 break
         return groups
 
-    def get_simplest(self, trim_size=0):
+    def get_simplest(self, trim_size=0, budget_seconds=None):
         """Gets the simplest found description of the shape.
 
         Parameters
@@ -450,23 +652,33 @@ class Shape(_Shape):
         trim_size : int
             Shape variants with complexity greater than minimal one more than
             trim_size are thrown away.
+        budget_seconds : float, optional
+            Time limit of the search. When it is exceeded, the best variants
+            found so far are returned.
 
         Returns
         -------
         shapes : list[Shape]
-            A list of shapes with minimal complexity.
+            A list of shapes with minimal complexity. The shapes are sorted
+            by complexity.
         """
+        return self._get_simplest(trim_size, {}, _Deadline(budget_seconds))
+
+    def _get_simplest(self, trim_size, cache, deadline):
+        """Gets the simplest variants, memoized for subtrees in cache."""
         if self.opc != "I" and self.opc != "U":
             return [self]
-        node_cases = []
-        complexities = []
+        # The key object is kept in the cache, so that its id is not reused.
+        cached = cache.get(id(self))
+        if cached is not None:
+            return cached[1]
+        variants = self._find_simplest(trim_size, cache, deadline)
+        cache[id(self)] = self, variants
+        return variants
+
+    def _find_simplest(self, trim_size, cache, deadline):
         stat = self.get_stat_table()
-        if self.opc == "I":
-            val = -1
-        elif self.opc == "U":
-            val = +1
-        else:
-            return {self}
+        val = -1 if self.opc == "I" else +1
 
         drop_index = np.nonzero(np.all(stat == -val, axis=1))[0]
         if len(drop_index) == 0:
@@ -480,48 +692,94 @@ class Shape(_Shape):
                 return [Shape("R")]
             if self.opc == "U":
                 return [Shape("E")]
-        cases = self._find_coverages(arg_results, value=val)
-        final_cases = set(tuple(c) for c in cases)
-        if len(final_cases) == 0:
-            print(self)
-            return None
-        unique = reduce(set.union, map(set, final_cases))
         args = self.args
-        node_variants = {i: args[i].get_simplest(trim_size) for i in unique}
-        for indices in final_cases:
+        candidates = np.nonzero(np.any(arg_results == val, axis=0))[0]
+        node_variants = {
+            i: args[i]._get_simplest(trim_size, cache, deadline) for i in candidates
+        }
+        costs = {i: v[0].complexity() for i, v in node_variants.items()}
+        cases = self._find_coverages(
+            arg_results, costs, value=val, trim_size=trim_size, deadline=deadline
+        )
+        if not cases:
+            # Some boxes are not decided by any argument: the statistics are
+            # not sufficient to simplify the shape.
+            return [self]
+        limit = min(c for _, c in cases) + trim_size
+        node_cases = []
+        for indices, _ in cases:
             variants = [node_variants[i] for i in indices]
-            for args in product(*variants):
-                node = Shape(self.opc, *args)
-                node_cases.append(node)
-                complexities.append(node.complexity())
-        sort_ind = np.argsort(complexities)
-        final_nodes = []
-        min_complexity = complexities[sort_ind[0]]
-        for i in sort_ind:
-            final_nodes.append(node_cases[i])
-            if complexities[i] > min_complexity + trim_size:
-                break
-        return final_nodes
+            for node_args in _bounded_product(variants, limit):
+                node = Shape(self.opc, *node_args)
+                node_cases.append((node.complexity(), len(node_cases), node))
+        node_cases.sort(key=lambda x: x[:2])
+        min_complexity = node_cases[0][0]
+        return [n for c, _, n in node_cases if c <= min_complexity + trim_size]
 
     @staticmethod
-    def _find_coverages(results, value=+1):
-        n = results.shape[1]
-        cnt = np.count_nonzero(results == value, axis=1)
-        i = np.argmin(cnt)
+    def _find_coverages(results, costs, value=+1, trim_size=0, deadline=None):
+        """Finds sets of arguments, which cover all the rows of results.
+
+        The argument j covers the row i, if results[i, j] == value. The search
+        is branch and bound on bitsets of covered rows. The rows are taken in
+        order of increasing number of arguments covering them, and the arguments
+        in order of increasing cost.
+
+        Parameters
+        ----------
+        results : numpy.ndarray
+            Table of argument results. Every row must be covered by some argument.
+        costs : dict
+            Costs of the arguments, which cover at least one row.
+        value : int
+            Result value that covers a row.
+        trim_size : int
+            Covers with total cost greater than minimal one more than trim_size
+            are thrown away.
+        deadline : _Deadline, optional
+            Time limit of the search. When it is exceeded, the search stops
+            as soon as at least one cover is found.
+
+        Returns
+        -------
+        cases : list[tuple]
+            Pairs (sorted list of argument indices, total cost) in order of search.
+        """
+        covers = np.unique(results == value, axis=0)
+        covers = covers[np.argsort(np.count_nonzero(covers, axis=1), kind="stable")]
+        masks = {
+            j: int.from_bytes(np.packbits(covers[::-1, j]).tobytes(), "big")
+            >> (-len(covers) % 8)
+            for j in costs
+        }
+        row_candidates = [
+            sorted(np.nonzero(row)[0], key=lambda j: (costs[j], j)) for row in covers
+        ]
         cases = []
-        for j in range(n):
-            if results[i][j] == value:
-                reminder = np.compress(results[:, j] != value, results, axis=0)
-                if reminder.shape[0] == 0:
-                    sub_cases = [[j]]
-                else:
-                    sub_cases = Shape._find_coverages(reminder, value=value)
-                    for s in sub_cases:
-                        s.append(j)
-                cases.extend(sub_cases)
-        for c in cases:
-            c.sort()
-        return cases
+        best = [np.inf]
+
+        def search(uncovered, excluded, chosen, cost):
+            if cases and deadline is not None and deadline.check():
+                return
+            if uncovered == 0:
+                cases.append((sorted(chosen), cost))
+                best[0] = min(best[0], cost)
+                return
+            row = (uncovered & -uncovered).bit_length() - 1
+            excluded = set(excluded)
+            for j in row_candidates[row]:
+                if j in excluded:
+                    continue
+                if cost + costs[j] > best[0] + trim_size:
+                    break
+                chosen.append(j)
+                search(uncovered & ~masks[j], excluded, chosen, cost + costs[j])
+                chosen.pop()
+                # Covers with j are already found.
+                excluded.add(j)
+
+        search((1 << len(covers)) - 1, set(), [], 0)
+        return [(c, cost) for c, cost in cases if cost <= best[0] + trim_size]
 
     def replace_surfaces(self, replace_dict):
         """Creates new Shape instance by replacing surfaces.
@@ -546,10 +804,69 @@ class Shape(_Shape):
             return Shape(self.opc, surf)
         elif self.opc == "I" or self.opc == "U":
             args = [arg.replace_surfaces(replace_dict) for arg in self.args]
-            return Shape(self.opc, *args)
+            return Shape(self.opc, *args, keep_order=self._keep_order)
         else:
             return self
 
+    def optimize_order(self, box=GLOBAL_BOX, n_points=10000):
+        """Gets equivalent shape with arguments ordered for faster evaluation.
+
+        Arguments of intersections and unions are evaluated in order until the
+        result is decided. The arguments are ordered greedily: the next one
+        has the smallest ratio of its cost to the fraction of undecided points
+        it decides. The fractions are estimated on random points in the box.
+        The returned shape keeps the order in its complement, unions,
+        intersections, transformed copies and pickles.
+
+        Parameters
+        ----------
+        box : Box
+            The box, where the shape is to be evaluated.
+        n_points : int
+            The number of random points used to estimate selectivity of arguments.
+
+        Returns
+        -------
+        shape : Shape
+            The shape equal to this one.
+        """
+        points = box.generate_random_points(n_points)
+        return self._optimize_order(points)[0]
+
+    def _optimize_order(self, points):
+        """Reorders arguments and estimates cost of evaluation per point."""
+        if self.opc == "S" or self.opc == "C":
+            return self, _SURFACE_COST.get(type(self.args[0]), 1.0)
+        if self.opc == "E" or self.opc == "R":
+            return self, 0.0
+        stop = -1 if self.opc == "I" else +1
+        args, costs, decides = [], [], []
+        for a in self.args:
+            arg, cost = a._optimize_order(points)
+            args.append(arg)
+            costs.append(cost)
+            decides.append(arg.test_points(points) == stop)
+        undecided = np.ones(len(points), dtype=bool)
+        eps = 0.5 / len(points)
+        remaining = list(range(len(args)))
+        order = []
+        total_cost = 0.0
+        while remaining:
+            n = np.count_nonzero(undecided)
+            fractions = [
+                np.count_nonzero(decides[i] & undecided) / len(points)
+                for i in remaining
+            ]
+            k = min(
+                range(len(remaining)),
+                key=lambda j: costs[remaining[j]] / max(fractions[j], eps),
+            )
+            i = remaining.pop(k)
+            order.append(args[i])
+            total_cost += costs[i] * n / len(points)
+            undecided &= ~decides[i]
+        return Shape(self.opc, *order, keep_order=True), total_cost
+
     @staticmethod
     def from_polish_notation(polish):
         """Creates Shape instance from reversed Polish notation.
@@ -735,6 +1052,10 @@ class Body(Card):
         split_disjoint=False,
         min_volume=MIN_BOX_VOLUME,
         trim_size=1,
+        budget_seconds=None,
+        max_boxes=None,
+        use_bounding_box=False,
+        progressive=False,
     ):
         """Simplifies this cell by removing unnecessary surfaces.
 
@@ -753,28 +1074,98 @@ class Body(Card):
         trim_size : int
             Max size of set to return. It is used to prevent unlimited growth
             of the variant set.
+        budget_seconds : float, optional
+            Time limit of the simplification.
+        max_boxes : int, optional
+            The maximal number of boxes tested while statistics is collected.
+        use_bounding_box : bool
+            Collect statistics only inside the coarse bounding box of the cell,
+            inflated by the tolerance. Simplified shape matches the original one
+            only where statistics is collected, so it is checked to be outside
+            of the rest part of the box. If the check fails, the cell is
+            simplified in the whole box.
+        progressive : bool
+            Collect statistics in passes from coarse to fine boxes, refining
+            only the boxes, where surfaces of the current simplest variant
+            intersect, until the set of these surfaces doesn't change.
 
         Returns
         -------
         simple_cell : Cell
-            Simplified version of this cell.
+            Simplified version of this cell. If the budget is exhausted while
+            statistics is collected, the cell is returned as is; if it is exhausted
+            while the simplest variant is searched, the best one found so far is
+            returned. In both cases the cell gets option NOT_FULLY_SIMPLIFIED.
         """
-        # print('Collect stage...')
-        self._shape.collect_statistics(box, min_volume)
-        # print('finding optimal solution...')
-        variants = self._shape.get_simplest(trim_size)
-        # print(len(variants))
-        options = filter_dict(self.options, "original")
-        return Body(variants[0], **options)
+        deadline = _Deadline(budget_seconds)
+        stat_box, stat_min_volume, rest = box, min_volume, []
+        if use_bounding_box:
+            stat_box, stat_min_volume, rest = _seed_box(self._shape, box, min_volume)
+        if progressive:
+            shape, complete = _progressive_simplest(
+                self._shape,
+                stat_box,
+                stat_min_volume,
+                trim_size,
+                max_boxes or 0,
+                deadline,
+            )
+        else:
+            shape = None
+            complete = self._shape.collect_statistics(
+                stat_box,
+                stat_min_volume,
+                max_boxes=max_boxes or 0,
+                budget_seconds=deadline.remaining(),
+            )
+            if complete:
+                shape = self._shape._get_simplest(trim_size, {}, deadline)[0]
+                complete = not deadline.expired
+        if shape is not None:
+            if any(shape.ultimate_test_box(b, stat_min_volume) != -1 for b in rest):
+                # Simplified shape extends beyond the bounding box.
+                remaining = None if deadline.time is None else deadline.remaining()
+                return self.simplify(
+                    box=box,
+                    min_volume=min_volume,
+                    trim_size=trim_size,
+                    budget_seconds=remaining,
+                    max_boxes=max_boxes,
+                    progressive=progressive,
+                )
+        else:
+            shape = self._shape
+        return self._simplified(shape, complete)
+
+    def _simplified(self, shape, complete):
+        """Creates simplified version of this cell with the shape given."""
+        options = filter_dict(self.options, "original", NOT_FULLY_SIMPLIFIED)
+        if not complete:
+            options[NOT_FULLY_SIMPLIFIED] = True
+        return Body(shape, **options)
 
-    def split(self, box=GLOBAL_BOX, min_volume=MIN_BOX_VOLUME):
+    def split(self, box=GLOBAL_BOX, min_volume=MIN_BOX_VOLUME, use_bounding_box=False):
         """Splits cell into disjoint cells.
 
+        Parameters
+        ----------
+        box : Box
+            Box where geometry should be split.
+        min_volume : float
+            The smallest value of box's volume when the process of box splitting
+            must be stopped.
+        use_bounding_box : bool
+            Collect statistics only inside the coarse bounding box of the cell.
+            The parts are subsets of the cell, so they don't need the check
+            done by simplify().
+
         Returns
         -------
         cells : list
 
         """
+        if use_bounding_box:
+            box, min_volume, _ = _seed_box(self.shape, box, min_volume)
         self.shape.collect_statistics(box, min_volume)
         shape_groups = self.shape.split_shape()
         bodies = [Body(shape, **self.options) for shape in shape_groups]
@@ -872,7 +1263,13 @@ class Body(Card):
 
 
 def simplify(
-    cells: Iterable, box: Box = GLOBAL_BOX, min_volume: float = 1.0
+    cells: Iterable,
+    box: Box = GLOBAL_BOX,
+    min_volume: float = 1.0,
+    budget_seconds: Optional[float] = None,
+    max_boxes: Optional[int] = None,
+    use_bounding_box: bool = False,
+    progressive: bool = False,
 ) -> tp.Generator:
     """Simplifies the cells.
 
@@ -885,33 +1282,128 @@ def simplify(
         Box, from which simplification process starts. Default: GLOBAL_BOX.
     min_volume : float
         Minimal volume of the box, when splitting process terminates.
+    budget_seconds : float, optional
+        Time limit of simplification of a cell.
+    max_boxes : int, optional
+        The maximal number of boxes tested for a cell.
+    use_bounding_box : bool
+        Collect statistics inside bounding boxes of the cells. See Body.simplify().
+    progressive : bool
+        Collect statistics from coarse to fine boxes. See Body.simplify().
 
     """
 
     for c in cells:
-        cs = c.simplify(box=box, min_volume=min_volume)
+        cs = c.simplify(
+            box=box,
+            min_volume=min_volume,
+            budget_seconds=budget_seconds,
+            max_boxes=max_boxes,
+            use_bounding_box=use_bounding_box,
+            progressive=progressive,
+        )
+        if not cs.shape.is_empty():
+            yield cs
+
+
+def simplify_shared(
+    cells: Iterable,
+    box: Box = GLOBAL_BOX,
+    min_volume: float = 1.0,
+    budget_seconds: Optional[float] = None,
+    max_boxes: Optional[int] = None,
+) -> tp.Generator:
+    """Simplifies the cells with statistics collected in one subdivision of the box.
+
+    The box is subdivided once for all the cells, and every part of it is
+    tested only for the cells, which can intersect it. So a surface shared by
+    neighbouring cells is tested once per box instead of once per cell. The
+    cells are simplified the same way as by simplify().
+
+    Parameters
+    ----------
+
+    cells:
+        iterable over cells to simplify
+    box : Box
+        Box, from which simplification process starts. Default: GLOBAL_BOX.
+    min_volume : float
+        Minimal volume of the box, when splitting process terminates.
+    budget_seconds : float, optional
+        Time limit of simplification of a cell. The statistics of all the cells
+        is collected within the sum of their budgets.
+    max_boxes : int, optional
+        The maximal number of boxes tested for a cell. The statistics of all
+        the cells is collected within the sum of their budgets.
+    """
+    cells = list(cells)
+    complete = _collect_statistics(
+        [c.shape for c in cells],
+        box,
+        min_volume,
+        max_boxes=(max_boxes or 0) * len(cells),
+        budget_seconds=(budget_seconds or 0) * len(cells),
+    )
+    for c in cells:
+        shape = c.shape
+        deadline = _Deadline(budget_seconds)
+        if complete:
+            shape = shape._get_simplest(1, {}, deadline)[0]
+        cs = c._simplified(shape, complete and not deadline.expired)
         if not cs.shape.is_empty():
             yield cs
 
 
 class Simplifier(object):
-    def __init__(self, box: Box = GLOBAL_BOX, min_volume: float = 1.0):
+    def __init__(
+        self,
+        box: Box = GLOBAL_BOX,
+        min_volume: float = 1.0,
+        budget_seconds: Optional[float] = None,
+        max_boxes: Optional[int] = None,
+        use_bounding_box: bool = False,
+        progressive: bool = False,
+    ):
         self.box = box
         self.min_volume = min_volume
+        self.budget_seconds = budget_seconds
+        self.max_boxes = max_boxes
+        self.use_bounding_box = use_bounding_box
+        self.progressive = progressive
 
     def __call__(self, cell: Body):
-        return cell.simplify(box=self.box, min_volume=self.min_volume)
+        return cell.simplify(
+            box=self.box,
+            min_volume=self.min_volume,
+            budget_seconds=self.budget_seconds,
+            max_boxes=self.max_boxes,
+            use_bounding_box=self.use_bounding_box,
+            progressive=self.progressive,
+        )
 
     def __getstate__(self):
-        return self.box, self.min_volume
+        return (
+            self.box,
+            self.min_volume,
+            self.budget_seconds,
+            self.max_boxes,
+            self.use_bounding_box,
+            self.progressive,
+        )
 
     def __setstate__(self, state):
-        box, min_volume = state
-        self.__init__(box, min_volume)
+        self.__init__(*state)
 
 
 def simplify_mp(
-    cells: Iterable[Body], box: Box = GLOBAL_BOX, min_volume: float = 1.0, chunksize=1
+    cells: Iterable[Body],
+    box: Box = GLOBAL_BOX,
+    min_volume: float = 1.0,
+    chunksize=1,
+    budget_seconds: Optional[float] = None,
+    max_boxes: Optional[int] = None,
+    use_bounding_box: bool = False,
+    progressive: bool = False,
 ) -> tp.Generator:
     """Simplifies the cells in multiprocessing mode.
 
@@ -925,12 +1417,27 @@ def simplify_mp(
     min_volume : float
         Minimal volume of the box, when splitting process terminates.
     chunksize: size of chunks to pass to child processes
+    budget_seconds : float, optional
+        Time limit of simplification of a cell, so that one pathological
+        cell doesn't stall the whole batch.
+    max_boxes : int, optional
+        The maximal number of boxes tested for a cell.
+    use_bounding_box : bool
+        Collect statistics inside bounding boxes of the cells. See Body.simplify().
+    progressive : bool
+        Collect statistics from coarse to fine boxes. See Body.simplify().
     """
     cpus = os.cpu_count()
+    simplifier = Simplifier(
+        box=box,
+        min_volume=min_volume,
+        budget_seconds=budget_seconds,
+        max_boxes=max_boxes,
+        use_bounding_box=use_bounding_box,
+        progressive=progressive,
+    )
     with Pool(processes=cpus) as pool:
-        yield from pool.imap(
-            Simplifier(box=box, min_volume=min_volume), cells, chunksize=chunksize
-        )
+        yield from pool.imap(simplifier, cells, chunksize=chunksize)
 
 
 def simplify_mpp(
@@ -938,6 +1445,10 @@ def simplify_mpp(
     box: Box = GLOBAL_BOX,
     min_volume: float = 1.0,
     chunksize: int = 1,
+    budget_seconds: Optional[float] = None,
+    max_boxes: Optional[int] = None,
+    use_bounding_box: bool = False,
+    progressive: bool = False,
 ) -> tp.Generator:
     """Simplifies the cells in multiprocessing mode with progress bar.
 
@@ -951,13 +1462,31 @@ def simplify_mpp(
     min_volume : float
         Minimal volume of the box, when splitting process terminates.
     chunksize: size of chunks to pass to child processes
+    budget_seconds : float, optional
+        Time limit of simplification of a cell.
+    max_boxes : int, optional
+        The maximal number of boxes tested for a cell.
+    use_bounding_box : bool
+        Collect statistics inside bounding boxes of the cells. See Body.simplify().
+    progressive : bool
+        Collect statistics from coarse to fine boxes. See Body.simplify().
     """
 
     def fmt_fun(x):
         return "Simplifying cell #{0}".format(x.name() if x else x)
 
     with progressbar(
-        simplify_mp(cells, box, min_volume, chunksize), item_show_func=fmt_fun
+        simplify_mp(
+            cells,
+            box,
+            min_volume,
+            chunksize,
+            budget_seconds,
+            max_boxes,
+            use_bounding_box,
+            progressive,
+        ),
+        item_show_func=fmt_fun,
     ) as pb:
         for c in pb:
             yield c
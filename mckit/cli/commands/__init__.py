@@ -3,5 +3,6 @@
 from .check import check as do_check  # noca: F401
 from .compose import compose as do_compose  # noca: F401
 from .decompose import decompose as do_decompose  # noca: F401
+from .overlaps import overlaps as do_overlaps  # noca: F401
 from .split import split as do_split  # noca: F401
 from .transform import transform as do_transform  # noca: F401
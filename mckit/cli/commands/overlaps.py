@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Finds overlapping cells and gaps between cells in all universes of a model.
+"""
+from pathlib import Path
+
+from mckit.parser.mcnp_input_sly_parser import ParseResult, from_file
+from mckit.universe import Universe
+from mckit.utils.logging import logger
+
+
+def format_point(point) -> str:
+    return "({:.4g}, {:.4g}, {:.4g})".format(*point)
+
+
+def overlaps(
+    source, jobs: int, n_points: int, gap_points: int, min_volume: float
+) -> int:
+    logger.info("Check overlaps in model {}", source)
+    parse_result: ParseResult = from_file(Path(source))
+    model = parse_result.universe
+    found = 0
+    for u in sorted(model.get_universes(), key=Universe.name):
+        logger.debug("Check universe {} of {} cells", u.name(), len(u))
+        report = u.check_overlaps(
+            min_volume=min_volume, n_points=n_points, gap_points=gap_points, jobs=jobs
+        )
+        for o in report.overlaps:
+            print(
+                f"Universe {u.name()}: cells {u[o.first].name()} and {u[o.second].name()} "
+                f"overlap, volume ~ {o.volume:.3g}, at {format_point(o.points[0])}"
+            )
+        if report.suspects:
+            logger.info(
+                "Universe {}: {} pairs of cells touch or overlap by a volume "
+                "too small for the points",
+                u.name(),
+                len(report.suspects),
+            )
+        for first, second in report.suspects:
+            logger.debug(
+                "Universe {}: cells {} and {} are not proved to be disjoint",
+                u.name(),
+                u[first].name(),
+                u[second].name(),
+            )
+        if report.gap_points.shape[0] > 0:
+            print(
+                f"Universe {u.name()}: gaps, volume ~ {report.gap_volume:.3g}, "
+                f"at {format_point(report.gap_points[0])}"
+            )
+        found += len(report.overlaps) + (report.gap_points.shape[0] > 0)
+    print(f"Total of overlaps and gaps: {found}")
+    return found
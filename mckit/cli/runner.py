@@ -1,5 +1,6 @@
 from typing import List
 
+import os
 import sys
 
 from contextlib import contextmanager
@@ -13,10 +14,13 @@ from mckit.cli.commands import (
     do_check,
     do_compose,
     do_decompose,
+    do_overlaps,
     do_split,
     do_transform,
 )
 from mckit.cli.commands.common import get_default_output_directory
+from mckit.constants import MIN_BOX_VOLUME
+from mckit.overlaps import GAP_POINTS, PAIR_POINTS
 from mckit.utils import MCNP_ENCODING
 from mckit.utils.logging import logger
 
@@ -211,6 +215,60 @@ def check(sources: List[click.Path]) -> None:
         do_check(source)
 
 
+# noinspection PyCompatibility
+@mckit.command()
+@click_loguru.init_logger()
+@click.option(
+    "--jobs",
+    "-j",
+    type=click.INT,
+    default=os.cpu_count(),
+    show_default=True,
+    help="Number of threads",
+)
+@click.option(
+    "--points",
+    "-n",
+    type=click.INT,
+    default=PAIR_POINTS,
+    show_default=True,
+    help="Number of random points tested for a pair of cells",
+)
+@click.option(
+    "--gap-points",
+    type=click.INT,
+    default=GAP_POINTS,
+    show_default=True,
+    help="Number of random points tested for gaps",
+)
+@click.option(
+    "--min-volume",
+    type=click.FLOAT,
+    default=MIN_BOX_VOLUME,
+    show_default=True,
+    help="Minimal volume of boxes in tests of intersections of cells",
+)
+@click.argument(
+    "sources", metavar="<source>", type=click.Path(exists=True), nargs=-1, required=True
+)
+def overlaps(
+    jobs: int,
+    points: int,
+    gap_points: int,
+    min_volume: float,
+    sources: List[click.Path],
+) -> None:
+    """Find overlapping cells and gaps between cells in MCNP model(s).
+
+    Exit with status 1, if any overlaps or gaps are found.
+    """
+    found = 0
+    for source in sources:
+        found += do_overlaps(source, jobs, points, gap_points, min_volume)
+    if found > 0:
+        sys.exit(1)
+
+
 # noinspection PyCompatibility
 @mckit.command()
 @click_loguru.init_logger()
@@ -27,6 +27,7 @@ class RectMesh:
     -------
     shape() - gets the shape of mesh.
     get_voxel(i, j, k) - gets the voxel of RectMesh with indices i, j, k.
+    classify_voxels(shape) - tests locations of all voxels with respect to the shape.
     """
 
     def __init__(self, xbins, ybins, zbins, transform: Transformation = None):
@@ -106,6 +107,43 @@ class RectMesh:
         zdim = self._zbins[k + 1] - self._zbins[k]
         return Box(center, xdim, ydim, zdim, ex=self._ex, ey=self._ey, ez=self._ez)
 
+    def classify_voxels(self, shape, threads=0):
+        """Tests locations of all the voxels with respect to the shape.
+
+        All the voxels are tested by a single call to the geometry module,
+        which is much faster than testing voxels obtained by get_voxel() one by one.
+
+        Parameters
+        ----------
+        shape : Shape
+            The shape to test voxels against.
+        threads : int
+            The number of threads to use. Default: 0 - the number of
+            threads is chosen by OpenMP.
+
+        Returns
+        -------
+        result : numpy.ndarray[int8]
+            Array of the mesh shape. +1 if the voxel lies inside the shape,
+            -1 if it lies outside and 0 if the voxel may intersect the shape.
+        """
+        cx, cy, cz = np.meshgrid(
+            mids(self._xbins), mids(self._ybins), mids(self._zbins), indexing="ij"
+        )
+        centers = np.stack((cx.ravel(), cy.ravel(), cz.ravel()), axis=1)
+        dx, dy, dz = np.meshgrid(
+            np.diff(self._xbins),
+            np.diff(self._ybins),
+            np.diff(self._zbins),
+            indexing="ij",
+        )
+        dims = np.stack((dx.ravel(), dy.ravel(), dz.ravel()), axis=1)
+        if self._tr:
+            centers = self._tr.apply2point(centers)
+        basis = np.array([self._ex, self._ey, self._ez])
+        result = shape.test_boxes(centers, dims, basis=basis, threads=threads)
+        return result.reshape(self.shape)
+
     def voxel_index(self, point, local=False):
         """Gets index of voxel that contains specified point.
 
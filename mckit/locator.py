@@ -0,0 +1,260 @@
+"""Spatial index of cells for point location."""
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .box import GLOBAL_BOX, Box
+
+__all__ = ["CellLocator", "LOCATOR_TOL"]
+
+# Default tolerance of the cells' bounding boxes.
+LOCATOR_TOL = 1.0
+# The number of voxels of the grid per cell.
+VOXELS_PER_CELL = 8
+# Cells, which bounding boxes cover larger part of the grid, are not put into
+# the voxels, but are tested for every point.
+LARGE_CELL_FRACTION = 0.25
+# The number of points located at once.
+LOCATE_CHUNK_SIZE = 1 << 16
+
+
+class CellLocator:
+    """Uniform grid over bounding boxes of cells.
+
+    Every cell is registered in the voxels of the grid, which its bounding box
+    (aligned with global axes) intersects. A point is tested only against the
+    cells of the voxel it falls into, and which bounding boxes contain it.
+    The grid spans the bounding boxes of bounded cells. A cell is considered
+    unbounded, if its bounding box reaches the boundary of the start box. Such
+    cells are also tested for the points outside the grid.
+
+    Parameters
+    ----------
+    cells : Sequence[Body]
+        Cells to be indexed. The order of cells defines cell indices.
+    box : Box
+        Start box for bounding boxes of the cells.
+    tol : float
+        Tolerance of bounding boxes.
+
+    Properties
+    ----------
+    lower, upper : np.ndarray
+        Corners of the cells' bounding boxes (aligned with global axes)
+        extended by tol, shape (n, 3).
+    extent : Box
+        Box of the grid, it spans the bounded cells. None, if all the cells
+        are unbounded.
+
+    Methods
+    -------
+    is_valid(cells, box, tol)
+        Checks if the locator is built for these cells and parameters.
+    candidates(points)
+        Gets cells and indices of points to be tested in them.
+    locate(points, out, multiple)
+        Finds cells, which the points belong to.
+    """
+
+    def __init__(
+        self, cells: Sequence, box: Box = GLOBAL_BOX, tol: float = LOCATOR_TOL
+    ):
+        self._cells = tuple(cells)
+        self._box = box
+        self._tol = tol
+        n = len(self._cells)
+        self._lower = np.empty((n, 3))
+        self._upper = np.empty((n, 3))
+        self._bounded = np.ones(n, dtype=bool)
+        basis = np.array([box.ex, box.ey, box.ez])
+        half = 0.5 * np.asarray(box.dimensions) - tol
+        for i, c in enumerate(self._cells):
+            corners = c.shape.bounding_box(box=box, tol=tol).corners
+            self._lower[i] = np.min(corners, axis=0) - tol
+            self._upper[i] = np.max(corners, axis=0) + tol
+            local = np.abs((corners - box.center) @ basis.T)
+            self._bounded[i] = np.all(local < half)
+        self._build_grid()
+        # Cells to be tested for the points outside the grid.
+        self._outer = np.setdiff1d(np.flatnonzero(~self._bounded), self._everywhere)
+
+    def _build_grid(self):
+        bounded = np.flatnonzero(self._bounded)
+        if bounded.size == 0:
+            self._shape = None
+            self._everywhere = np.arange(len(self._cells), dtype=np.int32)
+            return
+        self._origin = np.min(self._lower[bounded], axis=0)
+        extent = np.max(self._upper[bounded], axis=0) - self._origin
+        extent = np.maximum(extent, 1.0e-3 * np.max(extent))
+        voxel = (np.prod(extent) / (VOXELS_PER_CELL * len(self._cells))) ** (1 / 3)
+        self._shape = np.maximum(np.ceil(extent / voxel), 1).astype(int)
+        self._voxel = extent / self._shape
+        total = int(np.prod(self._shape))
+        voxel_ids = []
+        cell_ids = []
+        everywhere = []
+        for i in range(len(self._cells)):
+            low = self._voxel_index(self._lower[i])
+            high = self._voxel_index(self._upper[i])
+            size = np.prod(high - low + 1)
+            if size > LARGE_CELL_FRACTION * total:
+                everywhere.append(i)
+                continue
+            ranges = [np.arange(a, b + 1) for a, b in zip(low, high)]
+            ids = np.ravel_multi_index(np.meshgrid(*ranges, indexing="ij"), self._shape)
+            voxel_ids.append(ids.ravel())
+            cell_ids.append(np.full(ids.size, i, dtype=np.int32))
+        self._everywhere = np.array(everywhere, dtype=np.int32)
+        if voxel_ids:
+            voxel_ids = np.concatenate(voxel_ids)
+            cell_ids = np.concatenate(cell_ids)
+        else:
+            voxel_ids = np.empty(0, dtype=int)
+            cell_ids = np.empty(0, dtype=np.int32)
+        order = np.argsort(voxel_ids, kind="stable")
+        self._data = cell_ids[order]
+        self._counts = np.bincount(voxel_ids, minlength=total)
+        self._starts = np.cumsum(self._counts) - self._counts
+
+    def _voxel_index(self, points):
+        index = np.floor((points - self._origin) / self._voxel).astype(int)
+        return np.clip(index, 0, self._shape - 1)
+
+    @property
+    def lower(self) -> np.ndarray:
+        return self._lower
+
+    @property
+    def upper(self) -> np.ndarray:
+        return self._upper
+
+    @property
+    def extent(self) -> Optional[Box]:
+        if self._shape is None:
+            return None
+        return Box(
+            self._origin + 0.5 * self._shape * self._voxel, *(self._shape * self._voxel)
+        )
+
+    def is_valid(self, cells: Sequence, box: Box, tol: float) -> bool:
+        """Checks if the locator is built for the same cells and parameters."""
+        return (
+            self._tol == tol
+            and self._box == box
+            and len(self._cells) == len(cells)
+            and all(a is b for a, b in zip(self._cells, cells))
+        )
+
+    def candidates(self, points: np.ndarray) -> Iterator[Tuple[int, np.ndarray]]:
+        """Gets cells and indices of points, which are to be tested in them.
+
+        Parameters
+        ----------
+        points : np.ndarray
+            Points of shape (n, 3).
+
+        Returns
+        -------
+        cells : Iterator[Tuple[int, np.ndarray]]
+            Pairs of cell index and indices of points in ascending order of
+            cells. The cells, which are tested for all the points, share the
+            array of indices.
+        """
+        n = points.shape[0]
+        all_ids = np.arange(n)
+        groups = {}
+        if self._shape is None:
+            in_grid = np.zeros(n, dtype=bool)
+        else:
+            low = self._origin
+            high = self._origin + self._shape * self._voxel
+            in_grid = np.all((points >= low) & (points <= high), axis=1)
+            inside = all_ids[in_grid]
+            index = self._voxel_index(points[inside])
+            v = np.ravel_multi_index(index.T, self._shape)
+            counts = self._counts[v]
+            pids = np.repeat(inside, counts)
+            offsets = np.arange(pids.size) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            cids = self._data[np.repeat(self._starts[v], counts) + offsets]
+            p = points[pids]
+            fit = ~self._bounded[cids] | np.all(
+                (p >= self._lower[cids]) & (p <= self._upper[cids]), axis=1
+            )
+            pids = pids[fit]
+            cids = cids[fit]
+            order = np.argsort(cids, kind="stable")
+            pids = pids[order]
+            cids = cids[order]
+            starts = np.flatnonzero(np.diff(cids, prepend=-1))
+            groups = dict(zip(cids[starts].tolist(), np.split(pids, starts[1:])))
+        outside = all_ids[~in_grid]
+        outer = set(self._outer.tolist()) if outside.size else set()
+        everywhere = set(self._everywhere.tolist()) if n else set()
+        for c in sorted(groups.keys() | outer | everywhere):
+            if c in everywhere:
+                yield c, all_ids
+            elif c in outer and c in groups:
+                yield c, np.concatenate((groups[c], outside))
+            elif c in outer:
+                yield c, outside
+            else:
+                yield c, groups[c]
+
+    def locate(
+        self, points, out: Optional[np.ndarray] = None, multiple: bool = False
+    ) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """Finds cells, which the points belong to.
+
+        The points are processed by chunks, so only the results take memory
+        proportional to the number of points.
+
+        Parameters
+        ----------
+        points : array_like[float]
+            Points of shape (n, 3).
+        out : np.ndarray[int32], optional
+            An array of length n, where results are put.
+        multiple : bool
+            If True, points belonging to several cells are reported too.
+
+        Returns
+        -------
+        result : np.ndarray[int32]
+            Indices of the first cells, which contain the points. -1 means
+            that the point doesn't belong to any cell.
+        claimed : np.ndarray[bool]
+            Only if multiple is True. True for points, which belong to
+            several cells.
+        """
+        points = np.asarray(points).reshape(-1, 3)
+        n = points.shape[0]
+        if out is None:
+            out = np.empty(n, dtype=np.int32)
+        claimed = np.zeros(n, dtype=bool) if multiple else None
+        for start in range(0, n, LOCATE_CHUNK_SIZE):
+            stop = start + LOCATE_CHUNK_SIZE
+            chunk = np.ascontiguousarray(points[start:stop], dtype=float)
+            self._locate_chunk(
+                chunk, out[start:stop], None if claimed is None else claimed[start:stop]
+            )
+        if multiple:
+            return out, claimed
+        return out
+
+    def _locate_chunk(self, points, out, claimed):
+        out[:] = -1
+        claims = None
+        if claimed is not None:
+            claims = np.zeros(points.shape[0], dtype=np.int32)
+        # The cells are processed in ascending order, so the first claim wins.
+        for c, pids in self.candidates(points):
+            sense = self._cells[c].shape.test_points(points[pids])
+            hit = pids[sense == +1]
+            out[hit[out[hit] < 0]] = c
+            if claims is not None:
+                claims[hit] += 1
+        if claimed is not None:
+            claimed[:] = claims > 1
@@ -0,0 +1,271 @@
+"""Detection of contacts, overlaps and gaps between cells of universes."""
+from typing import List, Optional, Tuple
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from attr import attrib, attrs
+
+from .body import Shape
+from .box import Box
+from .constants import MIN_BOX_VOLUME
+
+__all__ = [
+    "Overlap",
+    "OverlapReport",
+    "check_overlaps",
+    "find_box_contacts",
+    "find_contacts",
+]
+
+# The number of random points tested in the common part of bounding boxes of
+# two cells.
+PAIR_POINTS = 1000
+# The number of random points tested for gaps between cells.
+GAP_POINTS = 100000
+# The maximal number of sample points kept for an overlap or for gaps.
+MAX_SAMPLES = 10
+
+
+@attrs
+class Overlap:
+    """Overlap of two cells.
+
+    Attributes
+    ----------
+    first, second : int
+        Indices of the cells, first < second.
+    volume : float
+        Estimation of the volume of the overlap.
+    points : np.ndarray
+        Sample points, which belong to both cells.
+    """
+
+    first: int = attrib()
+    second: int = attrib()
+    volume: float = attrib()
+    points: np.ndarray = attrib(repr=False)
+
+
+@attrs
+class OverlapReport:
+    """Results of check for overlaps and gaps.
+
+    Attributes
+    ----------
+    overlaps : List[Overlap]
+        Overlapping pairs of cells.
+    suspects : List[Tuple[int, int]]
+        Pairs of cells, which intersection is not proved to be empty by
+        ultimate_test_box(), but no random point hits it. Usually the cells
+        touch each other, but they can overlap by a volume too small for the
+        points.
+    gap_volume : float
+        Estimation of the volume of the region, which doesn't belong to any
+        cell.
+    gap_points : np.ndarray
+        Sample points, which don't belong to any cell.
+    """
+
+    overlaps: List[Overlap] = attrib(factory=list)
+    suspects: List[Tuple[int, int]] = attrib(factory=list)
+    gap_volume: float = attrib(default=0.0)
+    gap_points: np.ndarray = attrib(factory=lambda: np.empty((0, 3)), repr=False)
+
+    @property
+    def is_clean(self) -> bool:
+        """Checks if neither overlaps nor gaps are found. Suspects are allowed."""
+        return not self.overlaps and self.gap_points.shape[0] == 0
+
+
+def find_box_contacts(lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """Finds pairs of intersecting boxes aligned with global axes.
+
+    The boxes are swept along x axis, so that only the boxes, which
+    projections on x intersect, are compared.
+
+    Parameters
+    ----------
+    lower, upper : np.ndarray
+        Corners of the boxes, shape (n, 3).
+
+    Returns
+    -------
+    pairs : np.ndarray[int]
+        Sorted pairs of indices i < j of intersecting boxes, shape (m, 2).
+    """
+    order = np.argsort(lower[:, 0], kind="stable")
+    low, high = lower[order], upper[order]
+    ends = np.searchsorted(low[:, 0], high[:, 0], side="right")
+    pairs = [np.empty((0, 2), dtype=int)]
+    for k in range(order.size):
+        others = np.arange(k + 1, ends[k])
+        touch = np.all(
+            (low[others, 1:] <= high[k, 1:]) & (low[k, 1:] <= high[others, 1:]), axis=1
+        )
+        others = order[others[touch]]
+        pairs.append(np.column_stack((np.full(others.size, order[k]), others)))
+    pairs = np.sort(np.concatenate(pairs), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def _common_box(lower, upper):
+    if np.any(upper <= lower):
+        return None
+    return Box(0.5 * (lower + upper), *(upper - lower))
+
+
+def _map(function, items, jobs):
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            return list(executor.map(function, items))
+    return list(map(function, items))
+
+
+def find_contacts(
+    universe, other, min_volume: float = MIN_BOX_VOLUME, jobs: int = 1
+) -> List[np.ndarray]:
+    """Finds cells of the other universe, which can intersect cells of the universe.
+
+    The cells are selected, if their bounding boxes (see Universe.locator())
+    intersect, and ultimate_test_box() doesn't prove, that the intersection
+    of the cells is empty in the common part of the boxes. The cells, which
+    only touch each other, can be omitted.
+
+    Parameters
+    ----------
+    universe, other : Universe
+        Universes, which cells are checked.
+    min_volume : float
+        Minimal volume of boxes in ultimate_test_box().
+    jobs : int
+        The number of threads, in which the pairs are checked.
+
+    Returns
+    -------
+    contacts : List[np.ndarray[int32]]
+        Sorted indices of cells of the other universe for every cell of the
+        universe.
+    """
+    first, second = universe.locator(), other.locator()
+    n = len(universe)
+    lower = np.vstack((first.lower, second.lower))
+    upper = np.vstack((first.upper, second.upper))
+    pairs = find_box_contacts(lower, upper)
+    pairs = pairs[(pairs[:, 0] < n) & (pairs[:, 1] >= n)]
+
+    def may_intersect(pair):
+        i, j = pair
+        box = _common_box(
+            np.maximum(lower[i], lower[j]), np.minimum(upper[i], upper[j])
+        )
+        if box is None:
+            return False
+        shape = Shape("I", universe[i].shape, other[j - n].shape)
+        return shape.ultimate_test_box(box, min_volume=min_volume) != -1
+
+    contacts = [[] for _ in range(n)]
+    for (i, j), flag in zip(pairs, _map(may_intersect, pairs, jobs)):
+        if flag:
+            contacts[i].append(j - n)
+    return [np.array(c, dtype=np.int32) for c in contacts]
+
+
+def _seed(*entropy) -> int:
+    """Gets seed of random points from the seed given by user and indices."""
+    return int(np.random.SeedSequence(entropy).generate_state(1)[0])
+
+
+def _check_pair(first, second, lower, upper, min_volume, n_points, seed):
+    """Returns None if the cells don't intersect, or volume and sample points.
+
+    No sample points mean that the intersection is not proved to be empty,
+    but no random point hits it.
+    """
+    box = _common_box(lower, upper)
+    if box is None:
+        return None
+    shape = Shape("I", first.shape, second.shape)
+    if shape.ultimate_test_box(box, min_volume=min_volume) == -1:
+        return None
+    points = box.generate_random_points(n_points, seed=seed)
+    inside = shape.test_points(points) == +1
+    return np.mean(inside) * box.volume, points[inside][:MAX_SAMPLES]
+
+
+def check_overlaps(
+    universe,
+    box: Optional[Box] = None,
+    min_volume: float = MIN_BOX_VOLUME,
+    n_points: int = PAIR_POINTS,
+    gap_points: int = GAP_POINTS,
+    jobs: int = 1,
+    seed: int = 0,
+) -> OverlapReport:
+    """Finds overlapping cells and gaps between cells of the universe.
+
+    Broad phase: the pairs of cells with intersecting bounding boxes (see
+    Universe.locator()) are selected. Narrow phase: the intersection of the
+    cells is tested in the common part of their bounding boxes with
+    ultimate_test_box(), and if it is not proved to be empty, with random
+    points. The pairs, which no point hits, are reported as suspects. Gaps
+    are searched with random points in the box. The random points depend
+    only on the seed and the cells, not on the order of checks.
+
+    Parameters
+    ----------
+    universe : Universe
+        Universe to be checked. Only its own cells are checked.
+    box : Box, optional
+        Box, where gaps are searched. Default: the box around all the cells,
+        which don't reach the boundary of GLOBAL_BOX.
+    min_volume : float
+        Minimal volume of boxes in ultimate_test_box().
+    n_points : int
+        The number of random points tested for a pair of cells.
+    gap_points : int
+        The number of random points tested for gaps.
+    jobs : int
+        The number of threads, in which the pairs are checked.
+    seed : int
+        Seed of random points.
+
+    Returns
+    -------
+    report : OverlapReport
+        Overlapping pairs, suspects and gaps.
+    """
+    cells = universe.cells
+    locator = universe.locator()
+    lower, upper = locator.lower, locator.upper
+    pairs = find_box_contacts(lower, upper)
+
+    def check_pair(pair):
+        i, j = pair
+        return _check_pair(
+            cells[i],
+            cells[j],
+            np.maximum(lower[i], lower[j]),
+            np.minimum(upper[i], upper[j]),
+            min_volume,
+            n_points,
+            _seed(seed, i, j),
+        )
+
+    report = OverlapReport()
+    for (i, j), result in zip(pairs, _map(check_pair, pairs, jobs)):
+        if result is None:
+            continue
+        if result[1].shape[0] == 0:
+            report.suspects.append((int(i), int(j)))
+        else:
+            report.overlaps.append(Overlap(int(i), int(j), *result))
+    if box is None:
+        box = locator.extent
+    if box is not None and gap_points > 0:
+        points = box.generate_random_points(gap_points, seed=_seed(seed))
+        lost = universe.test_points(points) < 0
+        report.gap_volume = np.mean(lost) * box.volume
+        report.gap_points = points[lost][:MAX_SAMPLES]
+    return report
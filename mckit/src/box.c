@@ -1,7 +1,12 @@
 #include <stdlib.h>
+#include <math.h>
 #include "nlopt.h"
 #include "mkl.h"
 #include "box.h"
+#include "kstat.h"
+
+// The number of points generated by single call to random generator.
+#define BOX_RNG_BATCH 65536
 
 // Turn on caching of test_box results.
 char enable_box_cache = 0;
@@ -46,7 +51,7 @@ int box_init(
         return BOX_FAILURE;
     }
 
-    int i;
+    int i, j;
     for (i = 0; i < NDIM; ++i) box->center[i] = center[i];
 
     box->dims[0] = xdim;
@@ -62,22 +67,25 @@ int box_init(
         box->ez[i] = ez[i];
     }
 
-    // Finding coordinates of box's corners
+    // Finding coordinates of box's corners. Loops over 3-vectors are faster
+    // than BLAS calls here.
+    double hx[NDIM], hy[NDIM], hz[NDIM];
+    for (j = 0; j < NDIM; ++j) {
+        hx[j] = 0.5 * xdim * ex[j];
+        hy[j] = 0.5 * ydim * ey[j];
+        hz[j] = 0.5 * zdim * ez[j];
+    }
     for (i = 0; i < NCOR; ++i) {
-        cblas_dcopy(NDIM, box->center, 1, box->corners + i * NDIM, 1);
-        cblas_daxpy(NDIM, 0.5 * perm[i][0] * box->dims[0], box->ex, 1, box->corners + i * NDIM, 1);
-        cblas_daxpy(NDIM, 0.5 * perm[i][1] * box->dims[1], box->ey, 1, box->corners + i * NDIM, 1);
-        cblas_daxpy(NDIM, 0.5 * perm[i][2] * box->dims[2], box->ez, 1, box->corners + i * NDIM, 1);
+        for (j = 0; j < NDIM; ++j) {
+            box->corners[i * NDIM + j] = center[j] + perm[i][0] * hx[j] + perm[i][1] * hy[j] + perm[i][2] * hz[j];
+        }
     }
 
     // Finding lower and upper bounds
-    cblas_dcopy(NDIM, box->corners, 1, box->lb, 1);
-    cblas_dcopy(NDIM, box->corners, 1, box->ub, 1);
-    for (int i = 1; i < NCOR; ++i) {
-        for (int j = 0; j < NDIM; ++j) {
-            if (box->corners[i * NDIM + j] < box->lb[j]) box->lb[j] = box->corners[i * NDIM + j];
-            if (box->corners[i * NDIM + j] > box->ub[j]) box->ub[j] = box->corners[i * NDIM + j];
-        }
+    for (j = 0; j < NDIM; ++j) {
+        double h = fabs(hx[j]) + fabs(hy[j]) + fabs(hz[j]);
+        box->lb[j] = center[j] - h;
+        box->ub[j] = center[j] + h;
     }
 
     box->rng = NULL;
@@ -99,6 +107,14 @@ void box_copy(Box * dst, const Box * src)
     dst->subdiv = src->subdiv;
 }
 
+int box_seed_random_points(Box * box, unsigned int seed)
+{
+    if (box->rng != NULL) vslDeleteStream(&box->rng);
+    box->rng = NULL;
+    vslNewStream(&box->rng, VSL_BRNG_MT19937, seed);
+    return (box->rng != NULL) ? BOX_SUCCESS : BOX_FAILURE;
+}
+
 int box_generate_random_points(
     Box * box,
     size_t npts,
@@ -106,21 +122,26 @@ int box_generate_random_points(
 )
 {
     // If rng is not allocated yet, try to allocate. It will be used at future calls.
-    if (box->rng == NULL) vslNewStream(&box->rng, VSL_BRNG_MT19937, 777);
+    if (box->rng == NULL) vslNewStream(&box->rng, VSL_BRNG_MT19937, BOX_RNG_SEED);
     if (box->rng == NULL) return BOX_FAILURE;
-    int i, status;
-    double d[NDIM];
+    size_t i, j, n;
+    int status;
+    double d[NDIM], * p;
 
-    // TODO: Try to implement generation of all points during one single call to rng.
-    for (i = 0; i < npts; ++i) {
+    // Random numbers are generated by batches, one call to rng per batch.
+    for (; npts > 0; npts -= n, points += n * NDIM) {
+        n = (npts < BOX_RNG_BATCH) ? npts : BOX_RNG_BATCH;
         status = vdRngUniform(VSL_RNG_METHOD_UNIFORM_STD,
-                              box->rng, NDIM, d, -0.5, 0.5);
+                              box->rng, (MKL_INT) (n * NDIM), points, -0.5, 0.5);
         if (status != VSL_STATUS_OK) return BOX_FAILURE;
 
-        cblas_dcopy(NDIM, box->center, 1, points + i * NDIM, 1);
-        cblas_daxpy(NDIM, d[0] * box->dims[0], box->ex, 1, points + i * NDIM, 1);
-        cblas_daxpy(NDIM, d[1] * box->dims[1], box->ey, 1, points + i * NDIM, 1);
-        cblas_daxpy(NDIM, d[2] * box->dims[2], box->ez, 1, points + i * NDIM, 1);
+        for (i = 0; i < n; ++i) {
+            p = points + i * NDIM;
+            for (j = 0; j < NDIM; ++j) d[j] = p[j] * box->dims[j];
+            for (j = 0; j < NDIM; ++j) {
+                p[j] = box->center[j] + d[0] * box->ex[j] + d[1] * box->ey[j] + d[2] * box->ez[j];
+            }
+        }
     }
     return BOX_SUCCESS;
 }
@@ -161,38 +182,55 @@ int box_split(
 )
 {
     // Find splitting direction
-    if (dir == BOX_SPLIT_AUTODIR) dir = (int) cblas_idamax(NDIM, box->dims, 1);
+    int i, j;
+    if (dir == BOX_SPLIT_AUTODIR) {
+        dir = 0;
+        for (i = 1; i < NDIM; ++i) if (box->dims[i] > box->dims[dir]) dir = i;
+    }
 
-    double center1[NDIM], center2[NDIM], dims1[NDIM], dims2[NDIM];
     const double * basis[NDIM] = {box->ex, box->ey, box->ez};
-
-    // find new dimensions
-    cblas_dcopy(NDIM, box->dims, 1, dims1, 1);
-    cblas_dcopy(NDIM, box->dims, 1, dims2, 1);
-    dims1[dir] *= ratio;
-    dims2[dir] *= 1 - ratio;
-
-    // find new centers.
-    cblas_dcopy(NDIM, box->center, 1, center1, 1);
-    cblas_dcopy(NDIM, box->center, 1, center2, 1);
-
-    cblas_daxpy(NDIM, -0.5 * dims2[dir], basis[dir], 1, center1, 1);
-    cblas_daxpy(NDIM,  0.5 * dims1[dir], basis[dir], 1, center2, 1);
+    const double * e = basis[dir];
+    double d1 = box->dims[dir] * ratio;
+    double d2 = box->dims[dir] - d1;
+
+    // The halves differ from the parent box only along splitting direction.
+    // Their fields are derived from the parent's ones directly.
+    *box1 = *box;
+    *box2 = *box;
+    box1->rng = NULL;
+    box2->rng = NULL;
+    box1->dims[dir] = d1;
+    box2->dims[dir] = d2;
+    box1->volume = box->volume * ratio;
+    box2->volume = box->volume - box1->volume;
+    for (j = 0; j < NDIM; ++j) {
+        box1->center[j] -= 0.5 * d2 * e[j];
+        box2->center[j] += 0.5 * d1 * e[j];
+    }
+    // Corners with positive shift along dir move for the first box, and with
+    // negative shift - for the second one.
+    for (i = 0; i < NCOR; ++i) {
+        if (perm[i][dir] > 0) {
+            for (j = 0; j < NDIM; ++j) box1->corners[i * NDIM + j] -= d2 * e[j];
+        } else {
+            for (j = 0; j < NDIM; ++j) box2->corners[i * NDIM + j] += d1 * e[j];
+        }
+    }
+    for (j = 0; j < NDIM; ++j) {
+        if (e[j] > 0) {
+            box1->ub[j] -= d2 * e[j];
+            box2->lb[j] += d1 * e[j];
+        } else {
+            box1->lb[j] -= d2 * e[j];
+            box2->ub[j] += d1 * e[j];
+        }
+    }
 
     // subdivision index.
     char hb = high_bit(box->subdiv);
     uint64_t ones = ~0;
     uint64_t mask = (ones) >> (BIT_LEN - 1) << (hb - 1);
     uint64_t start_bit = mask << 1;
-    // create new boxes.
-    int status;
-    status = box_init(box1, center1, box->ex, box->ey, box->ez,
-                        dims1[0], dims1[1], dims1[2]);
-    if (status == BOX_FAILURE) return BOX_FAILURE;
-
-    status = box_init(box2, center2, box->ex, box->ey, box->ez,
-                        dims2[0], dims2[1], dims2[2]);
-    if (status == BOX_FAILURE) return BOX_FAILURE;
 
     if (box->subdiv & HIGHEST_BIT) {
         box1->subdiv = box->subdiv;
@@ -206,6 +244,42 @@ int box_split(
 }
 
 
+int box_stack_init(BoxStack * stack, size_t capacity)
+{
+    stack->len = 0;
+    stack->boxes = (Box *) malloc(capacity * sizeof(Box));
+    stack->capacity = (stack->boxes != NULL) ? capacity : 0;
+    return (stack->boxes != NULL) ? BOX_SUCCESS : BOX_FAILURE;
+}
+
+void box_stack_dispose(BoxStack * stack)
+{
+    free(stack->boxes);
+    stack->boxes = NULL;
+    stack->len = 0;
+    stack->capacity = 0;
+}
+
+Box * box_stack_push(BoxStack * stack, size_t n)
+{
+    if (stack->len + n > stack->capacity) {
+        size_t capacity = 2 * (stack->len + n);
+        Box * boxes = (Box *) realloc(stack->boxes, capacity * sizeof(Box));
+        if (boxes == NULL) return NULL;
+        stack->boxes = boxes;
+        stack->capacity = capacity;
+    }
+    Box * top = stack->boxes + stack->len;
+    stack->len += n;
+    return top;
+}
+
+void box_stack_pop(BoxStack * stack, Box * box)
+{
+    *box = stack->boxes[--stack->len];
+}
+
+
 void box_ieqcons(
     unsigned int m,
     double * result,
@@ -237,51 +311,118 @@ void box_ieqcons(
 }
 
 
-double min_func(
+void box_optimizer_init(BoxOptimizer * optimizer)
+{
+    optimizer->opt = NULL;
+    optimizer->box = NULL;
+}
+
+void box_optimizer_dispose(BoxOptimizer * optimizer)
+{
+    if (optimizer->opt != NULL) nlopt_destroy(optimizer->opt);
+    optimizer->opt = NULL;
+}
+
+// Constraints of the current box of the optimizer.
+static void optimizer_ieqcons(
+    unsigned int m,
+    double * result,
     unsigned int n,
     const double * x,
     double * grad,
     void * f_data
 )
 {
-    Box * data = (Box *) f_data;
-    if (grad != NULL) {
-        cblas_dcopy(NDIM, x, 1, grad, 1);
-        cblas_daxpy(NDIM, -1, data->center, 1, grad, 1);
-        cblas_dscal(NDIM, 2, grad, 1);
+    box_ieqcons(m, result, n, x, grad, (void *) ((BoxOptimizer *) f_data)->box);
+}
+
+nlopt_opt box_optimizer_setup(BoxOptimizer * optimizer, const Box * box)
+{
+    if (optimizer->opt == NULL) {
+        nlopt_opt opt = nlopt_create(NLOPT_LD_SLSQP, 3);
+        if (opt == NULL) return NULL;
+        nlopt_add_inequality_mconstraint(opt, 6, optimizer_ieqcons, (void*) optimizer, NULL);
+        nlopt_set_stopval(opt, 0);
+        nlopt_set_maxeval(opt, 1000); // TODO: consider passing this parameter.
+        optimizer->opt = opt;
+        kstat_add(KSTAT_OPTIMIZERS_CREATED, 1);
     }
-    double delta[NDIM];
-    cblas_dcopy(NDIM, x, 1, delta, 1);
-    cblas_daxpy(NDIM, -1, data->center, 1, delta, 1);
-    return cblas_ddot(NDIM, delta, 1, delta, 1);
+    optimizer->box = box;
+    nlopt_set_lower_bounds(optimizer->opt, box->lb);
+    nlopt_set_upper_bounds(optimizer->opt, box->ub);
+    return optimizer->opt;
 }
 
-// Checks if the box intersects with another one.
+nlopt_result box_optimizer_run(BoxOptimizer * optimizer, double * x, double * opt_val)
+{
+    kstat_add(KSTAT_OPTIMIZER_RUNS, 1);
+    return nlopt_optimize(optimizer->opt, x, opt_val);
+}
+
+// Tolerance added to absolute values of basis products. It prevents false
+// separation by cross products of almost parallel edges.
+#define SAT_EPS 1.e-12
+
+/* Separating axis test for two oriented boxes. The candidate axes are 3 edge
+ * directions of every box and 9 cross products of them. The boxes don't
+ * intersect, if projections of them on any of the axes don't overlap.
+ */
 int box_check_intersection(
     const Box * box1,
     const Box * box2
 )
 {
-    double x[NDIM], opt_val;
-    nlopt_result opt_result;
-    int result;
+    const double * a[NDIM] = {box1->ex, box1->ey, box1->ez};
+    const double * b[NDIM] = {box2->ex, box2->ey, box2->ez};
+    double ha[NDIM], hb[NDIM], r[NDIM][NDIM], ar[NDIM][NDIM], d[NDIM], t[NDIM];
+    double ra, rb;
+    int i, j;
 
-    nlopt_opt opt;
-    opt = nlopt_create(NLOPT_LD_SLSQP, 3);
-    nlopt_set_lower_bounds(opt, box1->lb);
-    nlopt_set_upper_bounds(opt, box1->ub);
-
-    nlopt_set_min_objective(opt, min_func, box2);
-
-    nlopt_add_inequality_mconstraint(opt, 6, box_ieqcons, (void*) box1, NULL);
-    nlopt_set_stopval(opt, 0);
-    nlopt_set_maxeval(opt, 1000); // TODO: consider passing this parameter.
+    for (i = 0; i < NDIM; ++i) {
+        ha[i] = 0.5 * box1->dims[i];
+        hb[i] = 0.5 * box2->dims[i];
+        d[i] = box2->center[i] - box1->center[i];
+    }
+    // Basis of box2 and distance between centers in the basis of box1.
+    for (i = 0; i < NDIM; ++i) {
+        t[i] = a[i][0] * d[0] + a[i][1] * d[1] + a[i][2] * d[2];
+        for (j = 0; j < NDIM; ++j) {
+            r[i][j] = a[i][0] * b[j][0] + a[i][1] * b[j][1] + a[i][2] * b[j][2];
+            ar[i][j] = fabs(r[i][j]) + SAT_EPS;
+        }
+    }
+    // Axes of box1.
+    for (i = 0; i < NDIM; ++i) {
+        rb = hb[0] * ar[i][0] + hb[1] * ar[i][1] + hb[2] * ar[i][2];
+        if (fabs(t[i]) > ha[i] + rb) return 0;
+    }
+    // Axes of box2.
+    for (j = 0; j < NDIM; ++j) {
+        ra = ha[0] * ar[0][j] + ha[1] * ar[1][j] + ha[2] * ar[2][j];
+        if (fabs(t[0] * r[0][j] + t[1] * r[1][j] + t[2] * r[2][j]) > ra + hb[j]) return 0;
+    }
+    // Cross products of the axes a[i] x b[j].
+    for (i = 0; i < NDIM; ++i) {
+        int i1 = (i + 1) % NDIM, i2 = (i + 2) % NDIM;
+        for (j = 0; j < NDIM; ++j) {
+            int j1 = (j + 1) % NDIM, j2 = (j + 2) % NDIM;
+            ra = ha[i1] * ar[i2][j] + ha[i2] * ar[i1][j];
+            rb = hb[j1] * ar[i][j2] + hb[j2] * ar[i][j1];
+            if (fabs(t[i2] * r[i1][j] - t[i1] * r[i2][j]) > ra + rb) return 0;
+        }
+    }
+    return 1;
+}
 
-    cblas_dcopy(NDIM, box1->center, 1, x, 1);
-    opt_result = nlopt_optimize(opt, x, &opt_val);
-    box_test_points(box2, 1, x, &result);
-    nlopt_destroy(opt);
-    return result;
+void box_check_intersections(
+    const Box * box,
+    size_t n,
+    const Box * const * others,
+    char * result
+)
+{
+    size_t i;
+    for (i = 0; i < n; ++i) result[i] = (char) box_check_intersection(box, others[i]);
 }
 
 
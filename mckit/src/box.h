@@ -12,10 +12,14 @@
 #define BOX_SPLIT_Z 2
 #define BOX_SPLIT_AUTODIR -1
 
+// Default seed of random points of a box.
+#define BOX_RNG_SEED 777
+
 #define BIT_LEN 64
 #define HIGHEST_BIT (1ull << BIT_LEN - 1)
 
 #include "mkl_vsl.h"
+#include "nlopt.h"
 
 
 typedef struct Box Box;
@@ -34,6 +38,29 @@ struct Box {
     VSLStreamStatePtr rng;  // Random generator. Allocated when it is needed.
 };
 
+/* Stack of boxes for subdivision processes. The storage is reused, so
+ * subdivision doesn't allocate memory for every box.
+ */
+typedef struct BoxStack BoxStack;
+
+struct BoxStack {
+    Box * boxes;
+    size_t len;
+    size_t capacity;
+};
+
+/* SLSQP optimizer constrained by a box. The optimizer is created at the first
+ * use and reused for other boxes and objectives: only bounds and objective are
+ * set for every task. The box constraints are bound to the struct, so it must
+ * not be moved after the first use.
+ */
+typedef struct BoxOptimizer BoxOptimizer;
+
+struct BoxOptimizer {
+    nlopt_opt opt;
+    const Box * box;        // Current box.
+};
+
 extern char enable_box_cache;
 
 // Initializes box structure.
@@ -54,7 +81,14 @@ void box_dispose(Box * box);
 // Copies content of src box to the dst box.
 void box_copy(Box * dst, const Box * src);
 
-// Generates random points inside the box.
+// Restarts the random points of the box with the seed.
+int box_seed_random_points(
+    Box * box,          // Box
+    unsigned int seed   // Seed of the random generator
+);
+
+// Generates random points inside the box. Unless the box is seeded, the
+// generator starts with BOX_RNG_SEED at the first call.
 int box_generate_random_points(
     Box * box,          // Box
     size_t npts,        // IN: the number of points to be generated
@@ -79,6 +113,19 @@ int box_split(
     double ratio        // Ratio of splitting along splitting direction. 0 < ratio < 1.
 );
 
+// Initializes stack of boxes. Returns BOX_SUCCESS | BOX_FAILURE
+int box_stack_init(BoxStack * stack, size_t capacity);
+
+// Frees memory allocated for the stack.
+void box_stack_dispose(BoxStack * stack);
+
+// Reserves n boxes on the top of the stack. Returns pointer to the first of them
+// or NULL, if there's no memory. The pointer is valid until next push.
+Box * box_stack_push(BoxStack * stack, size_t n);
+
+// Removes the top box from the stack and copies it to the box.
+void box_stack_pop(BoxStack * stack, Box * box);
+
 // Boundary conditions for surface test_box methods.
 void box_ieqcons(
     unsigned int m,     // The number of constraints - must be 6.
@@ -89,12 +136,35 @@ void box_ieqcons(
     void * f_data       // Box structure
 );
 
-// Checks if the box intersects with another one.
+// Initializes optimizer struct. The optimizer itself is created when it's needed.
+void box_optimizer_init(BoxOptimizer * optimizer);
+
+// Destroys the optimizer.
+void box_optimizer_dispose(BoxOptimizer * optimizer);
+
+/* Prepares the optimizer for optimization inside the box: sets bounds and
+ * constraints. The objective must be set by the caller.
+ * Returns NULL if the optimizer can't be created.
+ */
+nlopt_opt box_optimizer_setup(BoxOptimizer * optimizer, const Box * box);
+
+// Runs optimization starting from x. Counts optimizer runs.
+nlopt_result box_optimizer_run(BoxOptimizer * optimizer, double * x, double * opt_val);
+
+// Checks if the box intersects with another one. Returns 1 if they intersect, 0 otherwise.
 int box_check_intersection(
     const Box * box1,
     const Box * box2
 );
 
+// Checks if the box intersects with other boxes.
+void box_check_intersections(
+    const Box * box,            // Box to check.
+    size_t n,                   // The number of other boxes.
+    const Box * const * others, // Other boxes.
+    char * result               // OUT: 1 if the box intersects i-th other box, 0 otherwise.
+);
+
 /* Compares two boxes. Returns
  * +1 if in_box lies actually inside the out_box;
  *  0 if in_box equals out_box;
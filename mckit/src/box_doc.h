@@ -21,6 +21,10 @@
 "    Tests whether point lies inside the box." \
 "copy()" \
 "    Creates a new copy of the box." \
+"check_intersection(box)" \
+"    Checks if the box intersects with another one." \
+"check_intersections(boxes)" \
+"    Checks if the box intersects with other boxes." \
 "" \
 "Properties" \
 "----------" \
@@ -33,7 +37,22 @@
 "bounds" \
 "    Box's bounds - pairs of min and max values along every dimension."
 
-#define BOX_GRP_DOC "Generates n random points inside the box."
+#define BOX_GRP_DOC \
+"Generates n random points inside the box." \
+"" \
+"Parameters" \
+"----------" \
+"n : int" \
+"    The number of points." \
+"seed : int, optional" \
+"    If given, the random generator of the box is restarted with the seed." \
+"    Otherwise the points continue the previous calls, the first call" \
+"    starts with seed 777." \
+"" \
+"Returns" \
+"-------" \
+"points : numpy.ndarray[float]" \
+"    Points of shape (n, 3)."
 
 #define BOX_TEST_POINTS_DOC \
 "Checks if point(s) p lies inside the box." \
@@ -83,3 +102,16 @@
 "-------" \
 "result : bool" \
 "    Test result. True if boxes intersect."
+
+#define BOX_CHECK_INTERSECTIONS_DOC \
+"Checks if the box intersects with other boxes." \
+"" \
+"Parameters" \
+"----------" \
+"boxes : Sequence[Box]" \
+"    The boxes intersection must be checked with." \
+"" \
+"Returns" \
+"-------" \
+"result : numpy.ndarray[bool]" \
+"    Test results. True if the box intersects corresponding box."
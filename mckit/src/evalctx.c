@@ -0,0 +1,230 @@
+#include <stdlib.h>
+#include <time.h>
+#include "evalctx.h"
+
+#define EVALCTX_INITIAL_CAPACITY 64
+#define EVALCTX_STATS_CAPACITY 16
+#define EVALCTX_BOX_STACK_CAPACITY 128
+#define SCRATCH_BLOCK_SIZE 65536
+#define SCRATCH_ALIGN 16
+
+static size_t hash_pointer(const void * key, size_t mask)
+{
+    uint64_t h = (uint64_t) (uintptr_t) key;
+    h ^= h >> 33;
+    h *= 0xff51afd7ed558ccdull;
+    h ^= h >> 33;
+    return (size_t) h & mask;
+}
+
+static CacheEntry * find_slot(CacheEntry * entries, size_t capacity, uint64_t gen, const void * key)
+{
+    size_t mask = capacity - 1;
+    size_t i = hash_pointer(key, mask);
+    // Entries of the older generations are free slots.
+    while (entries[i].gen == gen && entries[i].key != key) i = (i + 1) & mask;
+    return entries + i;
+}
+
+static int grow(EvalContext * ctx)
+{
+    size_t capacity = 2 * ctx->capacity;
+    CacheEntry * entries = (CacheEntry *) calloc(capacity, sizeof(CacheEntry));
+    if (entries == NULL) return EVALCTX_NO_MEMORY;
+    for (size_t i = 0; i < ctx->capacity; ++i) {
+        CacheEntry * e = ctx->entries + i;
+        if (e->gen == ctx->gen) *find_slot(entries, capacity, ctx->gen, e->key) = *e;
+    }
+    free(ctx->entries);
+    ctx->entries = entries;
+    ctx->capacity = capacity;
+    return EVALCTX_SUCCESS;
+}
+
+// Initializes context.
+int evalctx_init(EvalContext * ctx)
+{
+    ctx->capacity = EVALCTX_INITIAL_CAPACITY;
+    ctx->count = 0;
+    ctx->gen = 1;
+    ctx->scratch = NULL;
+    ctx->spare = NULL;
+    box_optimizer_init(&ctx->optimizer);
+    evalctx_set_budget(ctx, 0, 0);
+    ctx->octree = NULL;
+    ctx->stats = NULL;
+    ctx->stats_capacity = 0;
+    ctx->stats_count = 0;
+    ctx->entries = (CacheEntry *) calloc(ctx->capacity, sizeof(CacheEntry));
+    if (box_stack_init(&ctx->boxes, EVALCTX_BOX_STACK_CAPACITY) != BOX_SUCCESS || ctx->entries == NULL)
+        return EVALCTX_NO_MEMORY;
+    return EVALCTX_SUCCESS;
+}
+
+// Frees memory allocated for the context.
+void evalctx_dispose(EvalContext * ctx)
+{
+    free(ctx->entries);
+    ctx->entries = NULL;
+    ctx->capacity = 0;
+    ctx->count = 0;
+    ScratchBlock * block;
+    while ((block = ctx->scratch) != NULL) {
+        ctx->scratch = block->prev;
+        free(block);
+    }
+    free(ctx->spare);
+    ctx->spare = NULL;
+    box_stack_dispose(&ctx->boxes);
+    box_optimizer_dispose(&ctx->optimizer);
+    for (size_t i = 0; i < ctx->stats_capacity; ++i) {
+        if (ctx->stats[i].key != NULL) statset_dispose(&ctx->stats[i].set);
+    }
+    free(ctx->stats);
+    ctx->stats = NULL;
+    ctx->stats_capacity = 0;
+    ctx->stats_count = 0;
+}
+
+// Drops all cached results.
+void evalctx_reset(EvalContext * ctx)
+{
+    if (ctx == NULL) return;
+    ++ctx->gen;
+    ctx->count = 0;
+}
+
+CacheEntry * evalctx_lookup(const EvalContext * ctx, const void * key)
+{
+    if (ctx == NULL) return NULL;
+    CacheEntry * e = find_slot(ctx->entries, ctx->capacity, ctx->gen, key);
+    return (e->gen == ctx->gen) ? e : NULL;
+}
+
+int evalctx_store(EvalContext * ctx, const void * key, uint64_t subdiv, int result)
+{
+    if (ctx == NULL) return EVALCTX_SUCCESS;
+    // Keep load factor below 1/2.
+    if (2 * (ctx->count + 1) > ctx->capacity && grow(ctx) != EVALCTX_SUCCESS)
+        return EVALCTX_NO_MEMORY;
+    CacheEntry * e = find_slot(ctx->entries, ctx->capacity, ctx->gen, key);
+    if (e->gen != ctx->gen) {
+        e->key = key;
+        e->gen = ctx->gen;
+        ++ctx->count;
+    }
+    e->subdiv = subdiv;
+    e->result = result;
+    return EVALCTX_SUCCESS;
+}
+
+static StatEntry * find_stats_slot(StatEntry * stats, size_t capacity, const void * key)
+{
+    size_t mask = capacity - 1;
+    size_t i = hash_pointer(key, mask);
+    while (stats[i].key != NULL && stats[i].key != key) i = (i + 1) & mask;
+    return stats + i;
+}
+
+static int grow_stats(EvalContext * ctx)
+{
+    size_t capacity = ctx->stats_capacity ? 2 * ctx->stats_capacity : EVALCTX_STATS_CAPACITY;
+    StatEntry * stats = (StatEntry *) calloc(capacity, sizeof(StatEntry));
+    if (stats == NULL) return EVALCTX_NO_MEMORY;
+    for (size_t i = 0; i < ctx->stats_capacity; ++i) {
+        StatEntry * e = ctx->stats + i;
+        if (e->key != NULL) *find_stats_slot(stats, capacity, e->key) = *e;
+    }
+    free(ctx->stats);
+    ctx->stats = stats;
+    ctx->stats_capacity = capacity;
+    return EVALCTX_SUCCESS;
+}
+
+StatSet * evalctx_stats(EvalContext * ctx, const void * key, size_t ncols)
+{
+    // Keep load factor below 1/2.
+    if (2 * (ctx->stats_count + 1) > ctx->stats_capacity && grow_stats(ctx) != EVALCTX_SUCCESS)
+        return NULL;
+    StatEntry * e = find_stats_slot(ctx->stats, ctx->stats_capacity, key);
+    if (e->key == NULL) {
+        e->key = key;
+        statset_init(&e->set, ncols);
+        ++ctx->stats_count;
+    }
+    return &e->set;
+}
+
+const StatSet * evalctx_find_stats(const EvalContext * ctx, const void * key)
+{
+    if (ctx == NULL || ctx->stats_count == 0) return NULL;
+    StatEntry * e = find_stats_slot(ctx->stats, ctx->stats_capacity, key);
+    return (e->key != NULL) ? &e->set : NULL;
+}
+
+void * evalctx_alloc(EvalContext * ctx, size_t size)
+{
+    size = (size + SCRATCH_ALIGN - 1) / SCRATCH_ALIGN * SCRATCH_ALIGN;
+    ScratchBlock * block = ctx->scratch;
+    if (block == NULL || block->used + size > block->capacity) {
+        if (ctx->spare != NULL && ctx->spare->capacity >= size) {
+            block = ctx->spare;
+            ctx->spare = NULL;
+        } else {
+            size_t capacity = (size > SCRATCH_BLOCK_SIZE) ? size : SCRATCH_BLOCK_SIZE;
+            block = (ScratchBlock *) malloc(sizeof(ScratchBlock) + capacity);
+            if (block == NULL) return NULL;
+            block->capacity = capacity;
+        }
+        block->used = 0;
+        block->prev = ctx->scratch;
+        ctx->scratch = block;
+    }
+    void * ptr = block->data + block->used;
+    block->used += size;
+    return ptr;
+}
+
+void evalctx_free(EvalContext * ctx, void * ptr)
+{
+    ScratchBlock * block;
+    while ((block = ctx->scratch) != NULL) {
+        char * p = (char *) ptr;
+        if (p >= block->data && p < block->data + block->capacity) {
+            block->used = p - block->data;
+            return;
+        }
+        // The whole block is released. One block is kept for reuse.
+        ctx->scratch = block->prev;
+        if (ctx->spare == NULL) ctx->spare = block;
+        else free(block);
+    }
+}
+
+void evalctx_set_budget(EvalContext * ctx, size_t max_boxes, double seconds)
+{
+    ctx->max_boxes = max_boxes;
+    ctx->deadline = (seconds > 0) ? evalctx_clock() + seconds : 0;
+    ctx->spent = 0;
+    ctx->exhausted = 0;
+}
+
+int evalctx_spend(EvalContext * ctx, size_t n)
+{
+    if (ctx == NULL) return 0;
+    size_t before = ctx->spent;
+    ctx->spent += n;
+    if (ctx->max_boxes > 0 && ctx->spent > ctx->max_boxes) ctx->exhausted = 1;
+    // The clock is checked once per EVALCTX_CLOCK_PERIOD boxes.
+    if (ctx->deadline > 0 && before / EVALCTX_CLOCK_PERIOD != ctx->spent / EVALCTX_CLOCK_PERIOD
+            && evalctx_clock() > ctx->deadline)
+        ctx->exhausted = 1;
+    return ctx->exhausted;
+}
+
+double evalctx_clock(void)
+{
+    struct timespec ts;
+    timespec_get(&ts, TIME_UTC);
+    return ts.tv_sec + 1e-9 * ts.tv_nsec;
+}
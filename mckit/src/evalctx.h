@@ -0,0 +1,132 @@
+#ifndef __EVALCTX_H
+#define __EVALCTX_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include "box.h"
+#include "statset.h"
+
+#define EVALCTX_SUCCESS    0
+#define EVALCTX_NO_MEMORY -1
+
+// The number of boxes between checks of the clock.
+#define EVALCTX_CLOCK_PERIOD 256
+
+typedef struct EvalContext EvalContext;
+typedef struct CacheEntry  CacheEntry;
+typedef struct ScratchBlock ScratchBlock;
+typedef struct StatEntry StatEntry;
+typedef struct Octree Octree;
+
+// Cached result of box test for a surface or a shape.
+struct CacheEntry {
+    const void * key;       // Surface or Shape the result belongs to.
+    uint64_t gen;           // Generation of the context, when the entry was stored.
+    uint64_t subdiv;        // Subdivision code of the tested box.
+    int result;             // Result of test_box.
+};
+
+// Statistics of a shape collected in the context.
+struct StatEntry {
+    const void * key;       // Shape the statistics belongs to. NULL - free slot.
+    StatSet set;            // Distinct rows of argument results.
+};
+
+// Block of scratch memory.
+struct ScratchBlock {
+    ScratchBlock * prev;    // Previous block in the stack.
+    size_t capacity;
+    size_t used;
+    char data[];
+};
+
+/* Evaluation context. Holds results of box tests for the surfaces and shapes
+ * involved in a single computation (volume, bounding box, etc). The context is
+ * created by the caller, so different threads can use the same shapes and
+ * surfaces simultaneously, each with its own context.
+ *
+ * The cache is an open addressing hash table keyed by object pointers. Entries of
+ * older generations are treated as free slots, so the reset is O(1).
+ *
+ * The context also owns the memory reused by evaluation: scratch memory for per node
+ * result arrays, allocated and released in LIFO order, the stack of boxes for
+ * subdivision processes and the optimizer for surface box tests.
+ *
+ * Results of box tests of a shape can be kept between computations in its
+ * octree, which is attached to the context.
+ *
+ * Statistics of box tests is collected in the context too, so the shapes are not
+ * modified by the computation. The caller stores it in the shapes afterwards.
+ *
+ * The computation can be limited by the number of tested boxes and by wall
+ * clock time. The budget is checked by the subdivision process, which stops
+ * as soon as the budget is exhausted.
+ */
+struct EvalContext {
+    CacheEntry * entries;
+    size_t capacity;        // Always power of 2.
+    size_t count;           // The number of entries of the current generation.
+    uint64_t gen;           // Current generation.
+    ScratchBlock * scratch; // Current block of scratch memory.
+    ScratchBlock * spare;   // Released block kept for reuse.
+    BoxStack boxes;         // Stack of boxes.
+    BoxOptimizer optimizer; // Optimizer for box tests.
+    size_t max_boxes;       // The number of boxes to be tested. 0 - no limit.
+    double deadline;        // Wall clock time (see evalctx_clock), when to stop. 0 - no limit.
+    size_t spent;           // The number of boxes tested.
+    char exhausted;         // The budget is exhausted.
+    Octree * octree;        // Persistent cache of box tests of a shape (see octree.h). NULL - none.
+    StatEntry * stats;      // Hash table of statistics keyed by shape pointers.
+    size_t stats_capacity;  // Always power of 2, 0 - the table is not allocated yet.
+    size_t stats_count;     // The number of shapes with statistics.
+};
+
+// Initializes context.
+int evalctx_init(EvalContext * ctx);
+
+// Frees memory allocated for the context.
+void evalctx_dispose(EvalContext * ctx);
+
+// Drops all cached results. Does nothing, if ctx is NULL.
+void evalctx_reset(EvalContext * ctx);
+
+/* Gets cached entry for the object. Returns NULL if there's no entry or ctx is NULL.
+ */
+CacheEntry * evalctx_lookup(const EvalContext * ctx, const void * key);
+
+/* Stores result of box test for the object. If ctx is NULL, nothing is done.
+ * Returns EVALCTX_SUCCESS | EVALCTX_NO_MEMORY
+ */
+int evalctx_store(EvalContext * ctx, const void * key, uint64_t subdiv, int result);
+
+/* Gets statistics collected for the object. If there's none, an empty set of
+ * rows of ncols values is created. Returns NULL if there's no memory.
+ */
+StatSet * evalctx_stats(EvalContext * ctx, const void * key, size_t ncols);
+
+/* Gets statistics collected for the object. Returns NULL if there's none.
+ */
+const StatSet * evalctx_find_stats(const EvalContext * ctx, const void * key);
+
+/* Allocates scratch memory. Allocations must be released in reverse order.
+ * Returns NULL if there's no memory.
+ */
+void * evalctx_alloc(EvalContext * ctx, size_t size);
+
+/* Releases scratch memory ptr and all the scratch memory allocated after it.
+ */
+void evalctx_free(EvalContext * ctx, void * ptr);
+
+/* Sets budget of the computation. max_boxes is the number of boxes to be tested,
+ * seconds - wall clock time from now. 0 means no limit.
+ */
+void evalctx_set_budget(EvalContext * ctx, size_t max_boxes, double seconds);
+
+/* Accounts n tested boxes. Returns nonzero if the budget is exhausted.
+ */
+int evalctx_spend(EvalContext * ctx, size_t n);
+
+// Gets wall clock time in seconds.
+double evalctx_clock(void);
+
+#endif
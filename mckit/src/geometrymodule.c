@@ -1,5 +1,6 @@
 #include <Python.h>
 #include <structmember.h>
+#include <pythread.h>
 #include <string.h>
 
 #include "numpy/arrayobject.h"
@@ -7,6 +8,7 @@
 #include "box.h"
 #include "surface.h"
 #include "shape.h"
+#include "kstat.h"
 
 #include "box_doc.h"
 #include "surf_doc.h"
@@ -40,8 +42,7 @@ convert_to_dbl_vec_array(PyObject * obj, PyObject ** addr)
         PyErr_SetString(PyExc_ValueError, "Vector or matrix are expected");
         goto error;
     }
-    npy_intp size, last_dim;
-    size = PyArray_SIZE(arr);
+    npy_intp last_dim;
     last_dim = PyArray_DIM(arr, n - 1);
     if (last_dim != NDIM) {
         PyErr_SetString(PyExc_ValueError, "Shape (n, 3) is expected");
@@ -71,6 +72,24 @@ static PyObject * module_dict;
 #define GLOBAL_BOX "GLOBAL_BOX"
 #define MIN_VOLUME_NAME "MIN_VOLUME"
 
+// ========================================================================================== //
+// =============================== GIL handling ============================================= //
+// ========================================================================================== //
+
+// Box tests cache their results in the evaluation context created for every call,
+// so the kernels run without the GIL and the same shapes can be used by many threads.
+#define KERNEL_BEGIN(ctx) \
+    EvalContext ctx; \
+    if (evalctx_init(&ctx) != EVALCTX_SUCCESS) { \
+        evalctx_dispose(&ctx); \
+        return PyErr_NoMemory(); \
+    } \
+    Py_BEGIN_ALLOW_THREADS
+
+#define KERNEL_END(ctx) \
+    Py_END_ALLOW_THREADS \
+    evalctx_dispose(&ctx);
+
 // ========================================================================================== //
 // ===============================  Box wrappers ============================================ //
 // ========================================================================================== //
@@ -83,10 +102,11 @@ typedef struct {
 static void       boxobj_dealloc(BoxObject * self);
 static int        boxobj_init(BoxObject * self, PyObject * args, PyObject * kwds);
 static PyObject * boxobj_copy(BoxObject * self);
-static PyObject * boxobj_generate_random_points(BoxObject * self, PyObject * npts);
+static PyObject * boxobj_generate_random_points(BoxObject * self, PyObject * args, PyObject * kwds);
 static PyObject * boxobj_test_points(BoxObject * self, PyObject * points);
 static PyObject * boxobj_split(BoxObject * self, PyObject * args, PyObject * kwds);
 static PyObject * boxobj_check_intersection(BoxObject * self, PyObject * box);
+static PyObject * boxobj_check_intersections(BoxObject * self, PyObject * boxes);
 static PyObject * boxobj_getcorners(BoxObject * self, void * closure);
 static PyObject * boxobj_getvolume(BoxObject * self, void * closure);
 static PyObject * boxobj_getbounds(BoxObject * self, void * closure);
@@ -111,10 +131,11 @@ static PyGetSetDef boxobj_getsetters[] = {
 
 static PyMethodDef boxobj_methods[] = {
         {"copy", (PyCFunction) boxobj_copy, METH_NOARGS, BOX_COPY_DOC},
-        {"generate_random_points", (PyCFunction) boxobj_generate_random_points, METH_O, BOX_GRP_DOC},
+        {"generate_random_points", (PyCFunction) boxobj_generate_random_points, METH_VARARGS | METH_KEYWORDS, BOX_GRP_DOC},
         {"test_points", (PyCFunction) boxobj_test_points, METH_O, BOX_TEST_POINTS_DOC},
         {"split", (PyCFunctionWithKeywords) boxobj_split, METH_VARARGS | METH_KEYWORDS, BOX_SPLIT_DOC},
         {"check_intersection", (PyCFunction) boxobj_check_intersection, METH_O, BOX_CHECK_INTERSECTION_DOC},
+        {"check_intersections", (PyCFunction) boxobj_check_intersections, METH_O, BOX_CHECK_INTERSECTIONS_DOC},
         {NULL}
 };
 
@@ -186,13 +207,26 @@ boxobj_copy(BoxObject * self)
 }
 
 static PyObject *
-boxobj_generate_random_points(BoxObject * self, PyObject * npts)
+boxobj_generate_random_points(BoxObject * self, PyObject * args, PyObject * kwds)
 {
-    if (! PyLong_CheckExact(npts)) {
+    PyObject * npts, * seed = Py_None;
+    static char * kwlist[] = {"n", "seed", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "O|O", kwlist, &npts, &seed)) return NULL;
+
+    if (! PyLong_CheckExact(npts) || (seed != Py_None && ! PyLong_CheckExact(seed))) {
         PyErr_SetString(PyExc_ValueError, "Integer value is expected");
         return NULL;
     }
     size_t n = PyLong_AsLong(npts);
+    if (seed != Py_None) {
+        unsigned long value = PyLong_AsUnsignedLongMask(seed);
+        if (value == (unsigned long) -1 && PyErr_Occurred()) return NULL;
+        if (box_seed_random_points(&self->box, (unsigned int) value) != BOX_SUCCESS) {
+            PyErr_SetString(PyExc_MemoryError, "Could not generate points.");
+            return NULL;
+        }
+    }
 
     npy_intp dims[] = {n, NDIM};
     PyObject * points = PyArray_EMPTY(2, dims, NPY_DOUBLE, 0);
@@ -223,8 +257,10 @@ boxobj_test_points(BoxObject * self, PyObject * points)
         return NULL;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     box_test_points(&self->box, npts, (double *) PyArray_DATA(pts), \
                    (int *) PyArray_DATA(result));
+    Py_END_ALLOW_THREADS
     Py_DECREF(pts);
     return result;
 }
@@ -242,6 +278,39 @@ boxobj_check_intersection(BoxObject * self, PyObject * box)
     return PyBool_FromLong(result);
 }
 
+static PyObject *
+boxobj_check_intersections(BoxObject * self, PyObject * boxes)
+{
+    PyObject * seq = PySequence_Fast(boxes, "Sequence of Box instances is expected");
+    if (seq == NULL) return NULL;
+
+    Py_ssize_t i, n = PySequence_Fast_GET_SIZE(seq);
+    PyObject ** items = PySequence_Fast_ITEMS(seq);
+    const Box ** others = (const Box **) PyMem_Malloc((n > 0 ? n : 1) * sizeof(Box *));
+    if (others == NULL) {
+        Py_DECREF(seq);
+        return PyErr_NoMemory();
+    }
+    for (i = 0; i < n; ++i) {
+        if (! PyObject_TypeCheck(items[i], &BoxType)) {
+            PyMem_Free(others);
+            Py_DECREF(seq);
+            PyErr_SetString(PyExc_ValueError, "Box instance is expected");
+            return NULL;
+        }
+        others[i] = &((BoxObject *) items[i])->box;
+    }
+
+    npy_intp dims[] = {n};
+    PyObject * result = PyArray_EMPTY(1, dims, NPY_BOOL, 0);
+    if (result != NULL) {
+        box_check_intersections(&self->box, n, others, (char *) PyArray_DATA((PyArrayObject *) result));
+    }
+    PyMem_Free(others);
+    Py_DECREF(seq);
+    return result;
+}
+
 static PyObject *
 boxobj_split(BoxObject * self, PyObject * args, PyObject * kwds)
 {
@@ -437,8 +506,10 @@ surfobj_test_points(SurfaceObject * self, PyObject * points)
         return NULL;
     }
 
+    Py_BEGIN_ALLOW_THREADS
     surface_test_points(&self->surf, npts, (double *) PyArray_DATA(pts), \
                                            (char *) PyArray_DATA(result));
+    Py_END_ALLOW_THREADS
     Py_DECREF(pts);
     return result;
 }
@@ -451,8 +522,10 @@ surfobj_test_box(SurfaceObject * self, PyObject * box)
         return NULL;
     }
 
-    self->surf.last_box = 0;
-    int result = surface_test_box(&self->surf, &((BoxObject *) box)->box);
+    int result;
+    KERNEL_BEGIN(ctx)
+    result = surface_test_box(&self->surf, &((BoxObject *) box)->box, &ctx);
+    KERNEL_END(ctx)
 
     return Py_BuildValue("i", result);
 }
@@ -525,8 +598,7 @@ torusobj_init(TorusObject * self, PyObject * args, PyObject * kwds)
     double r, a, b;
     if (! PyArg_ParseTuple(args, "O&O&ddd", convert_to_dbl_vec, &center, convert_to_dbl_vec, &axis, &r, &a, &b)) return -1;
 
-    int status = torus_init(&self->surf,
-                            (double *) PyArray_DATA(center), (double *) PyArray_DATA(axis), r, a, b);
+    torus_init(&self->surf, (double *) PyArray_DATA(center), (double *) PyArray_DATA(axis), r, a, b);
     Py_DECREF(center);
     Py_DECREF(axis);
     return 0;
@@ -981,16 +1053,52 @@ static PyTypeObject GQuadraticType = {
 typedef struct {
     PyObject ob_base;
     Shape shape;
+    PyThread_type_lock stat_lock;   // Guards statistics of the shape.
+    PyThread_type_lock octree_lock; // Guards octree of the shape.
 } ShapeObject;
 
+// Computations with the octree of a shape modify it, so they are serialized by the
+// lock of the shape. Only the octree of the shape tested is used, so computations
+// with different shapes run simultaneously. The octree is taken with the GIL held,
+// and it is attached to the context only if the shape still has an octree, when
+// the lock is acquired.
+#define OCTREE_BEGIN(ctx, tree, obj, box) \
+    if ((tree) != NULL) { \
+        PyThread_acquire_lock((obj)->octree_lock, WAIT_LOCK); \
+        octree_attach(&ctx, (obj)->shape.octree, box); \
+        if (ctx.octree == NULL) PyThread_release_lock((obj)->octree_lock); \
+    }
+
+#define OCTREE_END(ctx, obj) if (ctx.octree != NULL) PyThread_release_lock((obj)->octree_lock);
+
+// Statistics is collected in the evaluation context, and then it is stored in the
+// shape and its arguments. Every shape is locked only while its own statistics is
+// stored, so different shapes are processed by many threads simultaneously.
+// It is called without the GIL.
+static void
+store_statistics(Shape * shape, const EvalContext * ctx, char replace)
+{
+    ShapeObject * obj = (ShapeObject *) parent_pyobject(ShapeObject, shape, shape);
+    PyThread_acquire_lock(obj->stat_lock, WAIT_LOCK);
+    shape_store_statistics(shape, ctx, replace);
+    PyThread_release_lock(obj->stat_lock);
+    if (shape->opc == UNION || shape->opc == INTERSECTION) {
+        for (size_t i = 0; i < shape->alen; ++i) store_statistics(shape->args.shapes[i], ctx, replace);
+    }
+}
+
 static int        shapeobj_init(ShapeObject * self, PyObject * args, PyObject * kwds);
 static PyObject * shapeobj_test_box(ShapeObject * self, PyObject * args, PyObject * kwds);
+static PyObject * shapeobj_test_boxes(ShapeObject * self, PyObject * args, PyObject * kwds);
 static PyObject * shapeobj_ultimate_test_box(ShapeObject * self, PyObject * args, PyObject * kwds);
-static PyObject * shapeobj_test_points(ShapeObject * self, PyObject * points);
+static PyObject * shapeobj_test_points(ShapeObject * self, PyObject * args, PyObject * kwds);
 static PyObject * shapeobj_bounding_box(ShapeObject * self, PyObject * args, PyObject * kwds);
 static PyObject * shapeobj_volume(ShapeObject * self, PyObject * args, PyObject * kwds);
-static PyObject * shapeobj_collect_statistics(ShapeObject * self, PyObject * args);
+static PyObject * shapeobj_volume_mc(ShapeObject * self, PyObject * args, PyObject * kwds);
+static PyObject * shapeobj_collect_statistics(ShapeObject * self, PyObject * args, PyObject * kwds);
 static PyObject * shapeobj_get_stat_table(ShapeObject * self);
+static PyObject * shapeobj_enable_octree(ShapeObject * self, PyObject * args, PyObject * kwds);
+static PyObject * shapeobj_disable_octree(ShapeObject * self);
 static void       shapeobj_dealloc(ShapeObject * self);
 
 static char * opcodes[] = {"I", "C", "E", "U", "S", "R"};
@@ -1018,7 +1126,7 @@ shapeobj_getargs(ShapeObject * self, void * closure)
         Py_INCREF(pysurf);
     } else if (self->shape.opc == UNION || self->shape.opc == INTERSECTION) {
         PyObject * pyshape;
-        for (int i = 0; i < self->shape.alen; ++i) {
+        for (size_t i = 0; i < self->shape.alen; ++i) {
             pyshape = parent_pyobject(ShapeObject, shape, self->shape.args.shapes[i]);
             PyTuple_SET_ITEM(args, i, pyshape);
             Py_INCREF(pyshape);
@@ -1027,22 +1135,33 @@ shapeobj_getargs(ShapeObject * self, void * closure)
     return args;
 }
 
+static PyObject *
+shapeobj_get_octree_size(ShapeObject * self, void * closure)
+{
+    return PyLong_FromSize_t(self->shape.octree != NULL ? self->shape.octree->len : 0);
+}
+
 static PyGetSetDef shapeobj_getset[] = {
     {"opc", (getter) shapeobj_getopc, NULL, "Operation code of shape.", NULL},
     {"invert_opc", (getter) shapeobj_getinvopc, NULL, "Inverted operation code of shape.", NULL},
     {"args", (getter) shapeobj_getargs, NULL, "Arguments of shape.", NULL},
+    {"octree_size", (getter) shapeobj_get_octree_size, NULL, "The number of boxes in the octree of the shape.", NULL},
     {NULL}
 };
 
 
 static PyMethodDef shapeobj_methods[] = {
         {"test_box", (PyCFunctionWithKeywords) shapeobj_test_box, METH_VARARGS | METH_KEYWORDS, "Tests where the box is located with respect to the surface."},
+        {"test_boxes", (PyCFunctionWithKeywords) shapeobj_test_boxes, METH_VARARGS | METH_KEYWORDS, "Tests where the boxes are located with respect to the shape."},
         {"ultimate_test_box", (PyCFunctionWithKeywords) shapeobj_ultimate_test_box, METH_VARARGS | METH_KEYWORDS, ""},
         {"volume", (PyCFunctionWithKeywords) shapeobj_volume, METH_VARARGS | METH_KEYWORDS, ""},
+        {"volume_mc", (PyCFunctionWithKeywords) shapeobj_volume_mc, METH_VARARGS | METH_KEYWORDS, ""},
         {"bounding_box", (PyCFunctionWithKeywords) shapeobj_bounding_box, METH_VARARGS | METH_KEYWORDS, ""},
-        {"collect_statistics", (PyCFunction) shapeobj_collect_statistics, METH_VARARGS, ""},
+        {"collect_statistics", (PyCFunctionWithKeywords) shapeobj_collect_statistics, METH_VARARGS | METH_KEYWORDS, "Collects statistics of argument results. Boxes can be refined progressively, see coarse_volume and refine. Returns False, if the budget is exhausted."},
         {"get_stat_table", (PyCFunction) shapeobj_get_stat_table, METH_NOARGS, ""},
-        {"test_points", (PyCFunction) shapeobj_test_points, METH_O, "Tests senses of the points with respect to the surface."},
+        {"enable_octree", (PyCFunctionWithKeywords) shapeobj_enable_octree, METH_VARARGS | METH_KEYWORDS, "Keeps results of box tests for computations starting from the box: volume, bounding_box, test_box, ultimate_test_box and collect_statistics. Points are located in the octree before surfaces are tested."},
+        {"disable_octree", (PyCFunction) shapeobj_disable_octree, METH_NOARGS, "Drops the octree of the shape."},
+        {"test_points", (PyCFunctionWithKeywords) shapeobj_test_points, METH_VARARGS | METH_KEYWORDS, "Tests senses of the points with respect to the shape."},
         {NULL}
 };
 
@@ -1087,6 +1206,15 @@ shapeobj_init(ShapeObject * self, PyObject * args, PyObject * kwds)
         return -1;
     }
 
+    if (self->stat_lock == NULL && (self->stat_lock = PyThread_allocate_lock()) == NULL) {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate statistics lock.");
+        return -1;
+    }
+    if (self->octree_lock == NULL && (self->octree_lock = PyThread_allocate_lock()) == NULL) {
+        PyErr_SetString(PyExc_MemoryError, "Could not allocate octree lock.");
+        return -1;
+    }
+
     int status;
     if (opc == IDENTITY || opc == COMPLEMENT) {
         PyObject * surf = PyTuple_GetItem(args, 1);
@@ -1131,12 +1259,14 @@ static void shapeobj_dealloc(ShapeObject * self)
         Py_DECREF(pysurf);
     } else if (self->shape.opc == UNION || self->shape.opc == INTERSECTION) {
         PyObject * pyshape;
-        for (int i = 0; i < self->shape.alen; ++i) {
+        for (size_t i = 0; i < self->shape.alen; ++i) {
             pyshape = parent_pyobject(ShapeObject, shape, self->shape.args.shapes[i]);
             Py_DECREF(pyshape);
         }
     }
     shape_dealloc(&self->shape);
+    if (self->stat_lock != NULL) PyThread_free_lock(self->stat_lock);
+    if (self->octree_lock != NULL) PyThread_free_lock(self->octree_lock);
     Py_TYPE(self)->tp_free((PyObject*) self);
 }
 
@@ -1144,7 +1274,6 @@ static PyObject *
 shapeobj_test_box(ShapeObject * self, PyObject * args, PyObject * kwds)
 {
     PyObject * box = NULL;
-    char collect = 0;
     static char * kwlist[] = {"box", NULL};
 
     if (! PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist, &box)) return NULL;
@@ -1156,11 +1285,85 @@ shapeobj_test_box(ShapeObject * self, PyObject * args, PyObject * kwds)
         return NULL;
     }
 
-    shape_reset_cache(&self->shape);
-    int result = shape_test_box(&self->shape, &((BoxObject *) box)->box, 0, NULL);
+    int result;
+    Octree * tree = self->shape.octree;
+    KERNEL_BEGIN(ctx)
+    OCTREE_BEGIN(ctx, tree, self, &((BoxObject *) box)->box)
+    result = shape_test_box(&self->shape, &((BoxObject *) box)->box, 0, NULL, &ctx);
+    OCTREE_END(ctx, self)
+    KERNEL_END(ctx)
     return Py_BuildValue("i", result);
 }
 
+static PyObject *
+shapeobj_test_boxes(ShapeObject * self, PyObject * args, PyObject * kwds)
+{
+    PyObject * centers_obj, * dims_obj, * basis_obj = Py_None;
+    PyObject * centers = NULL, * dims = NULL, * result = NULL;
+    int threads = 0;
+    double basis[NDIM * NDIM];
+
+    static char * kwlist[] = {"centers", "dims", "basis", "threads", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "OO|Oi", kwlist, &centers_obj, &dims_obj,
+                                      &basis_obj, &threads)) return NULL;
+
+    if (! convert_to_dbl_vec_array(centers_obj, &centers)) return NULL;
+    if (! convert_to_dbl_vec_array(dims_obj, &dims)) goto error;
+
+    size_t nbox = PyArray_SIZE((PyArrayObject *) centers) / NDIM;
+    size_t ndims = PyArray_SIZE((PyArrayObject *) dims) / NDIM;
+    size_t dims_stride;
+    if (ndims == nbox && PyArray_NDIM((PyArrayObject *) dims) == PyArray_NDIM((PyArrayObject *) centers))
+        dims_stride = NDIM;
+    else if (ndims == 1) dims_stride = 0;
+    else {
+        PyErr_SetString(PyExc_ValueError, "dims must have shape (3,) or the same shape as centers");
+        goto error;
+    }
+
+    if (basis_obj == Py_None) {
+        memcpy(basis, PyArray_DATA((PyArrayObject *) GET_NAME(EX)), NDIM * sizeof(double));
+        memcpy(basis + NDIM, PyArray_DATA((PyArrayObject *) GET_NAME(EY)), NDIM * sizeof(double));
+        memcpy(basis + 2 * NDIM, PyArray_DATA((PyArrayObject *) GET_NAME(EZ)), NDIM * sizeof(double));
+    } else {
+        PyObject * b = PyArray_FROM_OTF(basis_obj, NPY_DOUBLE, NPY_ARRAY_IN_ARRAY);
+        if (b == NULL) goto error;
+        if (PyArray_NDIM((PyArrayObject *) b) != 2 || PyArray_DIM((PyArrayObject *) b, 0) != NDIM ||
+            PyArray_DIM((PyArrayObject *) b, 1) != NDIM) {
+            Py_DECREF(b);
+            PyErr_SetString(PyExc_ValueError, "basis must have shape (3, 3)");
+            goto error;
+        }
+        memcpy(basis, PyArray_DATA((PyArrayObject *) b), NDIM * NDIM * sizeof(double));
+        Py_DECREF(b);
+    }
+
+    npy_intp rdims[] = {nbox};
+    result = PyArray_EMPTY(1, rdims, NPY_INT8, 0);
+    if (result == NULL) goto error;
+
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = shape_test_boxes(&self->shape, nbox, (double *) PyArray_DATA((PyArrayObject *) centers),
+                              (double *) PyArray_DATA((PyArrayObject *) dims), dims_stride, basis,
+                              threads, (char *) PyArray_DATA((PyArrayObject *) result));
+    Py_END_ALLOW_THREADS
+
+    Py_DECREF(centers);
+    Py_DECREF(dims);
+    if (status == SHAPE_NO_MEMORY) {
+        Py_DECREF(result);
+        return PyErr_NoMemory();
+    }
+    return result;
+
+    error:
+    Py_XDECREF(centers);
+    Py_XDECREF(dims);
+    return NULL;
+}
+
 static PyObject *
 shapeobj_ultimate_test_box(ShapeObject * self, PyObject * args, PyObject * kwds)
 {
@@ -1179,29 +1382,68 @@ shapeobj_ultimate_test_box(ShapeObject * self, PyObject * args, PyObject * kwds)
         return NULL;
     }
 
-    shape_reset_cache(&self->shape);
-    int result = shape_ultimate_test_box(&self->shape, &((BoxObject *) box)->box, min_vol, collect);
+    int result;
+    Octree * tree = self->shape.octree;
+    KERNEL_BEGIN(ctx)
+    OCTREE_BEGIN(ctx, tree, self, &((BoxObject *) box)->box)
+    result = shape_ultimate_test_box(&self->shape, &((BoxObject *) box)->box, min_vol, collect, &ctx);
+    OCTREE_END(ctx, self)
+    if (collect) store_statistics(&self->shape, &ctx, 0);
+    KERNEL_END(ctx)
     return Py_BuildValue("i", result);
 }
 
 static PyObject *
-shapeobj_test_points(ShapeObject * self, PyObject * points)
+shapeobj_test_points(ShapeObject * self, PyObject * args, PyObject * kwds)
 {
-    PyObject * pts;
+    PyObject * points, * out = Py_None, * pts;
+    static char * kwlist[] = {"points", "out", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "O|O", kwlist, &points, &out)) return NULL;
     if (! convert_to_dbl_vec_array(points, &pts)) return NULL;
 
     npy_intp size = PyArray_SIZE((PyArrayObject *) pts);
     size_t npts = size > NDIM ? PyArray_DIM((PyArrayObject *) pts, 0) : 1;
-    npy_intp dims[] = {npts};
-    PyObject * result = PyArray_EMPTY(1, dims, NPY_BYTE, 0);
-    if (result == NULL) {
-        Py_DECREF(pts);
-        return NULL;
+    PyObject * result;
+    if (out == Py_None) {
+        npy_intp dims[] = {npts};
+        result = PyArray_EMPTY(1, dims, NPY_BYTE, 0);
+        if (result == NULL) {
+            Py_DECREF(pts);
+            return NULL;
+        }
+    } else {
+        // Results are written directly to the caller's buffer.
+        if (! PyArray_Check(out) || PyArray_TYPE((PyArrayObject *) out) != NPY_INT8 ||
+            ! PyArray_IS_C_CONTIGUOUS((PyArrayObject *) out) || ! PyArray_ISWRITEABLE((PyArrayObject *) out) ||
+            (size_t) PyArray_SIZE((PyArrayObject *) out) != npts) {
+            Py_DECREF(pts);
+            PyErr_SetString(PyExc_ValueError, "out must be writeable contiguous int8 array of length equal to the number of points");
+            return NULL;
+        }
+        result = out;
+        Py_INCREF(result);
     }
 
-    shape_test_points(&self->shape, npts, (double *) PyArray_DATA(pts), \
-                                          (char *) PyArray_DATA(result));
+    int status;
+    Octree * tree = self->shape.octree;
+    Py_BEGIN_ALLOW_THREADS
+    if (tree != NULL) {
+        // The octree is not modified, but it must not be dropped meanwhile.
+        PyThread_acquire_lock(self->octree_lock, WAIT_LOCK);
+        status = shape_locate_points(&self->shape, self->shape.octree, npts,
+                                     (double *) PyArray_DATA(pts), (char *) PyArray_DATA(result));
+        PyThread_release_lock(self->octree_lock);
+    } else {
+        status = shape_test_points(&self->shape, npts, (double *) PyArray_DATA(pts), \
+                                                       (char *) PyArray_DATA(result));
+    }
+    Py_END_ALLOW_THREADS
     Py_DECREF(pts);
+    if (status == SHAPE_NO_MEMORY) {
+        Py_DECREF(result);
+        return PyErr_NoMemory();
+    }
     return result;
 }
 
@@ -1225,8 +1467,15 @@ shapeobj_bounding_box(ShapeObject * self, PyObject * args, PyObject * kwds)
     BoxObject * box = (BoxObject *) boxobj_copy((BoxObject *) start_box);
     if (box == NULL) return NULL;
 
-    shape_reset_cache(&self->shape);
-    int status = shape_bounding_box(&self->shape, &box->box, tol);
+    int status;
+    Octree * tree = self->shape.octree;
+    KERNEL_BEGIN(ctx)
+    OCTREE_BEGIN(ctx, tree, self, &box->box)
+    // The octree can be detached by the computation.
+    char locked = (ctx.octree != NULL);
+    status = shape_bounding_box(&self->shape, &box->box, tol, &ctx);
+    if (locked) PyThread_release_lock(self->octree_lock);
+    KERNEL_END(ctx)
 
     if (status == SHAPE_SUCCESS) return (PyObject *) box;
     else {
@@ -1240,11 +1489,15 @@ static PyObject *
 shapeobj_volume(ShapeObject * self, PyObject * args, PyObject * kwds)
 {
     PyObject * box = NULL;
+    PyObject * atol_obj = Py_None;
+    PyObject * rtol_obj = Py_None;
     double min_vol = MIN_VOLUME;
+    double atol = 0, rtol = 0;
 
-    static char * kwlist[] = {"box", "min_volume", NULL};
+    static char * kwlist[] = {"box", "min_volume", "atol", "rtol", NULL};
 
-    if (! PyArg_ParseTupleAndKeywords(args, kwds, "|Od", kwlist, &box, &min_vol)) return NULL;
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "|OdOO", kwlist, &box, &min_vol,
+                                      &atol_obj, &rtol_obj)) return NULL;
 
     if (box == NULL) box = GET_NAME(GLOBAL_BOX);
 
@@ -1253,11 +1506,69 @@ shapeobj_volume(ShapeObject * self, PyObject * args, PyObject * kwds)
         return NULL;
     }
 
-    shape_reset_cache(&self->shape);
-    double vol = shape_volume(&self->shape, &((BoxObject *) box)->box, min_vol);
+    char adaptive = (atol_obj != Py_None || rtol_obj != Py_None);
+    if (atol_obj != Py_None && (atol = PyFloat_AsDouble(atol_obj)) == -1 && PyErr_Occurred()) return NULL;
+    if (rtol_obj != Py_None && (rtol = PyFloat_AsDouble(rtol_obj)) == -1 && PyErr_Occurred()) return NULL;
+
+    double vol, err;
+    int status = SHAPE_SUCCESS;
+    Octree * tree = self->shape.octree;
+    KERNEL_BEGIN(ctx)
+    OCTREE_BEGIN(ctx, tree, self, &((BoxObject *) box)->box)
+    if (adaptive) {
+        status = shape_volume_adaptive(&self->shape, &((BoxObject *) box)->box, min_vol, atol, rtol,
+                                       &ctx, &vol, &err);
+    } else {
+        vol = shape_volume(&self->shape, &((BoxObject *) box)->box, min_vol, &ctx);
+    }
+    OCTREE_END(ctx, self)
+    KERNEL_END(ctx)
+
+    if (status == SHAPE_NO_MEMORY) return PyErr_NoMemory();
+    if (adaptive) return Py_BuildValue("(dd)", vol, err);
     return Py_BuildValue("d", vol);
 }
 
+static PyObject *
+shapeobj_volume_mc(ShapeObject * self, PyObject * args, PyObject * kwds)
+{
+    PyObject * box = NULL;
+    Py_ssize_t n_points = 1000000;
+    unsigned int seed = 777;
+    double target_rel_err = 0;
+
+    static char * kwlist[] = {"box", "n_points", "seed", "target_rel_err", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "|OnId", kwlist, &box, &n_points, &seed,
+                                      &target_rel_err)) return NULL;
+
+    if (box == NULL) box = GET_NAME(GLOBAL_BOX);
+
+    if (! PyObject_TypeCheck(box, &BoxType)) {
+        PyErr_SetString(PyExc_ValueError, "Box instance is expected");
+        return NULL;
+    }
+
+    if (n_points <= 0) {
+        PyErr_SetString(PyExc_ValueError, "The number of points must be positive");
+        return NULL;
+    }
+
+    double vol, err;
+    int status;
+    Py_BEGIN_ALLOW_THREADS
+    status = shape_volume_mc(&self->shape, &((BoxObject *) box)->box, (size_t) n_points, seed,
+                             target_rel_err, &vol, &err);
+    Py_END_ALLOW_THREADS
+
+    if (status == SHAPE_NO_MEMORY) return PyErr_NoMemory();
+    if (status != SHAPE_SUCCESS) {
+        PyErr_SetString(PyExc_RuntimeError, "Random points generation failed");
+        return NULL;
+    }
+    return Py_BuildValue("(dd)", vol, err);
+}
+
 /*
 static PyObject *
 shapeobj_contour(ShapeObject * self, PyObject * args, PyObject * kwds)
@@ -1307,42 +1618,247 @@ shapeobj_contour(ShapeObject * self, PyObject * args, PyObject * kwds)
 */
 
 static PyObject *
-shapeobj_collect_statistics(ShapeObject * self, PyObject * args)
+shapeobj_collect_statistics(ShapeObject * self, PyObject * args, PyObject * kwds)
 {
-    PyObject * box;
+    PyObject * box, * refine = Py_None;
     double min_vol;
-    if (! PyArg_ParseTuple(args, "Od", &box, &min_vol)) return NULL;
+    Py_ssize_t max_boxes = 0;
+    double seconds = 0;
+    StatRefinement refinement = {0, NULL, 0};
+
+    static char * kwlist[] = {"box", "min_volume", "max_boxes", "budget_seconds",
+                              "coarse_volume", "refine", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "Od|nddO", kwlist, &box, &min_vol,
+                                      &max_boxes, &seconds, &refinement.coarse_vol,
+                                      &refine)) return NULL;
 
     if (! PyObject_TypeCheck(box, &BoxType)) {
         PyErr_SetString(PyExc_ValueError, "Box instance is expected");
         return NULL;
     }
+    if (max_boxes < 0 || seconds < 0) {
+        PyErr_SetString(PyExc_ValueError, "Budget must be non-negative");
+        return NULL;
+    }
 
-    shape_reset_cache(&self->shape);
-    shape_collect_statistics(&self->shape, &((BoxObject *) box)->box, min_vol);
-    Py_RETURN_NONE;
+    // The sequence keeps references to the surfaces while statistics is collected.
+    PyObject * surfaces = NULL;
+    if (refine != Py_None) {
+        surfaces = PySequence_Fast(refine, "Sequence of surfaces is expected");
+        if (surfaces == NULL) return NULL;
+        refinement.len = PySequence_Fast_GET_SIZE(surfaces);
+        // At least one pointer is allocated, so empty sequence differs from NULL.
+        refinement.surfaces = (const Surface **) malloc((refinement.len + 1) * sizeof(Surface *));
+        if (refinement.surfaces == NULL) {
+            Py_DECREF(surfaces);
+            return PyErr_NoMemory();
+        }
+        for (size_t i = 0; i < refinement.len; ++i) {
+            PyObject * item = PySequence_Fast_GET_ITEM(surfaces, i);
+            if (! PyObject_TypeCheck(item, &SurfaceType)) {
+                PyErr_SetString(PyExc_TypeError, "Surface instance is expected...");
+                free(refinement.surfaces);
+                Py_DECREF(surfaces);
+                return NULL;
+            }
+            refinement.surfaces[i] = &((SurfaceObject *) item)->surf;
+        }
+    }
+
+    int status;
+    Octree * tree = self->shape.octree;
+    KERNEL_BEGIN(ctx)
+    evalctx_set_budget(&ctx, (size_t) max_boxes, seconds);
+    OCTREE_BEGIN(ctx, tree, self, &((BoxObject *) box)->box)
+    status = shape_collect_statistics(
+        &self->shape, &((BoxObject *) box)->box, min_vol,
+        (refinement.coarse_vol > 0 || surfaces != NULL) ? &refinement : NULL, &ctx
+    );
+    OCTREE_END(ctx, self)
+    store_statistics(&self->shape, &ctx, 1);
+    KERNEL_END(ctx)
+    free(refinement.surfaces);
+    Py_XDECREF(surfaces);
+    return PyBool_FromLong(status == SHAPE_SUCCESS);
+}
+
+static void
+free_capsule_data(PyObject * capsule)
+{
+    free(PyCapsule_GetPointer(capsule, NULL));
 }
 
 static PyObject *
 shapeobj_get_stat_table(ShapeObject * self)
 {
     size_t nrows = 0, ncols = 0;
-    char * table_data = shape_get_stat_table(&self->shape, &nrows, &ncols);
+    char * table_data;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->stat_lock, WAIT_LOCK);
+    table_data = shape_get_stat_table(&self->shape, &nrows, &ncols);
+    PyThread_release_lock(self->stat_lock);
+    Py_END_ALLOW_THREADS
+    if (table_data == NULL) return PyErr_NoMemory();
+    // The array takes ownership of the table, it is not copied.
+    PyObject * owner = PyCapsule_New(table_data, NULL, free_capsule_data);
+    if (owner == NULL) {
+        free(table_data);
+        return NULL;
+    }
     npy_intp dims[] = {nrows, ncols};
     PyObject * table = PyArray_SimpleNewFromData(2, dims, NPY_BYTE, table_data);
+    if (table == NULL || PyArray_SetBaseObject((PyArrayObject *) table, owner) < 0) {
+        Py_XDECREF(table);
+        Py_DECREF(owner);
+        return NULL;
+    }
     return table;
 }
 
+static PyObject *
+shapeobj_enable_octree(ShapeObject * self, PyObject * args, PyObject * kwds)
+{
+    PyObject * box;
+    Py_ssize_t max_boxes = OCTREE_MAX_LEN;
+
+    static char * kwlist[] = {"box", "max_boxes", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "O|n", kwlist, &box, &max_boxes)) return NULL;
+
+    if (! PyObject_TypeCheck(box, &BoxType)) {
+        PyErr_SetString(PyExc_ValueError, "Box instance is expected");
+        return NULL;
+    }
+    if (max_boxes < 0) {
+        PyErr_SetString(PyExc_ValueError, "max_boxes must be non-negative");
+        return NULL;
+    }
+
+    int status;
+    // The octree replaced can be used by other threads.
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->octree_lock, WAIT_LOCK);
+    status = shape_enable_octree(&self->shape, &((BoxObject *) box)->box, (size_t) max_boxes);
+    PyThread_release_lock(self->octree_lock);
+    Py_END_ALLOW_THREADS
+    if (status == SHAPE_NO_MEMORY) return PyErr_NoMemory();
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+shapeobj_disable_octree(ShapeObject * self)
+{
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->octree_lock, WAIT_LOCK);
+    shape_disable_octree(&self->shape);
+    PyThread_release_lock(self->octree_lock);
+    Py_END_ALLOW_THREADS
+    Py_RETURN_NONE;
+}
+
 // ========================================================================================== //
 // =================================== Module =============================================== //
 // ========================================================================================== //
 
+static PyObject *
+geometry_kernel_stats(PyObject * module, PyObject * noargs)
+{
+    PyObject * stats = PyDict_New();
+    if (stats == NULL) return NULL;
+    int i;
+    for (i = 0; i < KSTAT_NUMBER; ++i) {
+        PyObject * value = PyLong_FromUnsignedLongLong(kstat_get(i));
+        if (value == NULL || PyDict_SetItemString(stats, kstat_names[i], value) < 0) {
+            Py_XDECREF(value);
+            Py_DECREF(stats);
+            return NULL;
+        }
+        Py_DECREF(value);
+    }
+    return stats;
+}
+
+static PyObject *
+geometry_reset_kernel_stats(PyObject * module, PyObject * noargs)
+{
+    kstat_reset();
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+geometry_collect_statistics(PyObject * module, PyObject * args, PyObject * kwds)
+{
+    PyObject * pyshapes, * box;
+    double min_vol;
+    Py_ssize_t max_boxes = 0;
+    double seconds = 0;
+
+    static char * kwlist[] = {"shapes", "box", "min_volume", "max_boxes", "budget_seconds", NULL};
+
+    if (! PyArg_ParseTupleAndKeywords(args, kwds, "OOd|nd", kwlist, &pyshapes, &box, &min_vol,
+                                      &max_boxes, &seconds)) return NULL;
+
+    if (! PyObject_TypeCheck(box, &BoxType)) {
+        PyErr_SetString(PyExc_ValueError, "Box instance is expected");
+        return NULL;
+    }
+    if (max_boxes < 0 || seconds < 0) {
+        PyErr_SetString(PyExc_ValueError, "Budget must be non-negative");
+        return NULL;
+    }
+
+    // The sequence keeps references to the shapes while statistics is collected.
+    PyObject * items = PySequence_Fast(pyshapes, "Sequence of shapes is expected");
+    if (items == NULL) return NULL;
+    size_t i, n = PySequence_Fast_GET_SIZE(items);
+    Shape ** shapes = (Shape **) malloc((n + 1) * sizeof(Shape *));
+    if (shapes == NULL) {
+        Py_DECREF(items);
+        return PyErr_NoMemory();
+    }
+    for (i = 0; i < n; ++i) {
+        PyObject * item = PySequence_Fast_GET_ITEM(items, i);
+        if (! PyObject_TypeCheck(item, &ShapeType)) {
+            PyErr_SetString(PyExc_TypeError, "Shape instance is expected...");
+            free(shapes);
+            Py_DECREF(items);
+            return NULL;
+        }
+        shapes[i] = &((ShapeObject *) item)->shape;
+    }
+
+    int status;
+    KERNEL_BEGIN(ctx)
+    evalctx_set_budget(&ctx, (size_t) max_boxes, seconds);
+    status = shape_collect_statistics_shared(shapes, n, &((BoxObject *) box)->box, min_vol, &ctx);
+    for (i = 0; i < n; ++i) store_statistics(shapes[i], &ctx, 1);
+    KERNEL_END(ctx)
+    free(shapes);
+    Py_DECREF(items);
+    return PyBool_FromLong(status == SHAPE_SUCCESS);
+}
+
+static PyMethodDef geometry_methods[] = {
+        {"collect_statistics", (PyCFunction) geometry_collect_statistics, METH_VARARGS | METH_KEYWORDS,
+         "Collects statistics of several shapes in one subdivision of the box. A surface shared "
+         "by the shapes is tested once per box. Returns False, if the budget is exhausted."},
+        {"kernel_stats", (PyCFunction) geometry_kernel_stats, METH_NOARGS,
+         "Gets counters of geometry kernel events as a dictionary: optimizers_created - "
+         "the number of NLopt optimizers created, optimizer_runs - the number of optimizations, "
+         "prefilter_tests - the number of box tests by bounds of surface function, "
+         "prefilter_decided - the number of such tests, that decided the result without optimization."},
+        {"reset_kernel_stats", (PyCFunction) geometry_reset_kernel_stats, METH_NOARGS,
+         "Sets counters of geometry kernel events to zero."},
+        {NULL}
+};
+
 static PyModuleDef geometry_module = {
         PyModuleDef_HEAD_INIT,
         "geometry",
         "Geometry native objects.",
         -1,
-        NULL, NULL, NULL, NULL, NULL
+        geometry_methods, NULL, NULL, NULL, NULL
 };
 
 PyMODINIT_FUNC
@@ -0,0 +1,37 @@
+#include "kstat.h"
+
+#if defined(_MSC_VER)
+#include <intrin.h>
+#define atomic_add(ptr, value) _InterlockedExchangeAdd64((volatile __int64 *) (ptr), (__int64) (value))
+#define atomic_load(ptr) ((uint64_t) _InterlockedOr64((volatile __int64 *) (ptr), 0))
+#define atomic_store(ptr, value) _InterlockedExchange64((volatile __int64 *) (ptr), (__int64) (value))
+#else
+#define atomic_add(ptr, value) __atomic_fetch_add((ptr), (value), __ATOMIC_RELAXED)
+#define atomic_load(ptr) __atomic_load_n((ptr), __ATOMIC_RELAXED)
+#define atomic_store(ptr, value) __atomic_store_n((ptr), (value), __ATOMIC_RELAXED)
+#endif
+
+static uint64_t counters[KSTAT_NUMBER];
+
+const char * kstat_names[KSTAT_NUMBER] = {
+    "optimizers_created",
+    "optimizer_runs",
+    "prefilter_tests",
+    "prefilter_decided",
+};
+
+void kstat_add(int counter, uint64_t value)
+{
+    atomic_add(counters + counter, value);
+}
+
+uint64_t kstat_get(int counter)
+{
+    return atomic_load(counters + counter);
+}
+
+void kstat_reset(void)
+{
+    int i;
+    for (i = 0; i < KSTAT_NUMBER; ++i) atomic_store(counters + i, 0);
+}
@@ -0,0 +1,29 @@
+#ifndef __KSTAT_H
+#define __KSTAT_H
+
+#include <stdint.h>
+
+/* Counters of geometry kernel events. They are process wide and updated
+ * atomically, so kernels running in different threads can use them.
+ */
+enum KernelCounter {
+    KSTAT_OPTIMIZERS_CREATED = 0,   // NLopt optimizers created.
+    KSTAT_OPTIMIZER_RUNS,           // Calls to nlopt_optimize.
+    KSTAT_PREFILTER_TESTS,          // Box tests by bounds of surface function.
+    KSTAT_PREFILTER_DECIDED,        // Box tests decided by the bounds.
+    KSTAT_NUMBER                    // The number of counters.
+};
+
+// Names of the counters.
+extern const char * kstat_names[KSTAT_NUMBER];
+
+// Adds value to the counter.
+void kstat_add(int counter, uint64_t value);
+
+// Gets the value of the counter.
+uint64_t kstat_get(int counter);
+
+// Sets all the counters to zero.
+void kstat_reset(void);
+
+#endif
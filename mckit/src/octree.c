@@ -0,0 +1,204 @@
+#include <stdlib.h>
+#include <string.h>
+#include "octree.h"
+
+#define OCTREE_INITIAL_CAPACITY 64
+
+static size_t hash_code(uint64_t code, size_t mask)
+{
+    code ^= code >> 33;
+    code *= 0xff51afd7ed558ccdull;
+    code ^= code >> 33;
+    return (size_t) code & mask;
+}
+
+static size_t find_slot(const uint64_t * codes, size_t capacity, uint64_t code)
+{
+    size_t mask = capacity - 1;
+    size_t i = hash_code(code, mask);
+    while (codes[i] != 0 && codes[i] != code) i = (i + 1) & mask;
+    return i;
+}
+
+static int grow(Octree * tree)
+{
+    size_t capacity = (tree->capacity == 0) ? OCTREE_INITIAL_CAPACITY : 2 * tree->capacity;
+    uint64_t * codes = (uint64_t *) calloc(capacity, sizeof(uint64_t));
+    char * results = (char *) malloc(capacity);
+    if (codes == NULL || results == NULL) {
+        free(codes);
+        free(results);
+        return OCTREE_NO_MEMORY;
+    }
+    for (size_t i = 0; i < tree->capacity; ++i) {
+        if (tree->codes[i] == 0) continue;
+        size_t j = find_slot(codes, capacity, tree->codes[i]);
+        codes[j] = tree->codes[i];
+        results[j] = tree->results[i];
+    }
+    free(tree->codes);
+    free(tree->results);
+    tree->codes = codes;
+    tree->results = results;
+    tree->capacity = capacity;
+    return OCTREE_SUCCESS;
+}
+
+void octree_init(Octree * tree, const void * owner, const Box * root, size_t max_len)
+{
+    tree->owner = owner;
+    tree->root = *root;
+    tree->root.rng = NULL;
+    tree->root.subdiv = 1;
+    tree->codes = NULL;
+    tree->results = NULL;
+    tree->len = 0;
+    tree->capacity = 0;
+    tree->max_len = max_len;
+}
+
+void octree_dispose(Octree * tree)
+{
+    free(tree->codes);
+    free(tree->results);
+    tree->codes = NULL;
+    tree->results = NULL;
+    tree->len = 0;
+    tree->capacity = 0;
+}
+
+int octree_lookup(const Octree * tree, uint64_t subdiv, int * result)
+{
+    if (tree->len == 0) return 0;
+    size_t i = find_slot(tree->codes, tree->capacity, subdiv);
+    if (tree->codes[i] == 0) return 0;
+    *result = tree->results[i];
+    return 1;
+}
+
+int octree_store(Octree * tree, uint64_t subdiv, int result)
+{
+    if (subdiv & HIGHEST_BIT) return OCTREE_SUCCESS;    // The code is not unique.
+    // Keep load factor below 1/2.
+    if (2 * (tree->len + 1) > tree->capacity) {
+        if (tree->len >= tree->max_len) return OCTREE_SUCCESS;
+        if (grow(tree) != OCTREE_SUCCESS) return OCTREE_NO_MEMORY;
+    }
+    size_t i = find_slot(tree->codes, tree->capacity, subdiv);
+    if (tree->codes[i] == 0) {
+        if (tree->len >= tree->max_len) return OCTREE_SUCCESS;
+        tree->codes[i] = subdiv;
+        ++tree->len;
+    }
+    tree->results[i] = (char) result;
+    return OCTREE_SUCCESS;
+}
+
+int octree_is_root(const Octree * tree, const Box * box)
+{
+    const Box * root = &tree->root;
+    return box->subdiv == 1 &&
+           memcmp(box->center, root->center, sizeof(root->center)) == 0 &&
+           memcmp(box->ex, root->ex, sizeof(root->ex)) == 0 &&
+           memcmp(box->ey, root->ey, sizeof(root->ey)) == 0 &&
+           memcmp(box->ez, root->ez, sizeof(root->ez)) == 0 &&
+           memcmp(box->dims, root->dims, sizeof(root->dims)) == 0;
+}
+
+void octree_attach(EvalContext * ctx, Octree * tree, const Box * box)
+{
+    if (ctx == NULL) return;
+    ctx->octree = (tree != NULL && octree_is_root(tree, box)) ? tree : NULL;
+}
+
+// Gets code of a part of the box with subdivision code subdiv (see box_split).
+static uint64_t part_code(uint64_t subdiv, int second)
+{
+    uint64_t mask;
+    for (mask = 1; (mask << 1) <= subdiv; mask <<= 1);
+    return second ? subdiv | (mask << 1) : (subdiv & ~mask) | (mask << 1);
+}
+
+// Gets the direction, along which the box is split (see box_split).
+static int split_dir(const double * dims)
+{
+    int dir = 0;
+    for (int i = 1; i < NDIM; ++i) if (dims[i] > dims[dir]) dir = i;
+    return dir;
+}
+
+// Extends bounds by the parts of the box, which are not known to be outside.
+static void extend_bounds(
+        const Octree * tree,
+        uint64_t subdiv,
+        double * center,
+        double * dims,
+        double * lower,
+        double * upper,
+        int * found
+)
+{
+    int result, i, known = octree_lookup(tree, subdiv, &result);
+    if (known && result == -1) return;
+    // Parts of the box can't extend the bounds.
+    char inner = *found;
+    for (i = 0; i < NDIM && inner; ++i) {
+        inner = center[i] - 0.5 * dims[i] >= lower[i] && center[i] + 0.5 * dims[i] <= upper[i];
+    }
+    if (inner) return;
+    if (!known || result == +1 || (subdiv & HIGHEST_BIT)) {
+        for (i = 0; i < NDIM; ++i) {
+            if (!*found || center[i] - 0.5 * dims[i] < lower[i]) lower[i] = center[i] - 0.5 * dims[i];
+            if (!*found || center[i] + 0.5 * dims[i] > upper[i]) upper[i] = center[i] + 0.5 * dims[i];
+        }
+        *found = 1;
+        return;
+    }
+    int dir = split_dir(dims);
+    double half = 0.5 * dims[dir], middle = center[dir];
+    dims[dir] = half;
+    center[dir] = middle - 0.5 * half;
+    extend_bounds(tree, part_code(subdiv, 0), center, dims, lower, upper, found);
+    center[dir] = middle + 0.5 * half;
+    extend_bounds(tree, part_code(subdiv, 1), center, dims, lower, upper, found);
+    center[dir] = middle;
+    dims[dir] = 2 * half;
+}
+
+int octree_bounds(const Octree * tree, double * lower, double * upper)
+{
+    double center[NDIM] = {0, 0, 0}, dims[NDIM];
+    int found = 0;
+    for (int i = 0; i < NDIM; ++i) dims[i] = tree->root.dims[i];
+    extend_bounds(tree, 1, center, dims, lower, upper, &found);
+    return found;
+}
+
+int octree_locate(const Octree * tree, const double * point, int * result)
+{
+    const Box * root = &tree->root;
+    const double * basis[NDIM] = {root->ex, root->ey, root->ez};
+    double local[NDIM], center[NDIM] = {0, 0, 0}, dims[NDIM];
+    int i, j, dir;
+    for (i = 0; i < NDIM; ++i) {
+        local[i] = 0;
+        for (j = 0; j < NDIM; ++j) local[i] += (point[j] - root->center[j]) * basis[i][j];
+        if (local[i] < -0.5 * root->dims[i] || local[i] > 0.5 * root->dims[i]) return 0;
+        dims[i] = root->dims[i];
+    }
+    // Descend the same way as box_split does, while the result is undefined.
+    uint64_t subdiv = 1;
+    *result = 0;
+    while (octree_lookup(tree, subdiv, result) && *result == 0 && !(subdiv & HIGHEST_BIT)) {
+        dir = split_dir(dims);
+        dims[dir] *= 0.5;
+        if (local[dir] < center[dir]) {
+            center[dir] -= 0.5 * dims[dir];
+            subdiv = part_code(subdiv, 0);
+        } else {
+            center[dir] += 0.5 * dims[dir];
+            subdiv = part_code(subdiv, 1);
+        }
+    }
+    return 1;
+}
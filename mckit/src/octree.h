@@ -0,0 +1,71 @@
+#ifndef __OCTREE_H
+#define __OCTREE_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include "box.h"
+#include "evalctx.h"
+
+#define OCTREE_SUCCESS    0
+#define OCTREE_NO_MEMORY -1
+
+// The default limit of the number of boxes in the tree.
+#define OCTREE_MAX_LEN 1000000
+
+/* Cache of box test results of a shape. The boxes are the parts of the root
+ * box in the subdivision process (see box_split with BOX_SPLIT_AUTODIR and
+ * ratio 0.5), so every box is identified by its subdivision code. The tree is
+ * built lazily: results are stored as boxes are tested by any computation,
+ * which starts from the root box, and reused by the next ones.
+ *
+ * The results are stored in an open addressing hash table keyed by the
+ * subdivision codes. The number of boxes is limited, when the limit is
+ * reached, new results are not stored.
+ */
+struct Octree {
+    const void * owner;     // Shape the results belong to.
+    Box root;               // Root box.
+    uint64_t * codes;       // Subdivision codes, 0 - empty slot.
+    char * results;         // Results of box tests.
+    size_t len;             // The number of boxes.
+    size_t capacity;        // The number of slots. Always power of 2.
+    size_t max_len;         // The maximal number of boxes.
+};
+
+// Initializes the tree for the shape and the root box.
+void octree_init(Octree * tree, const void * owner, const Box * root, size_t max_len);
+
+// Frees memory allocated for the tree.
+void octree_dispose(Octree * tree);
+
+/* Gets cached result for the box with subdivision code subdiv.
+ * Returns nonzero, if the result is found.
+ */
+int octree_lookup(const Octree * tree, uint64_t subdiv, int * result);
+
+/* Stores result for the box with subdivision code subdiv.
+ * Returns OCTREE_SUCCESS | OCTREE_NO_MEMORY
+ */
+int octree_store(Octree * tree, uint64_t subdiv, int result);
+
+// Checks if the box is the root box of the tree.
+int octree_is_root(const Octree * tree, const Box * box);
+
+/* Attaches the tree to the context, if the box is the root of the tree: the
+ * results of box tests of the owner are taken from the tree and stored to it.
+ * Otherwise the tree is detached. tree can be NULL.
+ */
+void octree_attach(EvalContext * ctx, Octree * tree, const Box * box);
+
+/* Gets bounds of the parts of the root box, which are not known to be outside
+ * the shape, in coordinates of the root box relative to its center.
+ * Returns 0, if all the root box is known to be outside.
+ */
+int octree_bounds(const Octree * tree, double * lower, double * upper);
+
+/* Finds the smallest box of the tree, which contains the point, and gets its result.
+ * Returns nonzero, if the point is inside the root box.
+ */
+int octree_locate(const Octree * tree, const double * point, int * result);
+
+#endif
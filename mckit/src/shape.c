@@ -3,6 +3,11 @@
 //
 
 #include <stdlib.h>
+#include <string.h>
+#include <math.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 #include "shape.h"
 #include "surface.h"
 
@@ -12,26 +17,14 @@
 
 #define geom_complement(arg) (-1 * (arg))
 
-char geom_intersection(char * args, size_t n, size_t inc);
-char geom_union(char * args, size_t n, size_t inc);
-
-typedef struct StatUnit StatUnit;
+// Initial capacity of the local stack of boxes.
+#define BOX_STACK_CAPACITY 128
 
-struct StatUnit {
-    char * arr;
-    size_t len;
-    double vol;
-};
+// The number of random points tested at once by Monte Carlo volume estimation.
+#define MC_BATCH 65536
 
-static int stat_compare(const StatUnit * a, const StatUnit * b)
-{
-    size_t i, n = a->len;
-    for (i = 0; i < n; ++i) {
-        if (a->arr[i] < b->arr[i]) return 1;
-        else if (a->arr[i] > b->arr[i]) return -1;
-    }
-    return 0;
-}
+char geom_intersection(char * args, size_t n, size_t inc);
+char geom_union(char * args, size_t n, size_t inc);
 
 // Initializes shape struct
 int shape_init(
@@ -43,9 +36,10 @@ int shape_init(
 {
     shape->opc = opc;
     shape->alen = alen;
-    shape->stats = rbtree_create(stat_compare);;
-    shape->last_box = 0;
-    shape->last_box_result = 0;
+    shape->octree = NULL;
+    shape->stats = (StatSet *) malloc(sizeof(StatSet));
+    if (shape->stats == NULL) return SHAPE_NO_MEMORY;
+    statset_init(shape->stats, alen);
     if (is_final(opc)) {
         shape->args.surface = (Surface *) args;
     } else if (is_void(opc)) {
@@ -61,14 +55,12 @@ int shape_init(
 
 void shape_dealloc(Shape * shape)
 {
+    shape_disable_octree(shape);
     if (is_composite(shape->opc)) free(shape->args.shapes);
     if (shape->stats != NULL) {
-        StatUnit * s;
-        while ((s = rbtree_pop(shape->stats, NULL)) != NULL) {
-            free(s->arr);
-            free(s);
-        }
-        rbtree_free(shape->stats);
+        statset_dispose(shape->stats);
+        free(shape->stats);
+        shape->stats = NULL;
     }
 }
 
@@ -76,31 +68,36 @@ void shape_dealloc(Shape * shape)
 // Returns BOX_INSIDE_SHAPE | BOX_CAN_INTERSECT_SHAPE | BOX_OUTSIDE_SHAPE
 //
 int shape_test_box(
-        Shape * shape,          // Shape to test.
+        const Shape * shape,    // Shape to test.
         const Box * box,        // Box to test.
         char collect,           // Collect statistics about results.
-        int * zero_surfaces     // The number of surfaces that was tested to be zero.
+        int * zero_surfaces,    // The number of surfaces that was tested to be zero.
+        EvalContext * ctx       // Cache of test results.
 )
 {
-    if (shape->last_box != 0) {
-        int bc = box_is_in(box, shape->last_box);
+    CacheEntry * cached = evalctx_lookup(ctx, shape);
+    if (cached != NULL) {
+        int bc = box_is_in(box, cached->subdiv);
         // if it is the box already tested (bc == 0) then returns cached result;
         // if it is inner box - then returns cached result only if it is not 0.
         // For inner box result may be different.
 
         // It is inner box and test result is not 0: -1 or +1 i.e. won't change.
-        char use_cache = (bc > 0 && shape->last_box_result != BOX_CAN_INTERSECT_SHAPE);
+        char use_cache = (bc > 0 && cached->result != BOX_CAN_INTERSECT_SHAPE);
         // If collect < 0 - it means that we try to test different
         // combinations of the remaining surfaces. In this case caching is not
         // used if we test the same box again.
         use_cache = use_cache || (bc == 0 && collect >= 0);
-        if (use_cache) return shape->last_box_result;
+        if (use_cache) return cached->result;
     }
 
     int result;
+    Octree * tree = (ctx != NULL && ctx->octree != NULL && ctx->octree->owner == shape) ? ctx->octree : NULL;
+    if (tree != NULL && collect == 0 && octree_lookup(tree, box->subdiv, &result)) return result;
     if (is_final(shape->opc)) {
-        char already = (box->subdiv == (shape->args.surface)->last_box);
-        result = surface_test_box(shape->args.surface, box);
+        CacheEntry * surf_cached = evalctx_lookup(ctx, shape->args.surface);
+        char already = (surf_cached != NULL && surf_cached->subdiv == box->subdiv);
+        result = surface_test_box(shape->args.surface, box, ctx);
         if (shape->opc == COMPLEMENT) result = geom_complement(result);
         if (collect > 0 && result == 0 && !already) ++(*zero_surfaces);
     } else if (shape->opc == UNIVERSE) {
@@ -108,43 +105,99 @@ int shape_test_box(
     } else if (shape->opc == EMPTY) {
         result = BOX_OUTSIDE_SHAPE;
     } else {
-        char * sub = malloc(shape->alen * sizeof(char));
-
-        for (int i = 0; i < shape->alen; ++i) {
-            sub[i] = shape_test_box((shape->args.shapes)[i], box, collect, zero_surfaces);
+        char * sub = (ctx != NULL) ? evalctx_alloc(ctx, shape->alen) : malloc(shape->alen);
+        if (sub == NULL) return BOX_CAN_INTERSECT_SHAPE;    // Nothing can be said.
+
+        // The result of intersection is known as soon as some argument is outside, and
+        // the result of union - as soon as some argument is inside. The rest arguments
+        // are tested only if statistics is collected.
+        char decisive = (shape->opc == INTERSECTION) ? BOX_OUTSIDE_SHAPE : BOX_INSIDE_SHAPE;
+        size_t i, n = shape->alen;
+        for (i = 0; i < shape->alen; ++i) {
+            sub[i] = shape_test_box((shape->args.shapes)[i], box, collect, zero_surfaces, ctx);
+            if (collect == 0 && sub[i] == decisive) {
+                n = i + 1;
+                break;
+            }
         }
 
         if (shape->opc == INTERSECTION) {
-            result = geom_intersection(sub, shape->alen, 1);
+            result = geom_intersection(sub, n, 1);
         } else {
-            result = geom_union(sub, shape->alen, 1);
+            result = geom_union(sub, n, 1);
         }
 
-        // TODO: Review statistics collection
-        if (collect != 0 && result != 0) {
-            StatUnit * stat = (StatUnit *) malloc(sizeof(StatUnit));
-            stat->arr = sub;
-            stat->len = shape->alen;
-            stat->vol = box->volume;
-            if (rbtree_add(shape->stats, stat) != RBT_OK) {
-                free(stat);
-                free(sub);
-            }
-        } else free(sub);
+        // Statistics is collected in the context. If there's no memory, the row is
+        // lost, but the result is valid anyway.
+        if (collect != 0 && result != 0 && ctx != NULL) {
+            StatSet * stats = evalctx_stats(ctx, shape, shape->alen);
+            if (stats != NULL) statset_add(stats, sub);
+        }
+        if (ctx != NULL) evalctx_free(ctx, sub);
+        else free(sub);
     }
     // Cache test result;
-    if (collect >= 0 && !(box->subdiv & HIGHEST_BIT)) {
-        shape->last_box = box->subdiv;
-        shape->last_box_result = result;
-    }
+    if (collect >= 0 && !(box->subdiv & HIGHEST_BIT)) evalctx_store(ctx, shape, box->subdiv, result);
+    if (tree != NULL && collect >= 0) octree_store(tree, box->subdiv, result);
     return result;
 }
 
+int shape_test_boxes(
+        const Shape * shape,
+        size_t nbox,
+        const double * centers,
+        const double * dims,
+        size_t dims_stride,
+        const double * basis,
+        int nthreads,
+        char * result
+)
+{
+    int status = SHAPE_SUCCESS;
+#ifdef _OPENMP
+    if (nthreads <= 0) nthreads = omp_get_max_threads();
+    #pragma omp parallel num_threads(nthreads)
+#endif
+    {
+        // Every thread has its own context, so the shape is shared safely.
+        EvalContext ctx;
+        Box box;
+        int ok = evalctx_init(&ctx) == EVALCTX_SUCCESS;
+        if (!ok) {
+#ifdef _OPENMP
+            #pragma omp atomic write
+#endif
+            status = SHAPE_NO_MEMORY;
+        }
+        ptrdiff_t i;
+#ifdef _OPENMP
+        #pragma omp for schedule(dynamic, 64)
+#endif
+        for (i = 0; i < (ptrdiff_t) nbox; ++i) {
+            if (!ok) continue;
+            const double * d = dims + i * dims_stride;
+            box_init(&box, centers + i * NDIM, basis, basis + NDIM, basis + 2 * NDIM, d[0], d[1], d[2]);
+            // All the boxes have the same subdivision code, the results of the
+            // previous box must not be used.
+            evalctx_reset(&ctx);
+            result[i] = (char) shape_test_box(shape, &box, 0, NULL, &ctx);
+        }
+        evalctx_dispose(&ctx);
+    }
+    return status;
+}
 
-int set_zero_surface_pointers(Shape * shape, int n, Surface ** zs, uint64_t subdiv)
+static int set_zero_surface_pointers(
+        const Shape * shape,
+        int n,
+        const Surface ** zs,
+        uint64_t subdiv,
+        const EvalContext * ctx
+)
 {
     if (is_final(shape->opc)) {
-        if (shape->args.surface->last_box == subdiv && shape->args.surface->last_box_result == 0) {
+        CacheEntry * cached = evalctx_lookup(ctx, shape->args.surface);
+        if (cached != NULL && cached->subdiv == subdiv && cached->result == 0) {
             char already = 0;
             for (int i = 0; i < n; ++i) {
                 if (zs[i] == shape->args.surface) {
@@ -155,60 +208,242 @@ int set_zero_surface_pointers(Shape * shape, int n, Surface ** zs, uint64_t subd
             if (!already) zs[n++] = shape->args.surface;
         }
     } else if (is_composite(shape->opc)) {
-        for (int i = 0; i < shape->alen; ++i) {
-            n = set_zero_surface_pointers(shape->args.shapes[i], n, zs, subdiv);
+        for (size_t i = 0; i < shape->alen; ++i) {
+            n = set_zero_surface_pointers(shape->args.shapes[i], n, zs, subdiv, ctx);
         }
     }
     return n;
 }
 
+// Gets the stack of boxes for subdivision: the one owned by the context or a local one.
+static BoxStack * get_box_stack(EvalContext * ctx, BoxStack * local)
+{
+    if (ctx != NULL) return &ctx->boxes;
+    box_stack_init(local, BOX_STACK_CAPACITY);
+    return local;
+}
+
+// Releases the boxes pushed to the stack after base.
+static void release_box_stack(BoxStack * stack, BoxStack * local, size_t base)
+{
+    stack->len = base;
+    if (stack == local) box_stack_dispose(local);
+}
+
+// Tests all combinations of senses of surfaces, which intersect the box, and
+// collects statistics about results.
+static void vary_zero_surfaces(
+        const Shape * shape,
+        const Box * box,
+        char collect,
+        int zero_surfaces,
+        EvalContext * ctx
+)
+{
+    const Surface **zs = (const Surface **) malloc(zero_surfaces * sizeof(Surface*));
+    if (zs == NULL) return;
+    for (int i = 0; i < zero_surfaces; ++i) zs[i] = NULL;
+
+    int k = set_zero_surface_pointers(shape, 0, zs, box->subdiv, ctx);
+    int n = 1 << k;
+    evalctx_spend(ctx, n);
+    for (int i = 0; i < n; ++i) {
+        for (int j = 0; j < k; ++j) {
+            evalctx_store(ctx, zs[j], box->subdiv, ((i >> j) & 1) * 2 - 1);
+        }
+        shape_test_box(shape, box, -collect, NULL, ctx);
+    }
+    // Other shapes can be tested in the same box, so the true results are restored.
+    for (int j = 0; j < k; ++j) evalctx_store(ctx, zs[j], box->subdiv, 0);
+    free(zs);
+}
+
+// Checks if any of the surfaces, which were tested to be zero for the box, is to be refined.
+static int refines_box(
+        const Shape * shape,
+        uint64_t subdiv,
+        const StatRefinement * refinement,
+        const EvalContext * ctx
+)
+{
+    if (refinement->surfaces == NULL) return 1;
+    if (is_final(shape->opc)) {
+        CacheEntry * cached = evalctx_lookup(ctx, shape->args.surface);
+        if (cached == NULL || cached->subdiv != subdiv || cached->result != 0) return 0;
+        for (size_t i = 0; i < refinement->len; ++i) {
+            if (refinement->surfaces[i] == shape->args.surface) return 1;
+        }
+    } else if (is_composite(shape->opc)) {
+        for (size_t i = 0; i < shape->alen; ++i) {
+            if (refines_box(shape->args.shapes[i], subdiv, refinement, ctx)) return 1;
+        }
+    }
+    return 0;
+}
+
+// Checks if the senses of the surfaces intersecting the box are to be varied
+// before the box reaches the minimal volume.
+static int is_coarse_leaf(
+        const Shape * shape,
+        const Box * box,
+        int zero_surfaces,
+        const StatRefinement * refinement,
+        const EvalContext * ctx
+)
+{
+    if (refinement == NULL || zero_surfaces > SHAPE_VARY_LIMIT) return 0;
+    return box->volume < refinement->coarse_vol || !refines_box(shape, box->subdiv, refinement, ctx);
+}
+
+// Subdivision process of shape_ultimate_test_box. Boxes are refined according to
+// refinement, if it is not NULL.
+static int ultimate_test_box(
+        const Shape * shape,
+        const Box * box,
+        double min_vol,
+        char collect,
+        const StatRefinement * refinement,
+        EvalContext * ctx
+)
+{
+    BoxStack local;
+    BoxStack * stack = get_box_stack(ctx, &local);
+    size_t base = stack->len;
+    Box current, * top;
+    int result, common = 0, zero_surfaces;
+    char mixed = 0;         // The box is found to intersect the shape.
+
+    // Boxes are processed depth first, in the same order as recursive subdivision,
+    // so cached results of the parent box are used for its parts.
+    top = box_stack_push(stack, 1);
+    if (top != NULL) *top = *box;
+    else mixed = 1;
+    while (stack->len > base) {
+        // If the budget is exhausted, nothing can be said about the box.
+        if (evalctx_spend(ctx, 1)) {
+            mixed = 1;
+            break;
+        }
+        box_stack_pop(stack, &current);
+        zero_surfaces = 0;
+        result = shape_test_box(shape, &current, collect, &zero_surfaces, ctx);
+        if (result == BOX_CAN_INTERSECT_SHAPE) {
+            // If collect is on and result is 0 we have the following possibilities:
+            // 1. only one surface has test_box result 0. Then this surface is
+            //    essential for the shape. Further volume division is unnecessary.
+            // 2. minimal volume is already reached. Then remaining surfaces
+            //    somehow describe the shape and they are important.
+            // In those cases we test all possible test_box results of the
+            // remaining surfaces and collect statistics.
+            if (collect > 0 && (zero_surfaces == 1 || current.volume < min_vol ||
+                                is_coarse_leaf(shape, &current, zero_surfaces, refinement, ctx))) {
+                vary_zero_surfaces(shape, &current, collect, zero_surfaces, ctx);
+                mixed = 1;
+            } else if (current.volume > min_vol && (top = box_stack_push(stack, 2)) != NULL) {
+                box_split(&current, top + 1, top, BOX_SPLIT_AUTODIR, 0.5);
+                continue;
+            } else mixed = 1;
+        } else if (common == 0) {
+            common = result;
+        } else if (common != result) {
+            mixed = 1;      // There are parts both inside and outside the shape.
+        }
+        // If statistics is not collected, the rest boxes are not needed.
+        if (mixed && collect <= 0) break;
+    }
+    release_box_stack(stack, &local, base);
+    return mixed ? BOX_CAN_INTERSECT_SHAPE : common;
+}
+
 // Tests box location with respect to the shape. It tries to find out
 // if the box really intersects the shape with desired accuracy.
 // Returns BOX_INSIDE_SHAPE | BOX_CAN_INTERSECT_SHAPE | BOX_OUTSIDE_SHAPE
 int shape_ultimate_test_box(
-        Shape * shape,          // Pointer to shape
+        const Shape * shape,    // Pointer to shape
         const Box * box,        // box
         double min_vol,         // minimal volume until which splitting process goes.
-        char collect            // Whether to collect statistics about results.
+        char collect,           // Whether to collect statistics about results.
+        EvalContext * ctx       // Cache of test results.
 )
 {
-    int zero_surfaces = 0;
-    int result = shape_test_box(shape, box, collect, &zero_surfaces);
-    if (collect > 0 && result == BOX_CAN_INTERSECT_SHAPE) {
-        // If collect is on and result is 0 we have the following possibilities:
-        // 1. only one surface has test_box result 0. Then this surface is
-        //    essential for the shape. Further volume division is unnecessary.
-        // 2. minimal volume is already reached. Then remaining surfaces
-        //    somehow describe the shape and they are important.
-        // In those cases we test all possible test_box results of the
-        // remaining surfaces and collect statistics.
-        if (zero_surfaces == 1 || box->volume < min_vol) {
-            // vary all zero surfaces that remain to be -1 and +1
-            Surface **zs = (Surface **) malloc(zero_surfaces * sizeof(Surface*));
-            for (int i = 0; i < zero_surfaces; ++i) zs[i] = NULL;
-
-            int k = set_zero_surface_pointers(shape, 0, zs, box->subdiv);
-            int n = 1 << zero_surfaces;
-            for (int i = 0; i < n; ++i) {
-                for (int j = 0; j < zero_surfaces; ++j) {
-                    zs[j]->last_box_result = ((i >> j) & 1) * 2 - 1;
+    return ultimate_test_box(shape, box, min_vol, collect, NULL, ctx);
+}
+
+// The number of points classified at once by shape_test_points. It bounds
+// the memory used for intermediate results.
+#define POINTS_CHUNK 4096
+
+// The number of composite nodes on the longest path from the shape to a surface.
+static size_t composite_depth(const Shape * shape)
+{
+    if (!is_composite(shape->opc)) return 0;
+    size_t i, d, depth = 0;
+    for (i = 0; i < shape->alen; ++i) {
+        d = composite_depth(shape->args.shapes[i]);
+        if (d > depth) depth = d;
+    }
+    return depth + 1;
+}
+
+// Scratch memory needed by a composite node for n points: positions of undecided
+// points in the result, their indices and results of an argument. The size is
+// rounded up to a multiple of sizeof(size_t), so the memory of the next level
+// is aligned for size_t too.
+static size_t point_scratch_size(size_t n)
+{
+    return 2 * n * sizeof(size_t) + (n + sizeof(size_t) - 1) / sizeof(size_t) * sizeof(size_t);
+}
+
+/* Tests points points[index[i]], i < n, against the shape. Every argument of
+ * intersection (union) is tested only against the points, that are not found
+ * outside (inside) yet. scratch must have at least point_scratch_size(n) bytes
+ * per composite level of the shape, and it must be aligned for size_t.
+ */
+static void test_points_indexed(
+        const Shape * shape,
+        size_t n,
+        const double * points,
+        const size_t * index,
+        char * result,
+        char * scratch
+)
+{
+    size_t i, k, m;
+    if (is_final(shape->opc)) {
+        surface_test_points_indexed(shape->args.surface, n, points, index, result);
+        if (shape->opc == COMPLEMENT)
+            for (k = 0; k < n; ++k) result[k] = geom_complement(result[k]);
+    } else if (is_void(shape->opc)) {
+        memset(result, (shape->opc == UNIVERSE) ? 1 : -1, n);
+    } else {
+        // Decisive result of an argument. If no argument gives it, the point
+        // gets the opposite one.
+        char stop = (shape->opc == INTERSECTION) ? -1 : 1;
+        size_t * pos = (size_t *) scratch;
+        size_t * sub_index = pos + n;
+        char * sub = (char *) (sub_index + n);
+        char * next = scratch + point_scratch_size(n);
+
+        memset(result, -stop, n);
+        for (k = 0; k < n; ++k) {
+            pos[k] = k;
+            sub_index[k] = index[k];
+        }
+        for (i = 0, m = n; i < shape->alen && m > 0; ++i) {
+            test_points_indexed(shape->args.shapes[i], m, points, sub_index, sub, next);
+            // Decided points are removed from the list.
+            size_t w = 0;
+            for (k = 0; k < m; ++k) {
+                if (sub[k] == stop) result[pos[k]] = stop;
+                else {
+                    pos[w] = pos[k];
+                    sub_index[w] = sub_index[k];
+                    ++w;
                 }
-                shape_test_box(shape, box, -collect, NULL);
             }
-            free(zs);
-            return result;
+            m = w;
         }
     }
-    if (result == BOX_CAN_INTERSECT_SHAPE && box->volume > min_vol) {
-        Box box1, box2;
-        box_split(box, &box1, &box2, BOX_SPLIT_AUTODIR, 0.5);
-        int result1 = shape_ultimate_test_box(shape, &box1, min_vol, collect);
-        int result2 = shape_ultimate_test_box(shape, &box2, min_vol, collect);
-        if (result1 != BOX_CAN_INTERSECT_SHAPE && result2 != BOX_CAN_INTERSECT_SHAPE)
-            return result1;     // No matter what value (result1 or result2) is returned because they
-                                // will be equal.
-    }
-    return result;
 }
 
 // Tests whether points belong to this shape.
@@ -222,50 +457,115 @@ int shape_test_points(
                                 // otherwise. It must have length npts.
 )
 {
-    int i;
-    if (is_final(shape->opc)) {
-        surface_test_points(shape->args.surface, npts, points, result);
-        if (shape->opc == COMPLEMENT)
-            for (i = 0; i < npts; ++i) result[i] = geom_complement(result[i]);
-    } else if (is_void(shape->opc)) {
-        char fill = (shape->opc == UNIVERSE) ? 1 : -1;
-        for (i = 0; i < npts; ++i) result[i] = fill;
-    } else {
-        char (*op)(char * arg, size_t n, size_t inc);
-        op = (shape->opc == INTERSECTION) ? geom_intersection : geom_union;
-
-        size_t n = shape->alen;
-        char * sub = malloc(n * npts * sizeof(char));
-        if (sub == NULL) return SHAPE_NO_MEMORY;
+    if (npts == 0) return SHAPE_SUCCESS;
+    size_t chunk = npts < POINTS_CHUNK ? npts : POINTS_CHUNK;
+    size_t depth = composite_depth(shape);
+    size_t * index = (size_t *) malloc(chunk * sizeof(size_t) + depth * point_scratch_size(chunk));
+    if (index == NULL) return SHAPE_NO_MEMORY;
+    char * scratch = (char *) (index + chunk);
+
+    size_t i, k, n;
+    for (k = 0; k < chunk; ++k) index[k] = k;
+    for (i = 0; i < npts; i += n) {
+        n = (npts - i < chunk) ? npts - i : chunk;
+        test_points_indexed(shape, n, points + NDIM * i, index, result + i, scratch);
+    }
+    free(index);
+    return SHAPE_SUCCESS;
+}
 
-        for (i = 0; i < n; ++i) {
-            shape_test_points((shape->args.shapes)[i], npts, points, sub + i * npts);
+int shape_locate_points(
+        const Shape * shape,
+        const Octree * tree,
+        size_t npts,
+        const double * points,
+        char * result
+)
+{
+    if (tree == NULL) return shape_test_points(shape, npts, points, result);
+    size_t chunk = npts < POINTS_CHUNK ? npts : POINTS_CHUNK;
+    size_t * index = (size_t *) malloc(chunk * (sizeof(size_t) + NDIM * sizeof(double) + 1));
+    if (index == NULL) return SHAPE_NO_MEMORY;
+    double * unknown = (double *) (index + chunk);
+    char * unknown_result = (char *) (unknown + NDIM * chunk);
+
+    size_t i, k, n, m;
+    int r, status = SHAPE_SUCCESS;
+    for (i = 0; i < npts && status == SHAPE_SUCCESS; i += n) {
+        n = (npts - i < chunk) ? npts - i : chunk;
+        // The points, which are in the boxes with undefined result, are tested.
+        for (k = 0, m = 0; k < n; ++k) {
+            const double * p = points + NDIM * (i + k);
+            if (octree_locate(tree, p, &r) && r != BOX_CAN_INTERSECT_SHAPE) {
+                result[i + k] = (char) r;
+            } else {
+                index[m] = i + k;
+                for (int j = 0; j < NDIM; ++j) unknown[NDIM * m + j] = p[j];
+                ++m;
+            }
         }
-        for (i = 0; i < npts; ++i) result[i] = op(sub + i, n * npts, npts);
-        free(sub);
+        status = shape_test_points(shape, m, unknown, unknown_result);
+        for (k = 0; k < m; ++k) result[index[k]] = unknown_result[k];
     }
+    free(index);
+    return status;
+}
+
+int shape_enable_octree(Shape * shape, const Box * root, size_t max_len)
+{
+    Octree * tree = (Octree *) malloc(sizeof(Octree));
+    if (tree == NULL) return SHAPE_NO_MEMORY;
+    octree_init(tree, shape, root, max_len);
+    shape_disable_octree(shape);
+    shape->octree = tree;
     return SHAPE_SUCCESS;
 }
 
+void shape_disable_octree(Shape * shape)
+{
+    if (shape->octree == NULL) return;
+    octree_dispose(shape->octree);
+    free(shape->octree);
+    shape->octree = NULL;
+}
+
 // Gets bounding box, that bounds the shape.
 int shape_bounding_box(
         const Shape * shape,    // Shape to de bound
         Box * box,              // INOUT: Start box. It is modified to obtain bounding box.
-        double tol              // Absolute tolerance. When change of box dimensions become smaller than tol
+        double tol,             // Absolute tolerance. When change of box dimensions become smaller than tol
                                 // the process of box reduction finishes.
+        EvalContext * ctx       // Cache of test results.
 )
 {
     double lower, upper, ratio;
     int dim, tl;
     double min_vol = tol * tol * tol;
     Box box1, box2;
+    if (ctx != NULL && ctx->octree != NULL && ctx->octree->owner == shape) {
+        // The search starts from the parts of the box, which are not known to be outside.
+        double lo[NDIM], hi[NDIM], center[NDIM];
+        if (octree_bounds(ctx->octree, lo, hi)) {
+            const double * basis[NDIM] = {box->ex, box->ey, box->ez};
+            for (int j = 0; j < NDIM; ++j) {
+                center[j] = box->center[j];
+                for (int i = 0; i < NDIM; ++i) center[j] += 0.5 * (lo[i] + hi[i]) * basis[i][j];
+            }
+            Box start;
+            box_init(&start, center, box->ex, box->ey, box->ez, hi[0] - lo[0], hi[1] - lo[1], hi[2] - lo[2]);
+            box_dispose(box);
+            *box = start;
+        }
+        // The boxes below are not parts of the subdivision.
+        ctx->octree = NULL;
+    }
     for (dim = 0; dim < NDIM; ++dim) {
         lower = 0;
         while (box->dims[dim] - lower > tol) {
             ratio = 0.5 * (lower + box->dims[dim]) / box->dims[dim];
             box_split(box, &box1, &box2, dim, ratio);
-            shape_reset_cache(shape);
-            tl = shape_ultimate_test_box(shape, &box2, min_vol, 0);
+            evalctx_reset(ctx);
+            tl = shape_ultimate_test_box(shape, &box2, min_vol, 0, ctx);
             if (tl == -1) box_copy(box, &box1);
             else lower = box1.dims[dim];
         }
@@ -273,8 +573,8 @@ int shape_bounding_box(
         while (box->dims[dim] - upper > tol) {
             ratio = 0.5 * (box->dims[dim] - upper) / box->dims[dim];
             box_split(box, &box1, &box2, dim, ratio);
-            shape_reset_cache(shape);
-            tl = shape_ultimate_test_box(shape, &box1, min_vol, 0);
+            evalctx_reset(ctx);
+            tl = shape_ultimate_test_box(shape, &box1, min_vol, 0, ctx);
             if (tl == -1) box_copy(box, &box2);
             else upper = box2.dims[dim];
         }
@@ -287,85 +587,379 @@ int shape_bounding_box(
 double shape_volume(
         const Shape * shape,    // Shape
         const Box * box,        // Box from which the process of volume finding starts
-        double min_vol          // Minimum volume - when volume of the box become smaller than min_vol the process
+        double min_vol,         // Minimum volume - when volume of the box become smaller than min_vol the process
                                 // of box splitting finishes.
+        EvalContext * ctx       // Cache of test results.
 )
 {
-    int result = shape_test_box(shape, box, 0, NULL);
-    if (result == BOX_INSIDE_SHAPE) return box->volume;   // Box totally belongs to the shape
-    if (result == BOX_OUTSIDE_SHAPE) return 0;             // Box don't belong to the shape
-    if (box->volume > min_vol) {            // Shape intersects the box
-        Box box1, box2;
-        box_split(box, &box1, &box2, BOX_SPLIT_AUTODIR, 0.5);
-        double vol1 = shape_volume(shape, &box1, min_vol);
-        double vol2 = shape_volume(shape, &box2, min_vol);
-        return vol1 + vol2;
-    } else {                        // Minimum volume has been reached, but shape still intersects box
-        return 0.5 * box->volume;   // This is statistical decision. On average a half of the box belongs to the shape.
+    BoxStack local;
+    BoxStack * stack = get_box_stack(ctx, &local);
+    size_t base = stack->len;
+    Box current, * top;
+    double vol = 0;
+    int result;
+
+    top = box_stack_push(stack, 1);
+    if (top != NULL) *top = *box;
+    else vol = 0.5 * box->volume;
+    while (stack->len > base) {
+        box_stack_pop(stack, &current);
+        result = shape_test_box(shape, &current, 0, NULL, ctx);
+        if (result == BOX_INSIDE_SHAPE) vol += current.volume;     // Box totally belongs to the shape
+        else if (result == BOX_CAN_INTERSECT_SHAPE) {               // Shape intersects the box
+            if (current.volume > min_vol && (top = box_stack_push(stack, 2)) != NULL) {
+                box_split(&current, top + 1, top, BOX_SPLIT_AUTODIR, 0.5);
+            } else {
+                // Minimum volume has been reached, but shape still intersects box.
+                // This is statistical decision. On average a half of the box belongs to the shape.
+                vol += 0.5 * current.volume;
+            }
+        }
     }
+    release_box_stack(stack, &local, base);
+    return vol;
 }
 
-// Resets cache of shape and all objects involved.
-void shape_reset_cache(Shape * shape)
+// Binary heap of boxes. The box with the largest volume is on the top.
+typedef struct BoxHeap BoxHeap;
+
+struct BoxHeap {
+    Box * boxes;
+    size_t len;
+    size_t capacity;
+};
+
+static int box_heap_push(BoxHeap * heap, const Box * box)
 {
-    shape->last_box = 0;
-    if (is_final(shape->opc)) {
-        shape->args.surface->last_box = 0;
-    } else if (is_composite(shape->opc)) {
-        for (int i = 0; i < shape->alen; ++i) {
-            shape_reset_cache((shape->args.shapes)[i]);
+    if (heap->len == heap->capacity) {
+        size_t capacity = heap->capacity ? 2 * heap->capacity : 64;
+        Box * boxes = (Box *) realloc(heap->boxes, capacity * sizeof(Box));
+        if (boxes == NULL) return SHAPE_NO_MEMORY;
+        heap->boxes = boxes;
+        heap->capacity = capacity;
+    }
+    size_t i = heap->len++, parent;
+    while (i > 0) {
+        parent = (i - 1) / 2;
+        if (heap->boxes[parent].volume >= box->volume) break;
+        heap->boxes[i] = heap->boxes[parent];
+        i = parent;
+    }
+    heap->boxes[i] = *box;
+    return SHAPE_SUCCESS;
+}
+
+static void box_heap_pop(BoxHeap * heap, Box * box)
+{
+    *box = heap->boxes[0];
+    Box last = heap->boxes[--heap->len];
+    size_t i = 0, child;
+    while ((child = 2 * i + 1) < heap->len) {
+        if (child + 1 < heap->len && heap->boxes[child + 1].volume > heap->boxes[child].volume) ++child;
+        if (last.volume >= heap->boxes[child].volume) break;
+        heap->boxes[i] = heap->boxes[child];
+        i = child;
+    }
+    if (heap->len > 0) heap->boxes[i] = last;
+}
+
+// Gets volume of the shape with error bound. Boxes, which may intersect the shape,
+// are refined in order of decreasing volume until the tolerance is reached.
+int shape_volume_adaptive(
+        const Shape * shape,    // Shape
+        const Box * box,        // Box from which the process of volume finding starts
+        double min_vol,         // Boxes smaller than min_vol are not split
+        double atol,            // Absolute tolerance
+        double rtol,            // Relative tolerance
+        EvalContext * ctx,      // Cache of test results.
+        double * volume,        // OUT: Volume estimation
+        double * error          // OUT: Maximal error of the volume estimation
+)
+{
+    BoxHeap heap = {NULL, 0, 0};
+    Box current, box1, box2;
+    const Box * parts[2] = {&box1, &box2};
+    double inside = 0, unresolved = 0;
+    int i, status = SHAPE_SUCCESS;
+
+    // Volume of each box, which may intersect the shape, is uncertain: any part of
+    // it can belong to the shape. The estimation takes a half of it.
+    int result = shape_test_box(shape, box, 0, NULL, ctx);
+    if (result == BOX_INSIDE_SHAPE) inside = box->volume;
+    else if (result == BOX_CAN_INTERSECT_SHAPE) {
+        unresolved = box->volume;
+        status = box_heap_push(&heap, box);
+    }
+
+    while (status == SHAPE_SUCCESS && heap.len > 0) {
+        if (0.5 * unresolved <= atol || 0.5 * unresolved <= rtol * (inside + 0.5 * unresolved)) break;
+        if (heap.boxes[0].volume <= min_vol) break;   // All the remaining boxes are too small.
+        box_heap_pop(&heap, &current);
+        unresolved -= current.volume;
+        box_split(&current, &box1, &box2, BOX_SPLIT_AUTODIR, 0.5);
+        for (i = 0; i < 2 && status == SHAPE_SUCCESS; ++i) {
+            result = shape_test_box(shape, parts[i], 0, NULL, ctx);
+            if (result == BOX_INSIDE_SHAPE) inside += parts[i]->volume;
+            else if (result == BOX_CAN_INTERSECT_SHAPE) {
+                unresolved += parts[i]->volume;
+                status = box_heap_push(&heap, parts[i]);
+            }
+        }
+    }
+    // Recalculate the sum of unresolved volumes to get rid of the rounding errors.
+    unresolved = 0;
+    for (size_t j = 0; j < heap.len; ++j) unresolved += heap.boxes[j].volume;
+    free(heap.boxes);
+    *volume = inside + 0.5 * unresolved;
+    *error = 0.5 * unresolved;
+    return status;
+}
+
+// Estimates volume of the shape by Monte Carlo method.
+int shape_volume_mc(
+        const Shape * shape,    // Shape
+        const Box * box,        // Box, where random points are generated
+        size_t max_points,      // Maximal number of points to be generated
+        unsigned int seed,      // Seed of random generator
+        double target_rel_err,  // Target relative error. When it is reached, generation stops.
+                                // If it is 0, all max_points points are used.
+        double * volume,        // OUT: Volume estimation
+        double * error          // OUT: Standard deviation of volume estimation
+)
+{
+    Box local;
+    box_copy(&local, box);
+    if (vslNewStream(&local.rng, VSL_BRNG_MT19937, seed) != VSL_STATUS_OK) return SHAPE_FAILURE;
+
+    size_t batch = (max_points < MC_BATCH) ? max_points : MC_BATCH;
+    double * points = (double *) malloc(batch * NDIM * sizeof(double));
+    char * result = (char *) malloc(batch * sizeof(char));
+    int status = SHAPE_SUCCESS;
+    if (points == NULL || result == NULL) status = SHAPE_NO_MEMORY;
+
+    size_t n = 0, hits = 0, i, m;
+    double p;
+    *volume = 0;
+    *error = 0;
+    while (status == SHAPE_SUCCESS && n < max_points) {
+        m = (max_points - n < batch) ? max_points - n : batch;
+        if (box_generate_random_points(&local, m, points) != BOX_SUCCESS) {
+            status = SHAPE_FAILURE;
+            break;
         }
+        status = shape_test_points(shape, m, points, result);
+        for (i = 0; i < m; ++i) hits += result[i] > 0;
+        n += m;
+        p = (double) hits / n;
+        *volume = p * box->volume;
+        *error = box->volume * sqrt(p * (1 - p) / n);
+        if (target_rel_err > 0 && hits > 0 && *error <= target_rel_err * *volume) break;
     }
+    free(points);
+    free(result);
+    box_dispose(&local);
+    return status;
 }
 
 // Resets collected statistics or initializes statistics storage
 void shape_reset_stat(Shape * shape)
 {
-    StatUnit * s;
-    while ((s = rbtree_pop(shape->stats, NULL)) != NULL) {
-        free(s->arr);
-        free(s);
-    }
-    shape->last_box = 0;
+    statset_clear(shape->stats);
     if (is_composite(shape->opc) && shape->args.shapes != NULL) {
-        for (int i = 0; i < shape->alen; ++i) {
+        for (size_t i = 0; i < shape->alen; ++i) {
             if (shape->args.shapes[i] != NULL)
                 shape_reset_stat(shape->args.shapes[i]);
         }
     }
 }
 
+// Stores statistics collected in the context to the shape.
+void shape_store_statistics(
+        Shape * shape,          // Shape
+        const EvalContext * ctx,// Context, where statistics was collected.
+        char replace            // Whether to drop statistics stored before.
+)
+{
+    if (replace) statset_clear(shape->stats);
+    const StatSet * stats = evalctx_find_stats(ctx, shape);
+    if (stats != NULL) statset_merge(shape->stats, stats);
+}
+
 // Gets shape's contour.Returns the number of points in the contour.
 size_t shape_contour(
         const Shape * shape,    // Shape
         const Box * box,        // Box, where contour is needed.
         double min_vol,         // Size of volume to be considered as point
-        double * buffer         // Buffer, where points are put.
+        double * buffer,        // Buffer, where points are put.
+        EvalContext * ctx       // Cache of test results.
 )
 {
-    int result = shape_test_box(shape, box, 0, NULL);
-    if (result == BOX_INSIDE_SHAPE || result == BOX_OUTSIDE_SHAPE) return 0;
-    if (box->volume > min_vol) {
-        Box box1, box2;
-        box_split(box, &box1, &box2, BOX_SPLIT_AUTODIR, 0.5);
-        int n1 = shape_contour(shape, &box1, min_vol, buffer);
-        int n2 = shape_contour(shape, &box2, min_vol, buffer + n1 * NDIM);
-        return n1 + n2;
-    } else {
-        for (int i = 0; i < NDIM; ++i) *(buffer + i) = box->center[i];
-        return 1;
+    BoxStack local;
+    BoxStack * stack = get_box_stack(ctx, &local);
+    size_t base = stack->len, n = 0;
+    Box current, * top;
+
+    top = box_stack_push(stack, 1);
+    if (top != NULL) *top = *box;
+    while (stack->len > base) {
+        box_stack_pop(stack, &current);
+        if (shape_test_box(shape, &current, 0, NULL, ctx) != BOX_CAN_INTERSECT_SHAPE) continue;
+        if (current.volume > min_vol && (top = box_stack_push(stack, 2)) != NULL) {
+            box_split(&current, top + 1, top, BOX_SPLIT_AUTODIR, 0.5);
+        } else {
+            for (int i = 0; i < NDIM; ++i) *(buffer + n * NDIM + i) = current.center[i];
+            ++n;
+        }
     }
+    release_box_stack(stack, &local, base);
+    return n;
 }
 
 // Collects statistics about shape.
-void shape_collect_statistics(
+int shape_collect_statistics(
         Shape * shape,          // Shape
         const Box * box,        // Global box, where statistics is collected
-        double min_vol          // minimal volume, when splitting process stops.
+        double min_vol,         // minimal volume, when splitting process stops.
+        const StatRefinement * refinement,  // Refinement of boxes. NULL - uniform.
+        EvalContext * ctx       // Cache of test results.
+)
+{
+    ultimate_test_box(shape, box, min_vol, 1, refinement, ctx);
+    return ctx->exhausted ? SHAPE_BUDGET_EXCEEDED : SHAPE_SUCCESS;
+}
+
+// Counts surfaces of the shape, which were tested to be zero for the box, with repetitions.
+static int count_zero_leaves(const Shape * shape, uint64_t subdiv, const EvalContext * ctx)
+{
+    int n = 0;
+    if (is_final(shape->opc)) {
+        CacheEntry * cached = evalctx_lookup(ctx, shape->args.surface);
+        n = (cached != NULL && cached->subdiv == subdiv && cached->result == 0);
+    } else if (is_composite(shape->opc)) {
+        for (size_t i = 0; i < shape->alen; ++i)
+            n += count_zero_leaves(shape->args.shapes[i], subdiv, ctx);
+    }
+    return n;
+}
+
+// Counts distinct surfaces of the shape, which were tested to be zero for the box.
+static int count_zero_surfaces(const Shape * shape, uint64_t subdiv, EvalContext * ctx)
+{
+    int n = count_zero_leaves(shape, subdiv, ctx);
+    if (n <= 1) return n;
+    const Surface ** zs = (const Surface **) evalctx_alloc(ctx, n * sizeof(Surface *));
+    if (zs == NULL) return n;
+    n = set_zero_surface_pointers(shape, 0, zs, subdiv, ctx);
+    evalctx_free(ctx, zs);
+    return n;
+}
+
+// List of the shapes, which are to be tested in a box on the stack of sweep_box.
+typedef struct SweepFrame SweepFrame;
+
+struct SweepFrame {
+    size_t start;       // Index of the first shape in the lists.
+    size_t len;         // The number of shapes.
+};
+
+// Grows the array of items of the given size to hold n items at least.
+static int reserve_items(void ** items, size_t * capacity, size_t n, size_t size)
+{
+    if (n <= *capacity) return SHAPE_SUCCESS;
+    void * grown = realloc(*items, 2 * n * size);
+    if (grown == NULL) return SHAPE_NO_MEMORY;
+    *items = grown;
+    *capacity = 2 * n;
+    return SHAPE_SUCCESS;
+}
+
+// Collects statistics of the shapes, which can intersect the box, and goes on
+// with the parts of the box for the shapes, which need further splitting.
+// The boxes are processed depth first on the stack of boxes as in
+// ultimate_test_box. Every box on the stack refers to the list of shapes to be
+// tested in it. The lists are kept one after another in the order of the boxes,
+// so the lists of the parts of a box are above its own list, and the lists
+// above the list of the popped box belong to the boxes already processed.
+static void sweep_box(
+        Shape ** shapes,
+        size_t n,
+        const Box * box,
+        double min_vol,
+        EvalContext * ctx
+)
+{
+    BoxStack local;
+    BoxStack * stack = get_box_stack(ctx, &local);
+    size_t base = stack->len, lists_capacity = 0, frames_capacity = 0;
+    Shape ** lists = NULL;
+    SweepFrame * frames = NULL;
+    int * zeros = (int *) malloc(n * sizeof(int));
+    Box current, * top = box_stack_push(stack, 1);
+    size_t i, m, k, len;
+    int zero_surfaces;
+
+    if (zeros == NULL || top == NULL ||
+        reserve_items((void **) &lists, &lists_capacity, n, sizeof(Shape *)) != SHAPE_SUCCESS ||
+        reserve_items((void **) &frames, &frames_capacity, 1, sizeof(SweepFrame)) != SHAPE_SUCCESS) {
+        stack->len = base;
+    } else {
+        *top = *box;
+        for (i = 0; i < n; ++i) lists[i] = shapes[i];
+        frames[0].start = 0;
+        frames[0].len = n;
+    }
+    while (stack->len > base) {
+        if (evalctx_spend(ctx, 1)) break;
+        k = stack->len - 1 - base;
+        SweepFrame frame = frames[k];
+        box_stack_pop(stack, &current);
+        len = frame.start + frame.len;
+        if (reserve_items((void **) &lists, &lists_capacity, len + frame.len, sizeof(Shape *)) != SHAPE_SUCCESS)
+            continue;
+        Shape ** in = lists + frame.start, ** rest = lists + len;
+        // All the shapes are tested first, so every surface is tested once for the box.
+        for (i = 0, m = 0; i < frame.len; ++i) {
+            zeros[m] = 0;
+            if (shape_test_box(in[i], &current, 1, zeros + m, ctx) == BOX_CAN_INTERSECT_SHAPE)
+                rest[m++] = in[i];
+        }
+        // The same decisions as in shape_ultimate_test_box. Zero surfaces, which were
+        // tested for other shapes first, are not counted by shape_test_box. So they
+        // are counted again, if the number matters.
+        for (i = 0, n = 0; i < m; ++i) {
+            zero_surfaces = zeros[i];
+            if (current.volume < min_vol) zero_surfaces = count_zero_leaves(rest[i], current.subdiv, ctx);
+            else if (zero_surfaces < 2) zero_surfaces = count_zero_surfaces(rest[i], current.subdiv, ctx);
+            if (zero_surfaces == 1 || current.volume < min_vol) {
+                vary_zero_surfaces(rest[i], &current, 1, zero_surfaces, ctx);
+            } else if (current.volume > min_vol) {
+                rest[n++] = rest[i];
+            }
+        }
+        if (n == 0 || reserve_items((void **) &frames, &frames_capacity, k + 2, sizeof(SweepFrame)) != SHAPE_SUCCESS)
+            continue;
+        if ((top = box_stack_push(stack, 2)) == NULL) continue;
+        box_split(&current, top + 1, top, BOX_SPLIT_AUTODIR, 0.5);
+        frames[k].start = frames[k + 1].start = len;
+        frames[k].len = frames[k + 1].len = n;
+    }
+    free(zeros);
+    free(lists);
+    free(frames);
+    release_box_stack(stack, &local, base);
+}
+
+// Collects statistics about several shapes at once.
+int shape_collect_statistics_shared(
+        Shape ** shapes,        // Shapes
+        size_t n,               // The number of shapes
+        const Box * box,        // Global box, where statistics is collected
+        double min_vol,         // minimal volume, when splitting process stops.
+        EvalContext * ctx       // Cache of test results.
 )
 {
-    shape_reset_stat(shape);
-    shape_ultimate_test_box(shape, box, min_vol, 1);
+    sweep_box(shapes, n, box, min_vol, ctx);
+    return ctx->exhausted ? SHAPE_BUDGET_EXCEEDED : SHAPE_SUCCESS;
 }
 
 // Gets statistics table
@@ -377,13 +971,12 @@ char * shape_get_stat_table(
 {
     *nrows = shape->stats->len;
     *ncols = shape->alen;
-    char * table = malloc(*ncols * *nrows * sizeof(char));
-    StatUnit ** statarr = rbtree_to_array(shape->stats);
-    size_t i, j;
-    for (i = 0; i < *nrows; ++i)
-        for (j = 0; j < *ncols; ++j)
-            *(table + i * (*ncols) + j) = statarr[i]->arr[j];
-    free(statarr);
+    // At least one byte is allocated, so NULL means only lack of memory.
+    char * table = (char *) malloc(*ncols * *nrows + 1);
+    if (table != NULL && statset_unpack(shape->stats, table) != STATSET_SUCCESS) {
+        free(table);
+        table = NULL;
+    }
     return table;
 }
 
@@ -8,7 +8,9 @@
 #include <stddef.h>
 
 #include "box.h"
-#include "rbtree.h"
+#include "evalctx.h"
+#include "octree.h"
+#include "statset.h"
 #include "surface.h"
 
 #define BOX_INSIDE_SHAPE        +1
@@ -20,11 +22,29 @@
 #define SHAPE_FAILURE   -1
 #define SHAPE_NO_MEMORY -2
 #define SHAPE_WRONG_ARGLENGTH -3
+#define SHAPE_BUDGET_EXCEEDED -4
+
+// The largest number of surfaces intersecting a box, whose senses are varied
+// before the box reaches the minimal volume (see StatRefinement).
+#define SHAPE_VARY_LIMIT 8
 
 #define invert_opc(opc) ((opc + 3) % 6)
 
 
 typedef struct Shape Shape;
+typedef struct StatRefinement StatRefinement;
+
+/* Refinement of statistics collection. A box, which is intersected by not more
+ * than SHAPE_VARY_LIMIT surfaces, is not split further, if its volume is less
+ * than coarse_vol or none of the surfaces to refine intersect it. Senses of the
+ * surfaces are varied instead. Extra rows of statistics can appear, they can
+ * only prevent removal of arguments, so simplification remains valid.
+ */
+struct StatRefinement {
+    double coarse_vol;          // Volume of the coarse boxes. 0 - split up to min_vol.
+    const Surface ** surfaces;  // Surfaces to refine. NULL - all the surfaces.
+    size_t len;                 // The number of surfaces to refine.
+};
 
 enum Operation {INTERSECTION=0, COMPLEMENT, EMPTY, UNION, IDENTITY, UNIVERSE};
 
@@ -36,9 +56,8 @@ struct Shape {
         Surface * surface;
         Shape ** shapes;
     } args;                 // Pointer to arguments. It can be either Shape or Surface structures
-    uint64_t last_box;      // Subdivision code of last tested box
-    int last_box_result;    // Result of last test_box call.
-    RBTree * stats;         // Statistics about argument results.
+    StatSet * stats;        // Distinct rows of argument results (statistics).
+    Octree * octree;        // Cache of box test results. NULL - results are not kept.
 };
 
 // Initializes shape struct
@@ -54,21 +73,44 @@ void shape_dealloc(Shape * shape);
 // Tests box location with respect to the shape.
 // Returns BOX_INSIDE_SHAPE | BOX_CAN_INTERSECT_SHAPE | BOX_OUTSIDE_SHAPE
 //
+// Results of box tests are cached in the evaluation context ctx. If collect is on,
+// statistics is collected in the context too (see shape_store_statistics). Shapes
+// and surfaces are not modified, so they can be used simultaneously by several
+// threads, each with its own context.
+// ctx can be NULL - no caching then; statistics collection requires the context.
 int shape_test_box(
-        Shape * shape,          // Shape to test.
+        const Shape * shape,    // Shape to test.
         const Box * box,        // Box to test.
         char collect,           // Collect statistics about results.
-        int * zero_surfaces     // The number of surfaces that was tested to be zero.
+        int * zero_surfaces,    // The number of surfaces that was tested to be zero.
+        EvalContext * ctx       // Cache of test results.
+);
+
+// Tests locations of a batch of boxes with respect to the shape. All the boxes
+// have the same basis. If the module is built with OpenMP, the boxes are
+// distributed among threads, each with its own evaluation context.
+// result[i] is BOX_INSIDE_SHAPE | BOX_CAN_INTERSECT_SHAPE | BOX_OUTSIDE_SHAPE.
+// Returns SHAPE_SUCCESS | SHAPE_NO_MEMORY
+int shape_test_boxes(
+        const Shape * shape,    // Shape to test.
+        size_t nbox,            // The number of boxes.
+        const double * centers, // Centers of the boxes - NDIM * nbox
+        const double * dims,    // Dimensions of the boxes.
+        size_t dims_stride,     // NDIM if every box has its own dimensions, 0 - if dims are common.
+        const double * basis,   // Basis vectors ex, ey, ez - NDIM * NDIM
+        int nthreads,           // The number of threads. 0 - default.
+        char * result           // OUT: Results of the tests. It must have length nbox.
 );
 
 // Tests box location with respect to the shape. It tries to find out
 // if the box really intersects the shape with desired accuracy.
 // Returns BOX_INSIDE_SHAPE | BOX_CAN_INTERSECT_SHAPE | BOX_OUTSIDE_SHAPE
 int shape_ultimate_test_box(
-        Shape * shape,          // Pointer to shape
+        const Shape * shape,    // Pointer to shape
         const Box * box,        // box
         double min_vol,         // minimal volume until which splitting process goes.
-        char collect            // Whether to collect statistics about results.
+        char collect,           // Whether to collect statistics about results.
+        EvalContext * ctx       // Cache of test results.
 );
 
 // Tests whether points belong to this shape.
@@ -86,16 +128,47 @@ int shape_test_points(
 int shape_bounding_box(
         const Shape * shape,    // Shape to de bound
         Box * box,              // INOUT: Start box. It is modified to obtain bounding box.
-        double tol              // Absolute tolerance. When change of box dimensions become smaller than tol
+        double tol,             // Absolute tolerance. When change of box dimensions become smaller than tol
                                 // the process of box reduction finishes.
+        EvalContext * ctx       // Cache of test results.
 );
 
 // Gets volume of the shape
 double shape_volume(
         const Shape * shape,    // Shape
         const Box * box,        // Box from which the process of volume finding starts
-        double min_vol          // Minimum volume - when volume of the box become smaller than min_vol the process
+        double min_vol,         // Minimum volume - when volume of the box become smaller than min_vol the process
                                 // of box splitting finishes.
+        EvalContext * ctx       // Cache of test results.
+);
+
+// Gets volume of the shape with guaranteed error bound. The boxes, that may
+// intersect the shape, are refined in order of decreasing volume until
+// max_error <= max(atol, rtol * volume) or all of them are smaller than min_vol.
+// max_error is a half of the total volume of such boxes.
+// Returns SHAPE_SUCCESS | SHAPE_NO_MEMORY
+int shape_volume_adaptive(
+        const Shape * shape,    // Shape
+        const Box * box,        // Box from which the process of volume finding starts
+        double min_vol,         // Boxes smaller than min_vol are not split
+        double atol,            // Absolute tolerance
+        double rtol,            // Relative tolerance
+        EvalContext * ctx,      // Cache of test results.
+        double * volume,        // OUT: Volume estimation
+        double * error          // OUT: Maximal error of the volume estimation
+);
+
+// Estimates volume of the shape by Monte Carlo method. The points are generated
+// by batches until target relative error or max_points is reached.
+// Returns SHAPE_SUCCESS | SHAPE_NO_MEMORY | SHAPE_FAILURE
+int shape_volume_mc(
+        const Shape * shape,    // Shape
+        const Box * box,        // Box, where random points are generated
+        size_t max_points,      // Maximal number of points to be generated
+        unsigned int seed,      // Seed of random generator
+        double target_rel_err,  // Target relative error. If it is 0, all max_points points are used.
+        double * volume,        // OUT: Volume estimation
+        double * error          // OUT: Standard deviation of volume estimation
 );
 
 // Gets shape's contour
@@ -103,23 +176,76 @@ size_t shape_contour(
         const Shape * shape,    // Shape
         const Box * box,        // Box, where contour is needed.
         double min_vol,         // Size of volume to be considered as point
-        double * buffer         // Buffer, where points are put.
+        double * buffer,        // Buffer, where points are put.
+        EvalContext * ctx       // Cache of test results.
+);
+
+/* Enables cache of box test results of the shape for computations starting
+ * from the root box. The results cached are dropped. At most max_len boxes are kept.
+ * Returns SHAPE_SUCCESS | SHAPE_NO_MEMORY
+ */
+int shape_enable_octree(Shape * shape, const Box * root, size_t max_len);
+
+// Drops the cache of box test results.
+void shape_disable_octree(Shape * shape);
+
+/* Tests whether points belong to this shape. Points in the boxes of the octree,
+ * which are known to be inside or outside the shape, are not tested. tree can be NULL.
+ * Returns SHAPE_SUCCESS | SHAPE_NO_MEMORY
+ */
+int shape_locate_points(
+        const Shape * shape,    // test shape
+        const Octree * tree,    // Cache of box test results of the shape.
+        size_t npts,            // the number of points
+        const double * points,  // array of points - NDIM * npts
+        char * result           // Result - +1 if point belongs to shape, -1
+                                // otherwise. It must have length npts.
 );
 
 // Resets collected statistics or initializes statistics storage
 void shape_reset_stat(Shape * shape);
 
-// Resets cache of shape and all objects involved.
-void shape_reset_cache(Shape * shape);
+/* Stores statistics of the shape collected in the context (see shape_test_box).
+ * Statistics of the arguments is not stored, the caller does it for every shape
+ * it needs. Concurrent calls for the same shape must be serialized by the caller.
+ */
+void shape_store_statistics(
+        Shape * shape,          // Shape
+        const EvalContext * ctx,// Context, where statistics was collected.
+        char replace            // Whether to drop statistics stored before.
+);
 
-// Collects statistics about shapes.
-void shape_collect_statistics(
+// Collects statistics about shapes in the context (see shape_store_statistics).
+// The process is limited by the budget of the context. If the budget is
+// exhausted, the statistics is incomplete.
+// Returns SHAPE_SUCCESS | SHAPE_BUDGET_EXCEEDED
+int shape_collect_statistics(
         Shape * shape,          // Shape
         const Box * box,        // Global box, where statistics is collected
-        double min_vol          // minimal volume, when splitting process stops.
+        double min_vol,         // minimal volume, when splitting process stops.
+        const StatRefinement * refinement,  // Refinement of boxes. NULL - uniform.
+        EvalContext * ctx       // Cache of test results.
+);
+
+/* Collects statistics about several shapes at once, for example, cells of
+ * a universe. The box is subdivided once for all the shapes, and every part
+ * is tested only for the shapes, which can intersect it. So a surface shared by
+ * the shapes is tested once per box. The statistics of every shape is the same
+ * as the one collected by shape_collect_statistics. It is kept in the context,
+ * which must not be NULL.
+ * Returns SHAPE_SUCCESS | SHAPE_BUDGET_EXCEEDED
+ */
+int shape_collect_statistics_shared(
+        Shape ** shapes,        // Shapes
+        size_t n,               // The number of shapes
+        const Box * box,        // Global box, where statistics is collected
+        double min_vol,         // minimal volume, when splitting process stops.
+        EvalContext * ctx       // Cache of test results.
 );
 
-// Gets statistics table
+// Gets statistics table - distinct rows of argument results, sorted in
+// ascending order. The table is allocated by malloc and must be freed by
+// the caller. Returns NULL if there's no memory.
 char * shape_get_stat_table(
         Shape * shape,          // Shape
         size_t * nrows,         // number of rows
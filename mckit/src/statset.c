@@ -0,0 +1,195 @@
+#include <stdlib.h>
+#include <string.h>
+#include "statset.h"
+
+#define VALUES_PER_WORD 32
+#define STATSET_INITIAL_CAPACITY 64
+
+#define row_ptr(set, i) ((set)->rows + (i) * (set)->words)
+
+static uint64_t hash_row(const uint64_t * row, size_t words)
+{
+    uint64_t h = 0x9e3779b97f4a7c15ull;
+    size_t i;
+    for (i = 0; i < words; ++i) {
+        h ^= row[i];
+        h *= 0xff51afd7ed558ccdull;
+        h ^= h >> 33;
+    }
+    return h;
+}
+
+// Packs row of values into words. -1, 0, +1 are stored as 0, 1, 2.
+static void pack_row(const char * row, size_t ncols, uint64_t * packed, size_t words)
+{
+    size_t i;
+    memset(packed, 0, words * sizeof(uint64_t));
+    for (i = 0; i < ncols; ++i) {
+        uint64_t code = (uint64_t) (row[i] + 1);
+        packed[i / VALUES_PER_WORD] |= code << (62 - 2 * (i % VALUES_PER_WORD));
+    }
+}
+
+static void unpack_row(const uint64_t * packed, size_t ncols, char * row)
+{
+    size_t i;
+    for (i = 0; i < ncols; ++i) {
+        uint64_t code = packed[i / VALUES_PER_WORD] >> (62 - 2 * (i % VALUES_PER_WORD));
+        row[i] = (char) (code & 3) - 1;
+    }
+}
+
+static int compare_rows(const uint64_t * a, const uint64_t * b, size_t words)
+{
+    size_t i;
+    for (i = 0; i < words; ++i) {
+        if (a[i] < b[i]) return -1;
+        else if (a[i] > b[i]) return 1;
+    }
+    return 0;
+}
+
+// Finds slot for the packed row: either the slot of the equal row or an empty one.
+static size_t * find_slot(const StatSet * set, const uint64_t * packed, uint64_t h)
+{
+    size_t mask = set->capacity - 1;
+    size_t i = (size_t) h & mask;
+    while (set->slots[i] != 0) {
+        const uint64_t * row = row_ptr(set, set->slots[i] - 1);
+        if (memcmp(row, packed, set->words * sizeof(uint64_t)) == 0) break;
+        i = (i + 1) & mask;
+    }
+    return set->slots + i;
+}
+
+static int grow_slots(StatSet * set)
+{
+    size_t capacity = (set->capacity == 0) ? STATSET_INITIAL_CAPACITY : 2 * set->capacity;
+    size_t * slots = (size_t *) calloc(capacity, sizeof(size_t));
+    if (slots == NULL) return STATSET_NO_MEMORY;
+    free(set->slots);
+    set->slots = slots;
+    set->capacity = capacity;
+    size_t mask = capacity - 1, r;
+    for (r = 0; r < set->len; ++r) {
+        size_t i = (size_t) hash_row(row_ptr(set, r), set->words) & mask;
+        while (slots[i] != 0) i = (i + 1) & mask;
+        slots[i] = r + 1;
+    }
+    return STATSET_SUCCESS;
+}
+
+static int grow_rows(StatSet * set)
+{
+    size_t row_capacity = (set->row_capacity == 0) ? STATSET_INITIAL_CAPACITY / 2 : 2 * set->row_capacity;
+    uint64_t * rows = (uint64_t *) realloc(set->rows, row_capacity * set->words * sizeof(uint64_t));
+    if (rows == NULL) return STATSET_NO_MEMORY;
+    set->rows = rows;
+    set->row_capacity = row_capacity;
+    return STATSET_SUCCESS;
+}
+
+void statset_init(StatSet * set, size_t ncols)
+{
+    set->ncols = ncols;
+    set->words = (ncols + VALUES_PER_WORD - 1) / VALUES_PER_WORD;
+    if (set->words == 0) set->words = 1;
+    set->len = 0;
+    set->row_capacity = 0;
+    set->rows = NULL;
+    set->slots = NULL;
+    set->capacity = 0;
+}
+
+void statset_dispose(StatSet * set)
+{
+    free(set->rows);
+    free(set->slots);
+    set->rows = NULL;
+    set->slots = NULL;
+    set->len = 0;
+    set->row_capacity = 0;
+    set->capacity = 0;
+}
+
+void statset_clear(StatSet * set)
+{
+    set->len = 0;
+    if (set->slots != NULL) memset(set->slots, 0, set->capacity * sizeof(size_t));
+}
+
+// Reserves place for one more row. Returns the place of the next row or NULL.
+static uint64_t * reserve_row(StatSet * set)
+{
+    // Keep load factor below 1/2.
+    if (2 * (set->len + 1) > set->capacity && grow_slots(set) != STATSET_SUCCESS) return NULL;
+    if (set->len == set->row_capacity && grow_rows(set) != STATSET_SUCCESS) return NULL;
+    return row_ptr(set, set->len);
+}
+
+// Adds the row, which is already put in place of the next row.
+static void commit_row(StatSet * set, const uint64_t * packed)
+{
+    size_t * slot = find_slot(set, packed, hash_row(packed, set->words));
+    if (*slot == 0) *slot = ++set->len;
+}
+
+int statset_add(StatSet * set, const char * row)
+{
+    // The row is packed in place of the next row, so it is not copied when added.
+    uint64_t * packed = reserve_row(set);
+    if (packed == NULL) return STATSET_NO_MEMORY;
+    pack_row(row, set->ncols, packed, set->words);
+    commit_row(set, packed);
+    return STATSET_SUCCESS;
+}
+
+int statset_merge(StatSet * set, const StatSet * other)
+{
+    size_t r;
+    for (r = 0; r < other->len; ++r) {
+        uint64_t * packed = reserve_row(set);
+        if (packed == NULL) return STATSET_NO_MEMORY;
+        memcpy(packed, row_ptr(other, r), set->words * sizeof(uint64_t));
+        commit_row(set, packed);
+    }
+    return STATSET_SUCCESS;
+}
+
+// Sorts row numbers index[0..n) by rows. Bottom up merge sort, tmp has length n.
+static void sort_rows(const StatSet * set, size_t * index, size_t * tmp, size_t n)
+{
+    size_t width, i, * src = index, * dst = tmp, * t;
+    for (width = 1; width < n; width *= 2) {
+        for (i = 0; i < n; i += 2 * width) {
+            size_t lo = i, mid = i + width, hi = i + 2 * width, a = lo, b, k = lo;
+            if (mid > n) mid = n;
+            if (hi > n) hi = n;
+            b = mid;
+            while (a < mid && b < hi) {
+                if (compare_rows(row_ptr(set, src[b]), row_ptr(set, src[a]), set->words) < 0) dst[k++] = src[b++];
+                else dst[k++] = src[a++];
+            }
+            while (a < mid) dst[k++] = src[a++];
+            while (b < hi) dst[k++] = src[b++];
+        }
+        t = src;
+        src = dst;
+        dst = t;
+    }
+    if (src != index) memcpy(index, src, n * sizeof(size_t));
+}
+
+int statset_unpack(const StatSet * set, char * table)
+{
+    if (set->len == 0) return STATSET_SUCCESS;
+    size_t * index = (size_t *) malloc(2 * set->len * sizeof(size_t));
+    if (index == NULL) return STATSET_NO_MEMORY;
+    size_t i;
+    for (i = 0; i < set->len; ++i) index[i] = i;
+    sort_rows(set, index, index + set->len, set->len);
+    for (i = 0; i < set->len; ++i)
+        unpack_row(row_ptr(set, index[i]), set->ncols, table + i * set->ncols);
+    free(index);
+    return STATSET_SUCCESS;
+}
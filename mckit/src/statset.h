@@ -0,0 +1,55 @@
+#ifndef __STATSET_H
+#define __STATSET_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#define STATSET_SUCCESS    0
+#define STATSET_NO_MEMORY -1
+
+typedef struct StatSet StatSet;
+
+/* Set of distinct rows of argument results (-1, 0, +1), collected for a shape.
+ *
+ * Every value is packed into 2 bits, 32 values per 64-bit word, the first value
+ * in the highest bits. Rows are stored contiguously in insertion order, so
+ * comparison of rows word by word is lexicographic comparison of the values.
+ * The index is an open addressing hash table of row numbers.
+ */
+struct StatSet {
+    size_t ncols;           // The number of values in a row.
+    size_t words;           // The number of words per row.
+    size_t len;             // The number of rows.
+    size_t row_capacity;    // The number of rows the storage can hold.
+    uint64_t * rows;        // Packed rows - words * row_capacity.
+    size_t * slots;         // Hash table: row number + 1, 0 - empty slot.
+    size_t capacity;        // The number of slots. Always power of 2.
+};
+
+// Initializes the set for rows of ncols values.
+void statset_init(StatSet * set, size_t ncols);
+
+// Frees memory allocated for the set.
+void statset_dispose(StatSet * set);
+
+// Removes all the rows. The memory is kept for reuse.
+void statset_clear(StatSet * set);
+
+/* Adds the row of ncols values, if it is not in the set yet.
+ * Returns STATSET_SUCCESS | STATSET_NO_MEMORY
+ */
+int statset_add(StatSet * set, const char * row);
+
+/* Adds the rows of the other set, which must have the same number of values
+ * in a row.
+ * Returns STATSET_SUCCESS | STATSET_NO_MEMORY
+ */
+int statset_merge(StatSet * set, const StatSet * other);
+
+/* Unpacks all the rows to table - len * ncols values. The rows are sorted
+ * in ascending lexicographic order.
+ * Returns STATSET_SUCCESS | STATSET_NO_MEMORY
+ */
+int statset_unpack(const StatSet * set, char * table);
+
+#endif
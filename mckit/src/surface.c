@@ -1,8 +1,10 @@
 #include <stdlib.h>
 #include <math.h>
+#include <float.h>
 #include "nlopt.h"
 #include "mkl.h"
 #include "surface.h"
+#include "kstat.h"
 
 // dvp:
 // Don't use "standard" macro "max": it can cause not obvious effects.
@@ -12,8 +14,6 @@
 # undef max
 #endif
 
-#define surface_INIT(surf) (surf)->last_box = 0; (surf)->last_box_result = 0;
-
 static double _max(double a, double b)
 {
     return (a < b)? b : a;
@@ -257,7 +257,6 @@ int plane_init(
 )
 {
     int i;
-    surface_INIT((Surface *) surf)
     surf->base.type = PLANE;
     surf->offset = offset;
     for (i = 0; i < NDIM; ++i) {
@@ -274,7 +273,6 @@ int sphere_init(
 {
     if (radius <= 0) return SURFACE_FAILURE;
     int i;
-    surface_INIT((Surface *) surf);
     surf->base.type = SPHERE;
     surf->radius = radius;
     for (i = 0; i < NDIM; ++i) {
@@ -292,7 +290,6 @@ int cylinder_init(
 {
     if (radius <= 0) return SURFACE_FAILURE;
     int i;
-    surface_INIT((Surface *) surf);
     surf->base.type = CYLINDER;
     surf->radius = radius;
     for (i = 0; i < NDIM; ++i) {
@@ -309,7 +306,6 @@ int RCC_init(
     Plane * bot
 )
 {
-    surface_INIT((Surface *) surf);
     surf->base.type = MRCC;
     surf->cyl = cyl;
     surf->top = top;
@@ -322,7 +318,6 @@ int BOX_init(
     Plane ** planes
 )
 {
-    surface_INIT((Surface *) surf);
     surf->base.type = MBOX;
     for (int i = 0; i < BOX_PLANE_NUM; ++i) {
         surf->planes[i] = planes[i];
@@ -340,7 +335,6 @@ int cone_init(
 {
     if (ta <= 0) return SURFACE_FAILURE;
     int i;
-    surface_INIT((Surface *) surf);
     surf->base.type = CONE;
     surf->ta = ta;
     surf->sheet = sheet;
@@ -362,7 +356,6 @@ int torus_init(
 {
     if (a <= 0 || b <= 0) return SURFACE_FAILURE;
     int i;
-    surface_INIT((Surface *) surf);
     surf->base.type = TORUS;
     surf->radius = radius;
     surf->a = a;
@@ -391,7 +384,6 @@ int gq_init(
 )
 {
     int i, j;
-    surface_INIT((Surface *) surf);
     surf->base.type = GQUADRATIC;
     surf->k = k;
     surf->factor = factor;
@@ -417,14 +409,658 @@ void surface_test_points(
     }
 }
 
-int surface_test_box(Surface * surf, const Box * box)
+void surface_test_points_indexed(
+    const Surface * surf,
+    size_t n,
+    const double * points,
+    const size_t * index,
+    char * result
+)
+{
+    size_t i;
+    double fval;
+    for (i = 0; i < n; ++i) {
+        fval = surface_func(NDIM, points + NDIM * index[i], NULL, (void*) surf);
+        result[i] = (int) copysign(1, fval);
+    }
+}
+
+// ========================================================================================== //
+// ============================ Analytic box tests ========================================== //
+// ========================================================================================== //
+
+// Result of analytic test, when it can't decide anything.
+#define BOX_TEST_UNKNOWN 2
+
+#define MAX_SECTION_VERTICES (NCOR + 24)
+
+/* Edges of the box as pairs of corner indices. Corners differ in a single bit
+ * of the index (see perm array in box.c).
+ */
+static const int box_edges[12][2] = {
+    {0, 4}, {1, 5}, {2, 6}, {3, 7},
+    {0, 2}, {1, 3}, {4, 6}, {5, 7},
+    {0, 1}, {2, 3}, {4, 5}, {6, 7}
+};
+
+static double dot3(const double * a, const double * b)
+{
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2];
+}
+
+static void cross3(const double * a, const double * b, double * c)
+{
+    c[0] = a[1] * b[2] - a[2] * b[1];
+    c[1] = a[2] * b[0] - a[0] * b[2];
+    c[2] = a[0] * b[1] - a[1] * b[0];
+}
+
+// Builds unit vectors u and v, which together with axis form orthonormal basis.
+static void perpendicular_basis(const double * axis, double * u, double * v)
+{
+    double h[NDIM] = {0, 0, 0};
+    int i, k = 0;
+    for (i = 1; i < NDIM; ++i) if (fabs(axis[i]) < fabs(axis[k])) k = i;
+    h[k] = 1;
+    cross3(axis, h, u);
+    double norm = sqrt(dot3(u, u));
+    for (i = 0; i < NDIM; ++i) u[i] /= norm;
+    cross3(axis, u, v);
+}
+
+// Squared distance from the origin to the segment ab on the plane.
+static double segment_distance2(const double * a, const double * b)
+{
+    double d[2] = {b[0] - a[0], b[1] - a[1]};
+    double dd = d[0] * d[0] + d[1] * d[1];
+    double t = (dd > 0) ? -(a[0] * d[0] + a[1] * d[1]) / dd : 0;
+    if (t < 0) t = 0;
+    else if (t > 1) t = 1;
+    double x = a[0] + t * d[0], y = a[1] + t * d[1];
+    return x * x + y * y;
+}
+
+static double turn(const double * o, const double * a, const double * b)
+{
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0]);
+}
+
+static char point_less(const double * a, const double * b)
+{
+    return a[0] < b[0] || (a[0] == b[0] && a[1] < b[1]);
+}
+
+/* Squared distance from the origin to convex hull of n points on the plane.
+ * Returns 0 if the origin lies inside the hull. Points are reordered.
+ */
+static double hull_distance2(size_t n, double (*pts)[2])
+{
+    size_t i, j, k = 0;
+    double tmp[2];
+    // Sort points lexicographically - there are only a few of them.
+    for (i = 1; i < n; ++i) {
+        tmp[0] = pts[i][0];
+        tmp[1] = pts[i][1];
+        for (j = i; j > 0 && point_less(tmp, pts[j - 1]); --j) {
+            pts[j][0] = pts[j - 1][0];
+            pts[j][1] = pts[j - 1][1];
+        }
+        pts[j][0] = tmp[0];
+        pts[j][1] = tmp[1];
+    }
+    // Andrew's monotone chain. Hull vertices are in counterclockwise order.
+    double hull[2 * MAX_SECTION_VERTICES][2];
+    for (i = 0; i < n; ++i) {
+        while (k >= 2 && turn(hull[k - 2], hull[k - 1], pts[i]) <= 0) --k;
+        hull[k][0] = pts[i][0];
+        hull[k++][1] = pts[i][1];
+    }
+    for (i = n - 1, j = k + 1; i-- > 0;) {
+        while (k >= j && turn(hull[k - 2], hull[k - 1], pts[i]) <= 0) --k;
+        hull[k][0] = pts[i][0];
+        hull[k++][1] = pts[i][1];
+    }
+    if (k > 1) --k;     // The last point is the same as the first one.
+
+    const double origin[2] = {0, 0};
+    char inside = k > 2;
+    double dist2 = HUGE_VAL, d;
+    for (i = 0; i < k; ++i) {
+        const double * a = hull[i];
+        const double * b = hull[(i + 1) % k];
+        if (turn(a, b, origin) < 0) inside = 0;
+        d = segment_distance2(a, b);
+        if (d < dist2) dist2 = d;
+    }
+    return inside ? 0 : dist2;
+}
+
+/* Squared distance from the line (point, axis) to the convex hull of vertices.
+ */
+static double line_distance2(
+    const double * point,
+    const double * axis,
+    size_t n,
+    const double * vertices
+)
+{
+    double u[NDIM], v[NDIM], a[NDIM];
+    double pts[MAX_SECTION_VERTICES][2];
+    perpendicular_basis(axis, u, v);
+    for (size_t i = 0; i < n; ++i) {
+        for (int j = 0; j < NDIM; ++j) a[j] = vertices[i * NDIM + j] - point[j];
+        pts[i][0] = dot3(a, u);
+        pts[i][1] = dot3(a, v);
+    }
+    return hull_distance2(n, pts);
+}
+
+// Finds point of the box nearest to the point p.
+static void box_nearest_point(const Box * box, const double * p, double * result)
+{
+    const double * basis[NDIM] = {box->ex, box->ey, box->ez};
+    double delta[NDIM], t, h;
+    int i, j;
+    for (i = 0; i < NDIM; ++i) {
+        delta[i] = p[i] - box->center[i];
+        result[i] = box->center[i];
+    }
+    for (j = 0; j < NDIM; ++j) {
+        t = dot3(delta, basis[j]);
+        h = 0.5 * box->dims[j];
+        if (t > h) t = h;
+        else if (t < -h) t = -h;
+        for (i = 0; i < NDIM; ++i) result[i] += t * basis[j][i];
+    }
+}
+
+/* Sphere: the box intersects the sphere if its nearest point is closer to the center
+ * than radius. The farthest point is a corner, it is already tested.
+ */
+static int sphere_test_box(const Sphere * surf, const Box * box)
+{
+    double p[NDIM], d[NDIM];
+    box_nearest_point(box, surf->center, p);
+    for (int i = 0; i < NDIM; ++i) d[i] = p[i] - surf->center[i];
+    return dot3(d, d) < surf->radius * surf->radius ? 0 : +1;
+}
+
+/* Cylinder: the box intersects the cylinder if the distance between the axis and
+ * the box is less than radius. It is the distance from the axis projection to the
+ * box projection on the plane normal to the axis.
+ */
+static int cylinder_test_box(const Cylinder * surf, const Box * box)
+{
+    double d2 = line_distance2(surf->point, surf->axis, NCOR, box->corners);
+    return d2 < surf->radius * surf->radius ? 0 : +1;
+}
+
+/* RCC: the box is clipped by the top and bottom planes, and the remainder is
+ * tested against the cylinder. Vertices of the clipped box are the corners between
+ * the planes and intersections of the box edges with the planes.
+ */
+static int RCC_test_box(const RCC * surf, const Box * box)
+{
+    const Plane * planes[2] = {surf->top, surf->bot};
+    // Clipping is valid only for parallel planes.
+    if (dot3(surf->top->norm, surf->bot->norm) > -1 + 1.e-12) return BOX_TEST_UNKNOWN;
+
+    double fval[2][NCOR], scale = 0;
+    int i, j, k;
+    for (k = 0; k < 2; ++k) {
+        for (i = 0; i < NCOR; ++i) {
+            fval[k][i] = plane_func(NDIM, box->corners + i * NDIM, NULL, (void *) planes[k]);
+            if (fabs(fval[k][i]) > scale) scale = fabs(fval[k][i]);
+        }
+    }
+    double eps = 1.e-12 * scale;
+
+    double vertices[MAX_SECTION_VERTICES * NDIM];
+    size_t n = 0;
+    for (i = 0; i < NCOR; ++i) {
+        if (fval[0][i] <= 0 && fval[1][i] <= 0) {
+            for (j = 0; j < NDIM; ++j) vertices[n * NDIM + j] = box->corners[i * NDIM + j];
+            ++n;
+        }
+    }
+    for (i = 0; i < 12; ++i) {
+        int a = box_edges[i][0], b = box_edges[i][1];
+        for (k = 0; k < 2; ++k) {
+            if (fval[k][a] * fval[k][b] >= 0) continue;
+            double t = fval[k][a] / (fval[k][a] - fval[k][b]);
+            double other = fval[1 - k][a] + t * (fval[1 - k][b] - fval[1 - k][a]);
+            if (other > eps) continue;
+            for (j = 0; j < NDIM; ++j) {
+                vertices[n * NDIM + j] = box->corners[a * NDIM + j] +
+                    t * (box->corners[b * NDIM + j] - box->corners[a * NDIM + j]);
+            }
+            ++n;
+        }
+    }
+    if (n == 0) return +1;      // The box lies outside the slab between the planes.
+    const Cylinder * cyl = surf->cyl;
+    double d2 = line_distance2(cyl->point, cyl->axis, n, vertices);
+    return d2 < cyl->radius * cyl->radius ? 0 : +1;
+}
+
+// Projects box onto the axis.
+static void box_projection(const Box * box, const double * axis, double * pmin, double * pmax)
+{
+    double c = dot3(box->center, axis);
+    double r = 0.5 * (box->dims[0] * fabs(dot3(box->ex, axis)) +
+                      box->dims[1] * fabs(dot3(box->ey, axis)) +
+                      box->dims[2] * fabs(dot3(box->ez, axis)));
+    *pmin = c - r;
+    *pmax = c + r;
+}
+
+// Checks if the axis separates the box and the convex polyhedron given by vertices.
+static char is_separating_axis(const Box * box, const double * axis, size_t n, const double * vertices)
+{
+    double bmin, bmax, vmin = HUGE_VAL, vmax = -HUGE_VAL, p;
+    box_projection(box, axis, &bmin, &bmax);
+    for (size_t i = 0; i < n; ++i) {
+        p = dot3(vertices + i * NDIM, axis);
+        if (p < vmin) vmin = p;
+        if (p > vmax) vmax = p;
+    }
+    return vmax < bmin || vmin > bmax;
+}
+
+/* BOX macrobody: separating axis test of two convex polyhedra. Vertices of the
+ * macrobody are found as intersections of plane triples. Candidate axes are the
+ * face normals of both bodies and cross products of their edges.
+ */
+static int BOX_test_box(const BOX * surf, const Box * box)
+{
+    double vertices[20 * NDIM];
+    double edges[15 * NDIM];
+    size_t nv = 0, ne = 0;
+    int i, j, k, l;
+    const double * n[BOX_PLANE_NUM];
+    for (i = 0; i < BOX_PLANE_NUM; ++i) n[i] = surf->planes[i]->norm;
+
+    double scale = 1;
+    for (i = 0; i < BOX_PLANE_NUM; ++i)
+        if (fabs(surf->planes[i]->offset) > scale) scale = fabs(surf->planes[i]->offset);
+
+    for (i = 0; i < BOX_PLANE_NUM; ++i) {
+        for (j = i + 1; j < BOX_PLANE_NUM; ++j) {
+            double e[NDIM];
+            cross3(n[i], n[j], e);
+            if (dot3(e, e) < 1.e-20) continue;      // Parallel planes.
+            for (l = 0; l < NDIM; ++l) edges[ne * NDIM + l] = e[l];
+            ++ne;
+            for (k = j + 1; k < BOX_PLANE_NUM; ++k) {
+                double det = dot3(e, n[k]);
+                if (fabs(det) < 1.e-10) continue;
+                // Cramer's rule for n_i x = -d_i, n_j x = -d_j, n_k x = -d_k.
+                double jk[NDIM], ki[NDIM];
+                cross3(n[j], n[k], jk);
+                cross3(n[k], n[i], ki);
+                double * x = vertices + nv * NDIM;
+                for (l = 0; l < NDIM; ++l) {
+                    x[l] = -(surf->planes[i]->offset * jk[l] + surf->planes[j]->offset * ki[l] +
+                             surf->planes[k]->offset * e[l]) / det;
+                }
+                char valid = 1;
+                for (l = 0; l < BOX_PLANE_NUM && valid; ++l)
+                    valid = plane_func(NDIM, x, NULL, surf->planes[l]) <= 1.e-10 * scale;
+                if (valid) ++nv;
+            }
+        }
+    }
+    if (nv < 4) return BOX_TEST_UNKNOWN;    // Degenerate body.
+
+    const double * basis[NDIM] = {box->ex, box->ey, box->ez};
+    double axis[NDIM];
+    for (i = 0; i < NDIM; ++i)
+        if (is_separating_axis(box, basis[i], nv, vertices)) return +1;
+    for (i = 0; i < BOX_PLANE_NUM; ++i)
+        if (is_separating_axis(box, n[i], nv, vertices)) return +1;
+    for (i = 0; i < NDIM; ++i) {
+        for (j = 0; (size_t) j < ne; ++j) {
+            cross3(basis[i], edges + j * NDIM, axis);
+            if (dot3(axis, axis) < 1.e-20) continue;
+            if (is_separating_axis(box, axis, nv, vertices)) return +1;
+        }
+    }
+    return 0;
+}
+
+/* Cone: tests the box, which corners lie outside the cone. Every nappe is tested
+ * separately. The box can't intersect the nappe if it lies behind the apex, or
+ * if the angle between the nappe axis and the box bounding sphere is greater
+ * than the cone's semi-angle. Otherwise the box center and the box point nearest to
+ * the axis are tested. If that doesn't help, the test is inconclusive.
+ */
+static int cone_test_box(const Cone * surf, const Box * box)
+{
+    double an[NCOR], a[NDIM];
+    int i, j, s;
+    for (i = 0; i < NCOR; ++i) {
+        for (j = 0; j < NDIM; ++j) a[j] = box->corners[i * NDIM + j] - surf->apex[j];
+        an[i] = dot3(a, surf->axis);
+    }
+    double w[NDIM], p[NDIM], q[NDIM];
+    for (j = 0; j < NDIM; ++j) w[j] = box->center[j] - surf->apex[j];
+    double wn = dot3(w, surf->axis);
+    double L = sqrt(dot3(w, w));
+    double R = 0.5 * sqrt(dot3(box->dims, box->dims));
+    double alpha = atan(sqrt(surf->ta));
+
+    for (s = -1; s <= 1; s += 2) {
+        if (surf->sheet != 0 && surf->sheet != s) continue;
+        char behind = 1;
+        for (i = 0; i < NCOR && behind; ++i) behind = s * an[i] <= 0;
+        if (behind) continue;
+        if (L > R) {
+            double cos_theta = s * wn / L;
+            if (cos_theta > 1) cos_theta = 1;
+            else if (cos_theta < -1) cos_theta = -1;
+            if (acos(cos_theta) - asin(R / L) > alpha) continue;
+        }
+        if (surface_func(NDIM, box->center, NULL, (void *) surf) < 0) return 0;
+        double t = s * wn > 0 ? wn : 0;
+        for (j = 0; j < NDIM; ++j) p[j] = surf->apex[j] + t * surf->axis[j];
+        box_nearest_point(box, p, q);
+        if (surface_func(NDIM, q, NULL, (void *) surf) < 0) return 0;
+        return BOX_TEST_UNKNOWN;
+    }
+    return +1;
+}
+
+/* Tests the box, which corners have the same sense sign with respect to the surface.
+ * Returns refined sign or BOX_TEST_UNKNOWN, if analytic test is not available.
+ */
+static int analytic_test_box(const Surface * surf, const Box * box, int sign)
+{
+    if (sign < 0) {
+        // If the negative side of the surface is convex, the box lies inside it.
+        switch (surf->type) {
+            case SPHERE:
+            case CYLINDER:
+            case MRCC:
+            case MBOX:
+                return sign;
+            case CONE: {
+                const Cone * cone = (const Cone *) surf;
+                if (cone->sheet != 0) return sign;
+                // Both nappes are convex. If the corners belong to different nappes,
+                // the box passes through the apex region.
+                double a[NDIM], an;
+                int i, j, nappe = 0;
+                for (i = 0; i < NCOR; ++i) {
+                    for (j = 0; j < NDIM; ++j) a[j] = box->corners[i * NDIM + j] - cone->apex[j];
+                    an = dot3(a, cone->axis);
+                    if (nappe == 0) nappe = an > 0 ? 1 : -1;
+                    else if (nappe * an <= 0) return 0;
+                }
+                return sign;
+            }
+            default:
+                return BOX_TEST_UNKNOWN;
+        }
+    }
+    switch (surf->type) {
+        case SPHERE:
+            return sphere_test_box((const Sphere *) surf, box);
+        case CYLINDER:
+            return cylinder_test_box((const Cylinder *) surf, box);
+        case CONE:
+            return cone_test_box((const Cone *) surf, box);
+        case MRCC:
+            return RCC_test_box((const RCC *) surf, box);
+        case MBOX:
+            return BOX_test_box((const BOX *) surf, box);
+        default:
+            return BOX_TEST_UNKNOWN;
+    }
+}
+
+// ========================================================================================== //
+// ============================ Interval bounds ============================================= //
+// ========================================================================================== //
+
+typedef struct Interval Interval;
+
+struct Interval {
+    double lo;
+    double hi;
+};
+
+/* Relative bound of rounding errors in computation of the bounds. It is taken
+ * with a wide margin: the bounds are computed in a few dozens of operations.
+ */
+#define INTERVAL_REL_EPS (256 * DBL_EPSILON)
+
+/* Widens the interval by rounding errors of the values, which magnitudes
+ * are not larger than mag.
+ */
+static Interval interval_widen(Interval x, double mag)
+{
+    double err = INTERVAL_REL_EPS * mag;
+    x.lo -= err;
+    x.hi += err;
+    return x;
+}
+
+static Interval interval_sqr(Interval x)
+{
+    Interval r;
+    if (x.lo >= 0) {
+        r.lo = x.lo * x.lo;
+        r.hi = x.hi * x.hi;
+    } else if (x.hi <= 0) {
+        r.lo = x.hi * x.hi;
+        r.hi = x.lo * x.lo;
+    } else {
+        r.lo = 0;
+        r.hi = _max(x.lo * x.lo, x.hi * x.hi);
+    }
+    return r;
+}
+
+/* Bounds of quadratic function f(x) = y^T M y + v^T y + k, y = x - origin, over
+ * the box. M must be symmetric. The function is written in local coordinates of
+ * the box q: x = center + E q, |q_i| <= dims_i / 2. Terms with a single coordinate
+ * are bounded exactly, mixed ones - by interval products. The bounds are widened
+ * by rounding errors, which are estimated by the magnitude of the terms.
+ */
+static Interval quadratic_bounds(
+    const double * m,
+    const double * v,
+    double k,
+    const double * origin,
+    const Box * box
+)
+{
+    const double * e[NDIM] = {box->ex, box->ey, box->ez};
+    double d[NDIM], md[NDIM], me[NDIM][NDIM], h[NDIM], u[NDIM];
+    int i, j;
+    for (i = 0; i < NDIM; ++i) {
+        d[i] = box->center[i] - origin[i];
+        h[i] = 0.5 * box->dims[i];
+    }
+    // u bounds absolute values of coordinates y over the box and of the values
+    // y is computed from. The magnitude of all the terms is bounded by
+    // |u|^T |M| |u| + |v|^T |u| + |k|.
+    double mag = fabs(k);
+    for (i = 0; i < NDIM; ++i) {
+        u[i] = fabs(d[i]) + fabs(origin[i]);
+        for (j = 0; j < NDIM; ++j) u[i] += h[j] * fabs(e[j][i]);
+    }
+    for (i = 0; i < NDIM; ++i) {
+        mag += fabs(v[i]) * u[i];
+        for (j = 0; j < NDIM; ++j) mag += u[i] * fabs(m[i * NDIM + j]) * u[j];
+    }
+    for (i = 0; i < NDIM; ++i) {
+        md[i] = dot3(m + i * NDIM, d);
+        for (j = 0; j < NDIM; ++j) me[j][i] = dot3(m + i * NDIM, e[j]);
+    }
+    Interval r;
+    r.lo = r.hi = dot3(d, md) + dot3(v, d) + k;
+    for (i = 0; i < NDIM; ++i) {
+        double a = dot3(e[i], me[i]);
+        double b = 2 * dot3(e[i], md) + dot3(v, e[i]);
+        // Range of a t^2 + b t over |t| <= h.
+        double f1 = a * h[i] * h[i] - b * h[i];
+        double f2 = a * h[i] * h[i] + b * h[i];
+        double lo = (f1 < f2) ? f1 : f2;
+        double hi = _max(f1, f2);
+        if (a != 0 && fabs(b) <= 2 * fabs(a) * h[i]) {
+            double f0 = -b * b / (4 * a);
+            if (f0 < lo) lo = f0;
+            if (f0 > hi) hi = f0;
+        }
+        r.lo += lo;
+        r.hi += hi;
+        for (j = i + 1; j < NDIM; ++j) {
+            double c = 2 * fabs(dot3(e[j], me[i])) * h[i] * h[j];
+            r.lo -= c;
+            r.hi += c;
+        }
+    }
+    return interval_widen(r, mag);
+}
+
+// Matrix I - c * axis axis^T
+static void axial_matrix(const double * axis, double c, double * m)
+{
+    int i, j;
+    for (i = 0; i < NDIM; ++i)
+        for (j = 0; j < NDIM; ++j)
+            m[i * NDIM + j] = (i == j) - c * axis[i] * axis[j];
+}
+
+static const double zero_vector[NDIM] = {0, 0, 0};
+
+static Interval gq_bounds(const GQuadratic * surf, const Box * box)
+{
+    double m[NDIM * NDIM];
+    int i, j;
+    for (i = 0; i < NDIM; ++i)
+        for (j = 0; j < NDIM; ++j)
+            m[i * NDIM + j] = 0.5 * (surf->m[i * NDIM + j] + surf->m[j * NDIM + i]);
+    Interval r = quadratic_bounds(m, surf->v, surf->k, zero_vector, box);
+    Interval f = {r.lo * surf->factor, r.hi * surf->factor};
+    if (surf->factor < 0) {
+        f.lo = r.hi * surf->factor;
+        f.hi = r.lo * surf->factor;
+    }
+    return f;
+}
+
+static Interval cone_bounds(const Cone * surf, const Box * box)
+{
+    double m[NDIM * NDIM];
+    axial_matrix(surf->axis, 1 + surf->ta, m);
+    Interval r = quadratic_bounds(m, zero_vector, 0, surf->apex, box);
+    if (surf->sheet != 0) {
+        // On the other side of the apex the function is squared distance to it.
+        axial_matrix(surf->axis, 0, m);
+        r.hi = _max(r.hi, quadratic_bounds(m, zero_vector, 0, surf->apex, box).hi);
+    }
+    return r;
+}
+
+static Interval torus_bounds(const Torus * surf, const Box * box)
+{
+    const double * e[NDIM] = {box->ex, box->ey, box->ez};
+    double m[NDIM * NDIM], d[NDIM], w = 0;
+    int i;
+    for (i = 0; i < NDIM; ++i) {
+        d[i] = box->center[i] - surf->center[i];
+        w += 0.5 * box->dims[i] * fabs(dot3(e[i], surf->axis));
+    }
+    // Axial coordinate and distance from the axis.
+    double pn = dot3(d, surf->axis);
+    Interval axial = {(pn - w) / surf->a, (pn + w) / surf->a};
+    axial_matrix(surf->axis, 1, m);
+    Interval r2 = quadratic_bounds(m, zero_vector, 0, surf->center, box);
+    Interval radial = {
+        (sqrt(_max(r2.lo, 0)) - surf->radius) / surf->b,
+        (sqrt(_max(r2.hi, 0)) - surf->radius) / surf->b
+    };
+    double pmag = w;
+    for (i = 0; i < NDIM; ++i) pmag += fabs(d[i] * surf->axis[i]) + fabs(surf->center[i]);
+    axial = interval_sqr(interval_widen(axial, pmag / surf->a));
+    radial = interval_sqr(interval_widen(radial, (sqrt(_max(r2.hi, 0)) + surf->radius) / surf->b));
+    Interval f = {axial.lo + radial.lo - 1, axial.hi + radial.hi - 1};
+    return interval_widen(f, axial.hi + radial.hi + 1);
+}
+
+/* Tests the box by bounds of surface function over it. The test is available for
+ * the surfaces, which can't be tested analytically: GQ, cone and torus.
+ * Returns the sign if the bounds don't contain zero, or BOX_TEST_UNKNOWN.
+ */
+static int interval_test_box(const Surface * surf, const Box * box)
+{
+    Interval f;
+    switch (surf->type) {
+        case GQUADRATIC:
+            f = gq_bounds((const GQuadratic *) surf, box);
+            break;
+        case CONE:
+            f = cone_bounds((const Cone *) surf, box);
+            break;
+        case TORUS:
+            f = torus_bounds((const Torus *) surf, box);
+            break;
+        default:
+            return BOX_TEST_UNKNOWN;
+    }
+    kstat_add(KSTAT_PREFILTER_TESTS, 1);
+    int result = BOX_TEST_UNKNOWN;
+    if (f.lo > 0) result = +1;
+    else if (f.hi < 0) result = -1;
+    if (result != BOX_TEST_UNKNOWN) kstat_add(KSTAT_PREFILTER_DECIDED, 1);
+    return result;
+}
+
+/* General test. The purpose is to clarify if there is a point inside the box with
+ * positive sense if all corner results are negative; or a point with negative sense
+ * exists inside the box if all corner results are positive. SLSQP optimization method
+ * is used. The optimizer of the context is reused; if ctx is NULL, temporary one is created.
+ */
+static int slsqp_test_box(const Surface * surf, const Box * box, int sign, EvalContext * ctx)
 {
-    if (surf->last_box != 0) {
-        int bc = box_is_in(box, surf->last_box);
+    double x[NDIM], opt_val;
+    int i;
+
+    BoxOptimizer local, * optimizer = &local;
+    if (ctx != NULL) optimizer = &ctx->optimizer;
+    else box_optimizer_init(&local);
+
+    nlopt_opt opt = box_optimizer_setup(optimizer, box);
+    if (opt == NULL) return 0;  // Intersection can't be excluded.
+
+    if (sign > 0) nlopt_set_min_objective(opt, surface_func, (void*) surf);
+    else          nlopt_set_max_objective(opt, surface_func, (void*) surf);
+
+    // Because the problem is nonlinear, the points, where gradient is 0 exist.
+    // To avoid such trap we start optimization from several points - box's corners.
+    for (i = 0; i < NCOR; ++i) {
+        cblas_dcopy(NDIM, box->corners + i * NDIM, 1, x, 1);
+        box_optimizer_run(optimizer, x, &opt_val);
+        if (sign * opt_val < 0) {    // If sign and found opt_val have different signs - the surface
+            sign = 0;                // definitely intersects the box. If we have not found such solution
+            break;                   // - for sure not intersects.
+        }
+    }
+    if (optimizer == &local) box_optimizer_dispose(&local);
+    return sign;
+}
+
+int surface_test_box(const Surface * surf, const Box * box, EvalContext * ctx)
+{
+    CacheEntry * cached = evalctx_lookup(ctx, surf);
+    if (cached != NULL) {
+        int bc = box_is_in(box, cached->subdiv);
         // if it is the box already tested (bc == 0) then returns cached result;
         // if it is inner box - then returns cached result only if it is not 0. For inner box result may be different.
-        if (bc == 0 || bc > 0 && surf->last_box_result != 0)
-            return surf->last_box_result;
+        if (bc == 0 || bc > 0 && cached->result != 0)
+            return cached->result;
     }
 
     // First, test corner points of the box. If they have different senses,
@@ -451,47 +1087,15 @@ int surface_test_box(Surface * surf, const Box * box)
             box_test_points(box, 2, ((Torus*) surf)->specpts, test_res);
             if (test_res[0] == 1 || test_res[1] == 1) return 0;
         }
-
-        // General test. The purpose is to clarify if there is a point inside the box with
-        // positive sense if all corner results are negative; or a point with nefative sense
-        // exists inside the box if all corner results are negative. SLSQP optimization method
-        // is used.
-        double x[NDIM], opt_val;
-        double xtol[NDIM];
-        nlopt_result opt_result;
-
-        nlopt_opt opt;
-        opt = nlopt_create(NLOPT_LD_SLSQP, 3);
-        nlopt_set_lower_bounds(opt, box->lb);
-        nlopt_set_upper_bounds(opt, box->ub);
-
-        if (sign > 0) nlopt_set_min_objective(opt, surface_func, surf);
-        else          nlopt_set_max_objective(opt, surface_func, surf);
-
-        for (i = 0; i < NDIM; ++i) xtol[i] = box->dims[i] / 1000;
-
-        nlopt_add_inequality_mconstraint(opt, 6, box_ieqcons, (void*) box, NULL);
-        nlopt_set_stopval(opt, 0);
-        nlopt_set_maxeval(opt, 1000); // TODO: consider passing this parameter.
-        // nlopt_set_xtol_abs(opt, xtol);
-
-        // Because the problem is nonlinear, the points, where gradient is 0 exist.
-        // To avoid such trap we start optimization from several points - box's corners.
-        for (i = 0; i < NCOR; ++i) {
-            cblas_dcopy(NDIM, box->corners + i * NDIM, 1, x, 1);
-            opt_result = nlopt_optimize(opt, x, &opt_val);
-            if (sign * opt_val < 0) {    // If sign and found opt_val have different signs - the surface
-                sign = 0;                // definitely intersects the box. If we have not found such solution
-                break;                   // - for sure not intersects.
-            }
-        }
-        nlopt_destroy(opt);
+        // Exact tests are available for spheres, cylinders, cones and macrobodies.
+        // The others are tested by bounds of surface function first, and by
+        // optimization, if the bounds are inconclusive.
+        int result = analytic_test_box(surf, box, sign);
+        if (result == BOX_TEST_UNKNOWN) result = interval_test_box(surf, box);
+        sign = (result != BOX_TEST_UNKNOWN) ? result : slsqp_test_box(surf, box, sign, ctx);
     }
     // Cache test result;
-    if (!(box->subdiv & HIGHEST_BIT)) {
-        surf->last_box = box->subdiv;
-        surf->last_box_result = sign;
-    }
+    if (!(box->subdiv & HIGHEST_BIT)) evalctx_store(ctx, surf, box->subdiv, sign);
 
     return sign;
 }
@@ -5,6 +5,7 @@
 #include <stdint.h>
 #include "common.h"
 #include "box.h"
+#include "evalctx.h"
 
 #define SURFACE_SUCCESS  0
 #define SURFACE_FAILURE -1
@@ -26,8 +27,6 @@ enum SurfType {PLANE=1, SPHERE, CYLINDER, CONE, TORUS, GQUADRATIC, MRCC, MBOX};
 // surface common data
 struct Surface {
     char type;              // surface type
-    uint64_t last_box;      // subdivision code of last tested box
-    int last_box_result;    // last test_box result
 };
 
 struct Plane {
@@ -154,8 +153,18 @@ void surface_test_points(
     char * result            // The result - +1 if point has positive sense and -1 if negative.
 );
 
+// Tests senses of the points points[index[i]], i < n, with respect to the surface.
+void surface_test_points_indexed(
+    const Surface * surf,   // Surface
+    size_t n,               // The number of points to be tested
+    const double * points,  // Points
+    const size_t * index,   // Indices of the points to be tested
+    char * result           // The result - +1 if point has positive sense and -1 if negative.
+);
+
 // Tests if the surface intersects the box. 0 - surface intersects the box; +1 - box lies on the positive
 // side of surface; -1 - box lies on the negative side of surface.
-int surface_test_box(Surface * surf, const Box * box);
+// Results are cached in ctx, which can be NULL - no caching then.
+int surface_test_box(const Surface * surf, const Box * box, EvalContext * ctx);
 
 #endif
@@ -18,19 +18,24 @@ from collections import defaultdict
 from contextlib import contextmanager
 from functools import reduce
 from io import StringIO
+from multiprocessing import Pool
 from pathlib import Path
 
 import numpy as np
 
 from attr import attrib, attrs
 from click import progressbar
-from mckit.constants import MCNP_ENCODING
+from mckit.constants import MCNP_ENCODING, MIN_BOX_VOLUME
 from mckit.utils import filter_dict
 
-from .body import Body, Shape
+from .body import NOT_FULLY_SIMPLIFIED, Body, Shape, Simplifier, simplify_shared
 from .box import GLOBAL_BOX, Box
 from .card import Card
+from .locator import LOCATOR_TOL, CellLocator
 from .material import Composition, Material
+from .overlaps import GAP_POINTS, PAIR_POINTS, OverlapReport
+from .overlaps import check_overlaps as _check_overlaps
+from .overlaps import find_contacts
 from .surface import Plane, Surface
 from .transformation import Transformation
 from .utils import accept, on_unknown_acceptor
@@ -48,6 +53,11 @@ __all__ = [
 from .utils.Index import IndexOfNamed, StatisticsCollector
 from .utils.named import Name
 
+# The number of points classified at once by Universe.test_points().
+TEST_POINTS_CHUNK_SIZE = 1 << 16
+# The initial number of points tested at once by Universe.track_points().
+TRACK_WINDOW = 64
+
 
 class NameClashError(ValueError):
     def __init__(
@@ -144,14 +154,20 @@ class Universe:
     -------
     add_cells(cell)
         Adds new cell to the universe.
+    adjacency(use_boxes)
+        Gets indices of neighbouring cells for every cell.
     apply_fill(cell, universe)
         Applies fill operations to all or selected cells or universes.
     bounding_box(tol, box)
         Gets bounding box of the universe.
+    check_overlaps(box, min_volume, n_points, gap_points, jobs)
+        Finds overlapping cells and gaps between cells.
     copy()
         Makes a copy of the universe.
     find_common_materials()
         Finds all common materials among universes.
+    fill_depth()
+        Gets the number of levels of filling universes.
     get_surfaces()
         Gets all surfaces of the universe.
     get_materials()
@@ -162,6 +178,12 @@ class Universe:
         Gets all transformations of the universe.
     get_universes()
         Gets all inner universes.
+    intersect(other, simplify, jobs, box, min_volume)
+        Gets the parts of the cells inside the other universe's cells.
+    locate_points(points, chunk_size)
+        Finds the path of cells through filling universes for each point.
+    locator(box, tol)
+        Gets spatial index of the cells for point location.
     name()
         Gets numeric name of the universe.
     name_clashes()
@@ -176,8 +198,12 @@ class Universe:
         Sets new common materials for universe and all nested universes.
     simplify(box, split_disjoint, min_volume)
         Simplifies all cells of the universe.
-    test_points(points)
+    subtract(other, simplify, jobs, box, min_volume)
+        Gets the parts of the cells outside the other universe's cells.
+    test_points(points, out, chunk_size, multiple)
         Tests to which cell each point belongs.
+    track_points(points, out, adjacency)
+        Finds cells of ordered points walking through neighbouring cells.
     transform(tr)
         Applies transformation tr to this universe. Returns a new universe.
     verbose_name()
@@ -200,6 +226,7 @@ class Universe:
         if common_materials is None:
             common_materials = set()
         self._common_materials = common_materials
+        self._locator = None
 
         self.add_cells(cells, name_rule=name_rule)
 
@@ -371,6 +398,46 @@ class Universe:
 
         return _predicate
 
+    def adjacency(self, use_boxes: bool = False) -> List[np.ndarray]:
+        """Gets indices of neighbouring cells for every cell.
+
+        Cells are neighbours, if they share a surface. The graph is a
+        superset of the real contacts: cells sharing a surface can be far from
+        each other.
+
+        Parameters
+        ----------
+        use_boxes : bool
+            If True, the neighbours must also have touching bounding boxes
+            (see locator()).
+
+        Returns
+        -------
+        neighbours : List[np.ndarray[int32]]
+            Sorted indices of neighbours of every cell.
+        """
+        surface_cells = defaultdict(list)
+        for i, c in enumerate(self._cells):
+            for s in c.shape.get_surfaces():
+                surface_cells[s].append(i)
+        pairs = set()
+        for cells in surface_cells.values():
+            for i in cells:
+                pairs.update((i, j) for j in cells if j != i)
+        if use_boxes and pairs:
+            locator = self.locator()
+            first, second = np.array(sorted(pairs)).T
+            touch = np.all(
+                (locator.lower[first] <= locator.upper[second])
+                & (locator.lower[second] <= locator.upper[first]),
+                axis=1,
+            )
+            pairs = zip(first[touch], second[touch])
+        neighbours = [[] for _ in self._cells]
+        for i, j in pairs:
+            neighbours[i].append(j)
+        return [np.array(sorted(n), dtype=np.int32) for n in neighbours]
+
     def alone(self):
         """Gets this universe alone, without inner universes.
 
@@ -476,6 +543,56 @@ class Universe:
         dims = max_pt - min_pt
         return Box(center, *dims)
 
+    def check_overlaps(
+        self,
+        box: Optional[Box] = None,
+        min_volume: float = MIN_BOX_VOLUME,
+        n_points: int = PAIR_POINTS,
+        gap_points: int = GAP_POINTS,
+        jobs: int = 1,
+        seed: int = 0,
+    ) -> OverlapReport:
+        """Finds overlapping cells and gaps between cells.
+
+        The pairs of cells with intersecting bounding boxes are checked with
+        ultimate_test_box() and random points in the common part of the boxes.
+        Gaps are searched with random points in the box. Only the cells of
+        this universe are checked, filling universes are to be checked
+        separately.
+
+        Parameters
+        ----------
+        box : Box, optional
+            Box, where gaps are searched. Default: the box around all the
+            cells, which don't reach the boundary of GLOBAL_BOX.
+        min_volume : float
+            Minimal volume of boxes in ultimate_test_box().
+        n_points : int
+            The number of random points tested for a pair of cells.
+        gap_points : int
+            The number of random points tested for gaps.
+        jobs : int
+            The number of threads, in which the pairs of cells are checked.
+        seed : int
+            Seed of random points.
+
+        Returns
+        -------
+        report : OverlapReport
+            Overlapping pairs of cells (indices) with sample points, pairs
+            of cells, which intersection is not proved to be empty, but no
+            random point hits it, and sample points of gaps.
+        """
+        return _check_overlaps(
+            self,
+            box=box,
+            min_volume=min_volume,
+            n_points=n_points,
+            gap_points=gap_points,
+            jobs=jobs,
+            seed=seed,
+        )
+
     def copy(self):
         """Makes a copy of the universe."""
         return Universe(
@@ -753,7 +870,16 @@ class Universe:
         return items
 
     def simplify(
-        self, box=GLOBAL_BOX, min_volume=1, split_disjoint=False, verbose=True
+        self,
+        box=GLOBAL_BOX,
+        min_volume=1,
+        split_disjoint=False,
+        verbose=True,
+        budget_seconds=None,
+        max_boxes=None,
+        use_bounding_box=False,
+        progressive=False,
+        shared=False,
     ):
         """Simplifies all cells of the universe.
 
@@ -769,21 +895,57 @@ class Universe:
             Whether to split disjoint cells.
         verbose : bool
             Turns on verbose output. Default: True.
+        budget_seconds : float, optional
+            Time limit of simplification of a cell. See Body.simplify().
+        max_boxes : int, optional
+            The maximal number of boxes tested for a cell.
+        use_bounding_box : bool
+            Collect statistics inside bounding boxes of the cells. See Body.simplify().
+        progressive : bool
+            Collect statistics from coarse to fine boxes. It is much faster
+            for cells, which simplest form is found with coarse boxes.
+        shared : bool
+            Collect statistics of all the cells in one subdivision of the box,
+            so surfaces shared by neighbouring cells are tested once per box.
+            See body.simplify_shared(). It can't be combined with use_bounding_box
+            and progressive.
         """
-        new_cells = []
-        if verbose:
-
-            def fmt_fun(x):
-                return "Simplifying cell #{0}".format(x.name() if x else x)
-
-            uiter = progressbar(self, item_show_func=fmt_fun).__enter__()
+        if shared and (use_bounding_box or progressive):
+            raise ValueError(
+                "Shared statistics can't be collected with bounding boxes or progressively"
+            )
+        if shared:
+            new_cells = list(
+                simplify_shared(
+                    self,
+                    box=box,
+                    min_volume=min_volume,
+                    budget_seconds=budget_seconds,
+                    max_boxes=max_boxes,
+                )
+            )
         else:
-            uiter = self
+            new_cells = []
+            if verbose:
+
+                def fmt_fun(x):
+                    return "Simplifying cell #{0}".format(x.name() if x else x)
 
-        for c in uiter:
-            cs = c.simplify(box=box, min_volume=min_volume)
-            if not cs.shape.is_empty():
-                new_cells.append(cs)
+                uiter = progressbar(self, item_show_func=fmt_fun).__enter__()
+            else:
+                uiter = self
+
+            for c in uiter:
+                cs = c.simplify(
+                    box=box,
+                    min_volume=min_volume,
+                    budget_seconds=budget_seconds,
+                    max_boxes=max_boxes,
+                    use_bounding_box=use_bounding_box,
+                    progressive=progressive,
+                )
+                if not cs.shape.is_empty():
+                    new_cells.append(cs)
 
         if verbose:
             print("Universe {0} simplification has been finished.".format(self.name()))
@@ -792,30 +954,339 @@ class Universe:
                     len(self._cells) - len(new_cells)
                 )
             )
+            incomplete = sum(
+                1 for c in new_cells if c.options.get(NOT_FULLY_SIMPLIFIED)
+            )
+            if incomplete:
+                print(
+                    "{0} cells were not fully simplified within the budget.".format(
+                        incomplete
+                    )
+                )
 
         self._cells = new_cells
 
-    def test_points(self, points):
+    def fill_depth(self) -> int:
+        """Gets the number of levels of universes filling this one and itself."""
+        depth = 0
+        for c in self._cells:
+            fill = c.options.get("FILL", None)
+            if fill:
+                depth = max(depth, fill["universe"].fill_depth())
+        return depth + 1
+
+    def locate_points(self, points, chunk_size=TEST_POINTS_CHUNK_SIZE):
+        """Finds the path of cells through filling universes for each point.
+
+        The points are located in the cells of this universe, then the points
+        in filled cells are transformed to the coordinates of the filling
+        universe and located in its cells, and so on. The universes are not
+        flattened, every universe uses its own locator().
+
+        Parameters
+        ----------
+        points : array_like[float]
+            An array of point coordinates of shape (3,) or (n, 3).
+        chunk_size : int
+            The number of points processed at once.
+
+        Returns
+        -------
+        path : np.ndarray[int32]
+            An array of shape (n, fill_depth()). path[j, 0] is the index of
+            the cell of this universe, which contains point j (as in
+            test_points()), path[j, 1] - the index of the cell of the universe
+            filling that cell, and so on. The rest of the path is -1.
+        """
+        points = np.asarray(points).reshape(-1, 3)
+        n = points.shape[0]
+        path = np.full((n, self.fill_depth()), -1, dtype=np.int32)
+        for start in range(0, n, chunk_size):
+            chunk = np.asarray(points[start : start + chunk_size], dtype=float)
+            path[start : start + chunk_size] = self._locate_points(chunk, path.shape[1])
+        return path
+
+    def _locate_points(self, points, depth):
+        path = np.full((points.shape[0], depth), -1, dtype=np.int32)
+        index = self.test_points(points)
+        path[:, 0] = index
+        order = np.argsort(index, kind="stable")
+        starts = np.flatnonzero(np.diff(index[order], prepend=-2))
+        for start, ids in zip(starts, np.split(order, starts[1:])):
+            i = index[order[start]]
+            fill = self._cells[i].options.get("FILL", None) if i >= 0 else None
+            if not fill:
+                continue
+            local = points[ids]
+            tr = fill.get("transform", None)
+            if tr:
+                local = tr.reverse().apply2point(local)
+            path[ids, 1:] = fill["universe"]._locate_points(local, depth - 1)
+        return path
+
+    def locator(self, box=GLOBAL_BOX, tol=LOCATOR_TOL) -> CellLocator:
+        """Gets spatial index of the cells for point location.
+
+        The index is built on the first call from bounding boxes of the cells
+        and is kept until the cells of the universe are changed.
+
+        Parameters
+        ----------
+        box : Box
+            Start box for bounding boxes of the cells.
+        tol : float
+            Tolerance of bounding boxes.
+
+        Returns
+        -------
+        locator : CellLocator
+            Uniform grid over the cells' bounding boxes.
+        """
+        if self._locator is None or not self._locator.is_valid(self._cells, box, tol):
+            self._locator = CellLocator(self._cells, box=box, tol=tol)
+        return self._locator
+
+    def subtract(
+        self,
+        other: "Universe",
+        simplify: bool = True,
+        jobs: int = 1,
+        box: Box = GLOBAL_BOX,
+        min_volume: float = 1.0,
+    ) -> "Universe":
+        """Gets the parts of the cells outside the other universe's cells.
+
+        Every cell is intersected with complements of only those cells of the
+        other universe, which can intersect it (see overlaps.find_contacts()).
+        The other cells are kept as is.
+
+        Parameters
+        ----------
+        other : Universe
+            Universe to be subtracted.
+        simplify : bool
+            Simplify the changed cells and drop empty ones.
+        jobs : int
+            The number of threads for contact search and processes for
+            simplification.
+        box : Box
+            Box, from which simplification process starts.
+        min_volume : float
+            Minimal volume of the box, when splitting process terminates.
+
+        Returns
+        -------
+        result : Universe
+            New universe with the same name. Surfaces of the other universe
+            are renamed in case of name clashes.
+        """
+        contacts = find_contacts(self, other, jobs=jobs)
+        shapes = self._shared_shapes(other, contacts)
+        new_cells = {}
+        for i, js in enumerate(contacts):
+            if js.size:
+                complements = [shapes[j].complement() for j in js]
+                new_cells[i] = self._cells[i].intersection(Shape("I", *complements))
+        return self._cut_result(new_cells, True, simplify, jobs, box, min_volume)
+
+    def intersect(
+        self,
+        other: "Universe",
+        simplify: bool = True,
+        jobs: int = 1,
+        box: Box = GLOBAL_BOX,
+        min_volume: float = 1.0,
+    ) -> "Universe":
+        """Gets the parts of the cells inside the other universe's cells.
+
+        Every cell is intersected with union of only those cells of the other
+        universe, which can intersect it (see overlaps.find_contacts()). The
+        cells without such contacts are dropped.
+
+        Parameters
+        ----------
+        other : Universe
+            Universe to intersect with.
+        simplify : bool
+            Simplify the changed cells and drop empty ones.
+        jobs : int
+            The number of threads for contact search and processes for
+            simplification.
+        box : Box
+            Box, from which simplification process starts.
+        min_volume : float
+            Minimal volume of the box, when splitting process terminates.
+
+        Returns
+        -------
+        result : Universe
+            New universe with the same name. Surfaces of the other universe
+            are renamed in case of name clashes.
+        """
+        contacts = find_contacts(self, other, jobs=jobs)
+        shapes = self._shared_shapes(other, contacts)
+        new_cells = {}
+        for i, js in enumerate(contacts):
+            if js.size:
+                union = Shape("U", *(shapes[j] for j in js))
+                new_cells[i] = self._cells[i].intersection(union)
+        return self._cut_result(new_cells, False, simplify, jobs, box, min_volume)
+
+    def _shared_shapes(self, other, contacts):
+        # Surfaces of the other cells, which are equal to surfaces of this
+        # universe, are replaced, so that simplification can remove them.
+        surfs = self.get_surfaces()
+        surf_replace = {s: s for s in surfs}
+        surf_names = {s.name() for s in surfs}
+        return {
+            j: self._get_cell_replaced_shape(
+                other[j], surf_replace, surf_names, "clash"
+            )
+            for j in sorted(set(np.concatenate(contacts).tolist()))
+        }
+
+    def _cut_result(self, new_cells, keep_others, simplify, jobs, box, min_volume):
+        changed = list(new_cells.keys())
+        if simplify and changed:
+            simplifier = Simplifier(box=box, min_volume=min_volume)
+            cells = [new_cells[i] for i in changed]
+            if jobs > 1:
+                with Pool(processes=jobs) as pool:
+                    cells = pool.map(simplifier, cells)
+            else:
+                cells = list(map(simplifier, cells))
+            new_cells = dict(zip(changed, cells))
+        cells = []
+        for i, c in enumerate(self._cells):
+            if i in new_cells:
+                cells.append(new_cells[i])
+            elif keep_others:
+                cells.append(c)
+        return Universe(
+            cells,
+            name=self._name,
+            name_rule="clash",
+            verbose_name=self._verbose_name,
+            comment=self._comment,
+            common_materials=self._common_materials,
+        )
+
+    def test_points(
+        self, points, out=None, chunk_size=TEST_POINTS_CHUNK_SIZE, multiple=False
+    ):
         """Finds cell to which each point belongs to.
 
+        The points are processed by chunks, so the memory used doesn't depend
+        on the number of points: they can be taken from np.memmap, and the
+        results can be written into np.memmap too. The points are converted
+        to float chunk by chunk. Every point is tested only
+        against the cells, which bounding boxes contain it (see locator()).
+
         Parameters
         ----------
         points : array_like[float]
             An array of point coordinates. If there is only one point it has
-            shape (3,); if there are n points, it has shape (n, 3).
+            shape (3,); if there are n points, it has shape (n, 3). Any object
+            supporting buffer protocol is accepted without copying.
+        out : np.ndarray[int32], optional
+            An array of length n, where results are put.
+        chunk_size : int
+            The number of points processed at once.
+        multiple : bool
+            If True, points belonging to several cells are reported too.
 
         Returns
         -------
-        result : np.ndarray[int]
+        result : np.ndarray[int32]
             An array of cell indices to which a particular point belongs to.
-            Its length equals to the number of points.
+            Its length equals to the number of points. -1 means that the
+            point doesn't belong to any cell. If the point belongs to several
+            cells, the index of the first one is given.
+        claimed : np.ndarray[bool]
+            Only if multiple is True. True for points belonging to several
+            cells.
         """
-        points = np.array(points)
-        result = np.empty(points.size // 3)
-        for i, c in enumerate(self._cells):
-            test = c.shape.test_points(points)
-            result[test == +1] = i
-        return result
+        points = np.asarray(points).reshape(-1, 3)
+        n = points.shape[0]
+        if out is None:
+            out = np.empty(n, dtype=np.int32)
+        elif out.shape != (n,):
+            raise ValueError(f"Output array of shape ({n},) is expected")
+        claimed = np.zeros(n, dtype=bool) if multiple else None
+        locator = self.locator()
+        for start in range(0, n, chunk_size):
+            stop = start + chunk_size
+            result = locator.locate(
+                points[start:stop], out=out[start:stop], multiple=multiple
+            )
+            if multiple:
+                claimed[start:stop] = result[1]
+        if multiple:
+            return out, claimed
+        return out
+
+    def track_points(self, points, out=None, adjacency=None):
+        """Finds cells of ordered points walking through neighbouring cells.
+
+        The points are supposed to be ordered along a track or a line scan, so
+        that the next point is usually in the same cell as the previous one
+        or in its neighbour. The points following the current one are tested
+        against the current cell by growing windows. The first point leaving
+        the cell is tested against its neighbours, and only if none of them
+        contains the point, it is located with locator().
+
+        Parameters
+        ----------
+        points : array_like[float]
+            An array of point coordinates of shape (3,) or (n, 3).
+        out : np.ndarray[int32], optional
+            An array of length n, where results are put.
+        adjacency : List[np.ndarray], optional
+            Neighbours of the cells, see adjacency(). By default they are
+            found from shared surfaces.
+
+        Returns
+        -------
+        result : np.ndarray[int32]
+            An array of cell indices to which a particular point belongs to.
+            -1 means that the point doesn't belong to any cell. If cells
+            overlap, the index may differ from the one given by test_points().
+        """
+        points = np.ascontiguousarray(points, dtype=float).reshape(-1, 3)
+        n = points.shape[0]
+        if out is None:
+            out = np.empty(n, dtype=np.int32)
+        elif out.shape != (n,):
+            raise ValueError(f"Output array of shape ({n},) is expected")
+        if adjacency is None:
+            adjacency = self.adjacency()
+        current = -1
+        window = TRACK_WINDOW
+        j = 0
+        while j < n:
+            if current >= 0:
+                chunk = points[j : j + window]
+                inside = self._cells[current].shape.test_points(chunk) == +1
+                k = chunk.shape[0] if inside.all() else int(np.argmin(inside))
+                out[j : j + k] = current
+                j += k
+                if k == chunk.shape[0]:
+                    window = min(2 * window, TEST_POINTS_CHUNK_SIZE)
+                    continue
+                window = TRACK_WINDOW
+                point = points[j : j + 1]
+                previous, current = current, -1
+                for i in adjacency[previous]:
+                    if self._cells[i].shape.test_points(point)[0] == +1:
+                        current = i
+                        break
+            else:
+                point = points[j : j + 1]
+            if current < 0:
+                current = self.locator().locate(point)[0]
+            out[j] = current
+            j += 1
+        return out
 
     def transform(self, tr: Transformation) -> "Universe":
         """Applies transformation tr to this universe. Returns a new universe."""
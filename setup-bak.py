@@ -111,7 +111,16 @@ else:
 
 geometry_sources = [
     path.join("mckit", "src", src)
-    for src in ["geometrymodule.c", "box.c", "surface.c", "shape.c", "rbtree.c"]
+    for src in [
+        "geometrymodule.c",
+        "box.c",
+        "surface.c",
+        "shape.c",
+        "statset.c",
+        "octree.c",
+        "evalctx.c",
+        "kstat.c",
+    ]
 ]
 
 extensions = [
@@ -0,0 +1,41 @@
+import pytest
+
+from mckit.cli.runner import mckit
+from mckit.utils.resource import filename_resolver
+
+data_filename_resolver = filename_resolver("tests")
+
+
+def test_when_there_is_no_args(runner, disable_log):
+    with runner.isolated_filesystem():
+        result = runner.invoke(mckit, args=["overlaps"], catch_exceptions=False)
+        assert result.exit_code != 0, "Should fail when no arguments provided"
+        assert "Usage:" in result.output
+
+
+@pytest.mark.parametrize(
+    "source, expected, exit_code",
+    [
+        ("cli/data/simple_cubes.mcnp", ["Total of overlaps and gaps: 0"], 0),
+        (
+            "cli/data/overlapping_cubes.mcnp",
+            [
+                "Universe 0: cells 2 and 3 overlap",
+                "Universe 0: gaps",
+                "Total of overlaps and gaps: 2",
+            ],
+            1,
+        ),
+    ],
+)
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_good_path(runner, disable_log, source, expected, exit_code, jobs):
+    source = data_filename_resolver(source)
+    result = runner.invoke(
+        mckit,
+        args=["-q", "overlaps", "-j", str(jobs), "--gap-points", "10000", source],
+        catch_exceptions=False,
+    )
+    assert result.exit_code == exit_code, "Should fail if overlaps or gaps are found"
+    for e in expected:
+        assert e in result.output
@@ -2,13 +2,17 @@ import typing as tp
 
 import pickle
 
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+
 import numpy as np
 import pytest
 
-from mckit.body import Body, Shape
+from mckit.body import NOT_FULLY_SIMPLIFIED, Body, Shape, simplify, simplify_shared
 from mckit.box import Box
+from mckit.geometry import kernel_stats, reset_kernel_stats
 from mckit.material import Material
-from mckit.surface import create_surface
+from mckit.surface import Plane, Torus, create_surface
 from mckit.transformation import Transformation
 from tests import pass_through_pickle
 
@@ -1897,6 +1901,155 @@ class TestShape:
         result = geometry[geom_no].test_points(point)
         np.testing.assert_array_equal(result, ans)
 
+    def test_points_out(self, geometry):
+        points = Box([0, 0, 0], 20, 20, 20).generate_random_points(1000)
+        out = np.empty(1000, dtype=np.int8)
+        assert geometry[0].test_points(points, out=out) is out
+        np.testing.assert_array_equal(out, geometry[0].test_points(points))
+        with pytest.raises(ValueError):
+            geometry[0].test_points(points, out=np.empty(1000, dtype=np.int32))
+        with pytest.raises(ValueError):
+            geometry[0].test_points(points, out=out[:10])
+
+    @pytest.mark.parametrize("geom_no", range(12))
+    def test_points_nested(self, geometry, geom_no):
+        # Arguments of composite shapes are evaluated only for undecided points.
+        # The result must be the same as for evaluation of all the arguments.
+        def evaluate(shape, points):
+            if shape.opc in "IU":
+                sub = [evaluate(a, points) for a in shape.args]
+                return np.min(sub, axis=0) if shape.opc == "I" else np.max(sub, axis=0)
+            return shape.test_points(points)
+
+        points = Box([0, 0, 0], 20, 20, 20).generate_random_points(10000)
+        shape = geometry[geom_no]
+        np.testing.assert_array_equal(
+            shape.test_points(points), evaluate(shape, points)
+        )
+
+    def test_optimizer_reuse(self):
+        # Inconclusive box tests of torus are done by optimization. The optimizer
+        # is created once per computation.
+        shape = Shape("C", create_surface("TZ", 0, 0, 0, 4, 1, 1))
+        reset_kernel_stats()
+        shape.volume(Box([0, 0, 0], 12, 12, 4), min_volume=0.01)
+        stats = kernel_stats()
+        assert stats["optimizers_created"] == 1
+        assert stats["optimizer_runs"] > 100
+
+    def test_stat_table(self):
+        rng = np.random.default_rng(1)
+        surfaces = [
+            create_surface("S", *rng.uniform(-5, 5, 3), 3, name=i + 1)
+            for i in range(40)
+        ]
+        shape = Shape("U", *(Shape("C", s) for s in surfaces))
+        box = Box([0, 0, 0], 20, 20, 20)
+        shape.collect_statistics(box, 1)
+        table = shape.get_stat_table()
+        assert table.dtype == np.int8
+        assert table.shape[1] == len(surfaces)
+        assert table.shape[0] > 10
+        assert np.all(np.isin(table, [-1, 0, 1]))
+        rows = [tuple(r) for r in table]
+        assert rows == sorted(set(rows))
+        assert all(np.any(r == 1) or np.all(r == -1) for r in table)
+        assert shape.collect_statistics(box, 1)
+        np.testing.assert_array_equal(shape.get_stat_table(), table)
+        assert not shape.collect_statistics(box, 1, max_boxes=5)
+        assert shape.get_stat_table().shape[0] < table.shape[0]
+
+    @pytest.mark.parametrize("refine", [None, [], slice(0, 5)])
+    def test_stat_table_refinement(self, refine):
+        rng = np.random.default_rng(1)
+        surfaces = [
+            create_surface("S", *rng.uniform(-5, 5, 3), 3, name=i + 1)
+            for i in range(10)
+        ]
+        shape = Shape("U", *(Shape("C", s) for s in surfaces))
+        box = Box([0, 0, 0], 20, 20, 20)
+        if isinstance(refine, slice):
+            refine = surfaces[refine]
+        assert shape.collect_statistics(box, 0.01, coarse_volume=10, refine=refine)
+        table = shape.get_stat_table()
+        shape.collect_statistics(box, 0.01)
+        exact = shape.get_stat_table()
+
+        def covers(t, columns):
+            inside = t[np.any(t == 1, axis=1)]
+            return np.all(np.any(inside[:, columns] == 1, axis=1))
+
+        # Extra rows can only prevent simplification.
+        for k in range(1, len(surfaces) + 1):
+            for columns in combinations(range(len(surfaces)), k):
+                if covers(table, list(columns)):
+                    assert covers(exact, list(columns))
+
+    def test_stat_table_refinement_wrong_surfaces(self):
+        shape = Shape("C", create_surface("SO", 1, name=1))
+        with pytest.raises(TypeError):
+            shape.collect_statistics(Box([0, 0, 0], 4, 4, 4), 0.1, refine=[1])
+
+    @pytest.mark.parametrize("seed", range(5))
+    @pytest.mark.parametrize("trim_size", [0, 2])
+    def test_find_coverages(self, seed, trim_size):
+        rng = np.random.default_rng(seed)
+        results = rng.choice([-1, 0, 1], size=(30, 8), p=[0.5, 0.2, 0.3])
+        results[:, 0] = 1
+        costs = {j: int(c) for j, c in enumerate(rng.integers(1, 5, 8))}
+        cases = Shape._find_coverages(results, costs, value=1, trim_size=trim_size)
+        expected = set()
+        for k in range(1, 9):
+            for c in combinations(range(8), k):
+                if np.all(np.any(results[:, c] == 1, axis=1)):
+                    expected.add((c, sum(costs[j] for j in c)))
+        min_cost = min(cost for _, cost in expected)
+        expected = {(c, cost) for c, cost in expected if cost <= min_cost + trim_size}
+        found = {(tuple(c), cost) for c, cost in cases}
+        assert found <= expected
+        assert min(cost for _, cost in found) == min_cost
+        if trim_size == 0:
+            assert found == expected
+
+    def test_get_simplest_uncovered_statistics(self):
+        surfaces = [create_surface("PX", x, name=i + 1) for i, x in enumerate([0, 1])]
+        shape = Shape("I", *surfaces)
+        # The second box is not decided by any of the arguments.
+        shape.get_stat_table = lambda: np.array([[-1, 1], [0, 1], [1, 1]])
+        assert shape.get_simplest() == [shape]
+
+    @pytest.mark.parametrize("geom_no", range(12))
+    def test_optimize_order(self, geometry, geom_no):
+        shape = geometry[geom_no]
+        box = Box([0, 0, 0], 20, 20, 20)
+        optimized = shape.optimize_order(box, n_points=1000)
+        assert optimized == shape
+        assert hash(optimized) == hash(shape)
+        points = box.generate_random_points(10000)
+        np.testing.assert_array_equal(
+            optimized.test_points(points), shape.test_points(points)
+        )
+        assert optimized.test_box(box) == shape.test_box(box)
+
+    def test_optimize_order_cheap_first(self):
+        torus = create_surface("TZ", 0, 0, 0, 4, 1, 1, name=1)
+        plane = create_surface("PX", 10, name=2)
+        shape = Shape("I", Shape("C", torus), Shape("C", plane))
+        optimized = shape.optimize_order(Box([0, 0, 0], 30, 30, 30))
+        assert [a.args[0] for a in optimized.args] == [plane, torus]
+        unpickled = pass_through_pickle(optimized)
+        assert [a.args[0] for a in unpickled.args] == [plane, torus]
+        assert hash(optimized) == hash(Shape("I", *optimized.args))
+        complement = optimized.complement()
+        assert complement == shape.complement()
+        assert [a.args[0] for a in complement.args] == [plane, torus]
+        assert [a.args[0] for a in complement.complement().args] == [plane, torus]
+        tr = Transformation(translation=[1, 0, 0])
+        moved = [a.args[0] for a in optimized.transform(tr).args]
+        assert isinstance(moved[0], Plane) and isinstance(moved[1], Torus)
+        cut = optimized.intersection(Shape("S", create_surface("PY", 0, name=3)))
+        assert [a.args[0] for a in cut.args][:2] == [plane, torus]
+
     @pytest.mark.parametrize(
         "case_no, expected", enumerate([5, 2, 2, 13, 4, 6, 4, 4, 3, 2])
     )
@@ -1927,6 +2080,45 @@ class TestShape:
         result = geometry[case_no].test_box(box[box_no])
         assert result == expected[box_no]
 
+    def test_ultimate_test_box_mixed(self):
+        # The plane passes between the corners of the halves of the box, so one
+        # half is outside, the other one is inside, and the box intersects the
+        # shape. The result doesn't depend on the order of the halves.
+        x = 2.9144179114989566
+        shape = Shape("S", create_surface("PX", x, name=1))
+        box = Box([x, 0, 0], 7.227102896736061, 0.1, 0.1)
+        assert [shape.test_box(b) for b in box.split()] == [-1, 1]
+        assert shape.test_box(box) == 0
+        assert shape.ultimate_test_box(box, min_volume=0.01) == 0
+        assert shape.complement().ultimate_test_box(box, min_volume=0.01) == 0
+        inner = Box([x + 3, 0, 0], 1, 0.1, 0.1)
+        assert shape.ultimate_test_box(inner, min_volume=0.01) == 1
+
+    @pytest.mark.parametrize("threads", [0, 1, 3])
+    @pytest.mark.parametrize("case_no", range(6))
+    def test_test_boxes(self, geometry, case_no, threads):
+        rng = np.random.default_rng(case_no)
+        basis = np.array([[0.6, 0.8, 0], [-0.8, 0.6, 0], [0, 0, 1]])
+        centers = rng.uniform(-5, 5, (500, 3))
+        dims = rng.uniform(0.1, 3, (500, 3))
+        shape = geometry[case_no]
+        result = shape.test_boxes(centers, dims, basis=basis, threads=threads)
+        assert result.dtype == np.int8
+        expected = [
+            shape.test_box(Box(c, *d, ex=basis[0], ey=basis[1], ez=basis[2]))
+            for c, d in zip(centers, dims)
+        ]
+        np.testing.assert_array_equal(result, expected)
+        result = shape.test_boxes(centers, [1, 2, 3])
+        expected = [shape.test_box(Box(c, 1, 2, 3)) for c in centers]
+        np.testing.assert_array_equal(result, expected)
+
+    def test_test_boxes_wrong_dims(self, geometry):
+        with pytest.raises(ValueError):
+            geometry[0].test_boxes(np.zeros((5, 3)), np.ones((4, 3)))
+        with pytest.raises(ValueError):
+            geometry[0].test_boxes(np.zeros((5, 3)), np.ones((5, 3)), basis=np.eye(2))
+
     @pytest.mark.slow
     @pytest.mark.parametrize("tol", [0.2, None])
     @pytest.mark.parametrize(
@@ -1978,6 +2170,156 @@ class TestShape:
         v = geometry[case_no].volume(box[box_no], min_volume=1.0e-4)
         assert v == pytest.approx(expected[box_no], rel=1.0e-2)
 
+    @pytest.mark.parametrize("box_no", range(len(box_data)))
+    @pytest.mark.parametrize(
+        "case_no, expected",
+        enumerate(
+            [
+                [7.4940, 3.6652, 0],
+                [0, 0, 0.1636],
+                [0.35997, 0, 2.3544],
+                [7.4940, 3.6652, 0],
+                [7.8540, 3.1416, 2.3544],
+                [1.9635, 1.30900, 0.1636],
+            ]
+        ),
+    )
+    def test_volume_mc(self, geometry, box, box_no: int, case_no: int, expected):
+        v, err = geometry[case_no].volume_mc(box[box_no], n_points=200000, seed=1)
+        assert v == pytest.approx(expected[box_no], abs=5 * err + 1.0e-2)
+        assert err < 1.0e-2 * box[box_no].volume
+
+    @pytest.mark.parametrize("box_no", range(len(box_data)))
+    @pytest.mark.parametrize(
+        "case_no, expected",
+        enumerate(
+            [
+                [7.4940, 3.6652, 0],
+                [0, 0, 0.1636],
+                [0.35997, 0, 2.3544],
+                [7.4940, 3.6652, 0],
+                [7.8540, 3.1416, 2.3544],
+                [1.9635, 1.30900, 0.1636],
+            ]
+        ),
+    )
+    @pytest.mark.parametrize("atol, rtol", [(0.1, None), (None, 0.05), (0.05, 0.05)])
+    def test_volume_adaptive(
+        self, geometry, box, box_no: int, case_no: int, expected, atol, rtol
+    ):
+        v, err = geometry[case_no].volume(
+            box[box_no], min_volume=1.0e-6, atol=atol, rtol=rtol
+        )
+        assert abs(v - expected[box_no]) <= err + 1.0e-3 * box[box_no].volume
+        assert err <= max(atol or 0, (rtol or 0) * v) or err < 1.0e-6
+
+    @pytest.mark.parametrize("target_rel_err", [0.05, 0.01])
+    def test_volume_mc_target_error(self, geometry, box, target_rel_err):
+        v, err = geometry[0].volume_mc(
+            box[0], n_points=10000000, target_rel_err=target_rel_err
+        )
+        assert err <= target_rel_err * v
+        assert v == pytest.approx(7.4940, rel=5 * target_rel_err)
+        assert (v, err) == geometry[0].volume_mc(
+            box[0], n_points=10000000, target_rel_err=target_rel_err
+        )
+
+    def test_volume_in_threads(self, geometry, box):
+        # Shapes share surfaces, the results must not depend on concurrent usage.
+        tasks = [(g, b) for g in geometry[:6] for b in box]
+
+        def volume(task):
+            g, b = task
+            return g.volume(b, min_volume=1.0e-3), g.bounding_box(box=b, tol=0.5)
+
+        expected = list(map(volume, tasks))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            actual = list(executor.map(volume, tasks * 3))
+        for (ev, ebb), (av, abb) in zip(expected * 3, actual):
+            assert av == ev
+            np.testing.assert_array_equal(abb.center, ebb.center)
+            np.testing.assert_array_equal(abb.dimensions, ebb.dimensions)
+
+    def test_statistics_in_threads(self, geometry, box):
+        # Statistics is collected in the context of the call and then stored in
+        # the shapes, so the shapes can be processed concurrently.
+        tasks = [(g, b) for g, b in zip(geometry[:6], box * 2)]
+
+        def collect(task):
+            g, b = task
+            g.collect_statistics(b, 1.0e-2)
+            return g.get_stat_table()
+
+        expected = list(map(collect, tasks))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            actual = list(executor.map(collect, tasks * 3))
+        for e, a in zip(expected * 3, actual):
+            np.testing.assert_array_equal(a, e)
+
+    @pytest.mark.parametrize("box_no", range(len(box_data)))
+    @pytest.mark.parametrize("case_no", range(6))
+    def test_octree(self, geometry, box, box_no, case_no):
+        shape = Shape(geometry[case_no].opc, *geometry[case_no].args)
+        b = box[box_no]
+        points = b.generate_random_points(1000)
+        expected = (
+            shape.volume(b, min_volume=1.0e-3),
+            shape.test_box(b),
+            shape.ultimate_test_box(b, min_volume=1.0e-3),
+            shape.test_points(points),
+        )
+        shape.enable_octree(b)
+        assert shape.octree_size == 0
+        for _ in range(2):
+            assert shape.volume(b, min_volume=1.0e-3) == expected[0]
+            assert shape.octree_size > 0
+            assert shape.test_box(b) == expected[1]
+            assert shape.ultimate_test_box(b, min_volume=1.0e-3) == expected[2]
+            np.testing.assert_array_equal(shape.test_points(points), expected[3])
+        bb = shape.bounding_box(box=b, tol=0.1)
+        assert bb.volume <= b.volume + 1.0e-12
+        shape.disable_octree()
+        assert shape.octree_size == 0
+
+    def test_octree_in_threads(self, geometry, box):
+        # Every shape guards its own octree, the shapes are processed concurrently.
+        shapes = [Shape(g.opc, *g.args) for g in geometry[:6]]
+        tasks = list(zip(shapes, box * 2))
+
+        def compute(task):
+            s, b = task
+            return (
+                s.volume(b, min_volume=1.0e-3),
+                s.ultimate_test_box(b, min_volume=1.0e-3),
+            )
+
+        expected = list(map(compute, tasks))
+        for s, b in tasks:
+            s.enable_octree(b)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            actual = list(executor.map(compute, tasks * 3))
+        assert actual == expected * 3
+        assert all(s.octree_size > 0 for s in shapes)
+
+    def test_octree_max_boxes(self, geometry, box):
+        shape = Shape(geometry[0].opc, *geometry[0].args)
+        shape.enable_octree(box[0], max_boxes=100)
+        v = shape.volume(box[0], min_volume=1.0e-3)
+        assert shape.octree_size == 100
+        assert shape.volume(box[0], min_volume=1.0e-3) == v
+
+    def test_octree_other_box(self, geometry, box):
+        shape = Shape(geometry[0].opc, *geometry[0].args)
+        shape.enable_octree(box[0])
+        shape.volume(box[1], min_volume=1.0e-3)
+        assert shape.octree_size == 0
+
+    def test_octree_wrong_args(self, geometry, box):
+        with pytest.raises(ValueError):
+            geometry[0].enable_octree("box")
+        with pytest.raises(ValueError):
+            geometry[0].enable_octree(box[0], max_boxes=-1)
+
     @pytest.mark.parametrize(
         "case_no, expected",
         enumerate(
@@ -2156,6 +2498,68 @@ class TestBody:
             assert simple_body.options[k] == v
         assert simple_body.material() == kwarg.get("MAT", None)
 
+    @pytest.mark.parametrize("case_no", [0, 3, 4, 5])
+    def test_simplify_budget(self, geometry, case_no):
+        body = Body(geometry[case_no], name=1)
+        gb = Box([3, 0, 0], 26, 20, 20)
+        interrupted = body.simplify(min_volume=0.001, box=gb, max_boxes=10)
+        assert interrupted.shape == body.shape
+        assert interrupted.options[NOT_FULLY_SIMPLIFIED]
+        expected = body.simplify(min_volume=0.001, box=gb)
+        assert NOT_FULLY_SIMPLIFIED not in expected.options
+        simple_body = interrupted.simplify(
+            min_volume=0.001, box=gb, budget_seconds=60, max_boxes=10**7
+        )
+        assert simple_body.shape == expected.shape
+        assert NOT_FULLY_SIMPLIFIED not in simple_body.options
+
+    @pytest.mark.parametrize("case_no", [0, 1, 2, 3, 4, 5, 8, 11])
+    def test_simplify_bounding_box(self, geometry, case_no):
+        body = Body(geometry[case_no], name=1)
+        gb = Box([3, 0, 0], 26, 20, 20)
+        expected = body.simplify(min_volume=0.001, box=gb)
+        simple_body = body.simplify(min_volume=0.001, box=gb, use_bounding_box=True)
+        assert simple_body.shape == expected.shape
+
+    @pytest.mark.parametrize("case_no", [0, 1, 2, 3, 4, 5, 8, 11])
+    def test_simplify_progressive(self, geometry, case_no):
+        body = Body(geometry[case_no], name=1)
+        gb = Box([3, 0, 0], 26, 20, 20)
+        expected = body.simplify(min_volume=0.001, box=gb)
+        simple_body = body.simplify(min_volume=0.001, box=gb, progressive=True)
+        assert simple_body.shape == expected.shape
+        assert NOT_FULLY_SIMPLIFIED not in simple_body.options
+
+    def test_simplify_shared(self, geometry):
+        bodies = [Body(g, name=i + 1) for i, g in enumerate(geometry)]
+        gb = Box([3, 0, 0], 26, 20, 20)
+        expected = list(simplify(bodies, box=gb, min_volume=0.001))
+        simple_bodies = list(simplify_shared(bodies, box=gb, min_volume=0.001))
+        assert [b.name() for b in simple_bodies] == [b.name() for b in expected]
+        for b, e in zip(simple_bodies, expected):
+            assert b.shape == e.shape
+            assert NOT_FULLY_SIMPLIFIED not in b.options
+        interrupted = list(
+            simplify_shared(bodies, box=gb, min_volume=0.001, max_boxes=1)
+        )
+        assert all(b.options[NOT_FULLY_SIMPLIFIED] for b in interrupted)
+
+    def test_simplify_bounding_box_outside(self):
+        # The half-space is redundant inside the bounding box, but without it
+        # the second sphere would be added to the cell.
+        s1 = create_surface("SX", -5, 1, name=1)
+        s2 = create_surface("SX", 5, 1, name=2)
+        px = create_surface("PX", 0, name=3)
+        shape = Shape("I", Shape("U", Shape("C", s1), Shape("C", s2)), Shape("C", px))
+        body = Body(shape, name=1)
+        gb = Box([0, 0, 0], 20, 20, 20)
+        simple_body = body.simplify(min_volume=0.001, box=gb, use_bounding_box=True)
+        assert simple_body.shape == Shape("C", s1)
+        points = gb.generate_random_points(10000)
+        np.testing.assert_array_equal(
+            simple_body.shape.test_points(points), shape.test_points(points)
+        )
+
     split_surfaces = {
         1: create_surface("SX", 4, 2, name=1),
         2: create_surface("SX", -1, 2, name=2),
@@ -477,6 +477,16 @@ def test_random_points(box, case_no):
     assert np.all(pt) == True
 
 
+def test_random_points_seed():
+    box = Box([1, 2, 3], 1, 2, 3)
+    points = Box([1, 2, 3], 1, 2, 3).generate_random_points(10)
+    np.testing.assert_array_equal(box.generate_random_points(10, seed=777), points)
+    first = box.generate_random_points(10, seed=1)
+    assert not np.array_equal(first, points)
+    assert not np.array_equal(box.generate_random_points(10), first)
+    np.testing.assert_array_equal(box.generate_random_points(n=10, seed=1), first)
+
+
 boxes = [
     Box([0, 0, 0], 1, 1, 1),
     Box([2, 0, 0], 0.5, 4, 2),
@@ -509,6 +519,43 @@ def test_check_intersection(case1, case2):
     assert result == answer
 
 
+def create_random_box(rng):
+    ex = rng.normal(size=3)
+    ex /= np.linalg.norm(ex)
+    ey = np.cross(ex, rng.normal(size=3))
+    ey /= np.linalg.norm(ey)
+    ez = np.cross(ex, ey)
+    return Box(rng.uniform(-3, 3, 3), *rng.uniform(0.2, 3, 3), ex=ex, ey=ey, ez=ez)
+
+
+def test_check_intersection_rotated():
+    rng = np.random.default_rng(1)
+    boxes = [create_random_box(rng) for _ in range(100)]
+    box = create_random_box(rng)
+    result = box.check_intersections(boxes)
+    assert result.dtype == bool
+    assert 0 < np.count_nonzero(result) < len(boxes)
+    points = box.generate_random_points(20000)
+    for other, r in zip(boxes, result):
+        assert other.check_intersection(box) == r
+        if np.any(other.test_points(points)):
+            assert r
+        if not r:
+            # Disjoint boxes are separated by a plane.
+            assert not np.any(box.test_points(other.generate_random_points(20000)))
+
+
+@pytest.mark.parametrize("gap, expected", [(0.01, False), (-0.01, True)])
+def test_check_intersection_edge_to_edge(gap, expected):
+    # Edges of the boxes are crossed, so the boxes are separated only by the
+    # axis, which is cross product of the edges.
+    c = np.sqrt(0.5)
+    box1 = Box([0, 0, 0], 2, 2, 2, ex=[c, c, 0], ey=[-c, c, 0], ez=EZ)
+    box2 = Box([4 * c + gap, 0, 0], 2, 2, 2, ex=[c, 0, c], ey=EY, ez=[-c, 0, c])
+    assert box1.check_intersection(box2) == expected
+    assert box1.check_intersections([box2, box1]).tolist() == [expected, True]
+
+
 @pytest.mark.parametrize(
     "center, wx, wy, wz, ex, ey, ez", [([0.0, 0.0, 0.0], 1.0, 2.0, 3.0, EX, EY, EZ)]
 )
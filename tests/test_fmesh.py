@@ -4,7 +4,7 @@ import numpy as np
 import pytest
 
 from mckit import read_meshtal
-from mckit.body import Body
+from mckit.body import Body, Shape
 from mckit.fmesh import CylMesh, RectMesh
 from mckit.geometry import EX, EY, EZ
 from mckit.material import Material
@@ -219,6 +219,19 @@ class TestRectMesh:
                 corners = tr.apply2point(corners)
             np.testing.assert_array_almost_equal(vox.corners, corners)
 
+    @pytest.mark.parametrize(
+        "mi, ti", product(range(len(bins)), range(len(transforms)))
+    )
+    def test_classify_voxels(self, mi: int, ti: int):
+        mesh = create_rmesh(bins[mi], transforms[ti])
+        sphere = create_surface("S", 2, 1, 0, 2.5)
+        shape = Shape("C", sphere)
+        result = mesh.classify_voxels(shape)
+        assert result.shape == mesh.shape
+        assert result.dtype == np.int8
+        for i, j, k in product(*map(range, mesh.shape)):
+            assert result[i, j, k] == shape.test_box(mesh.get_voxel(i, j, k))
+
     points = [
         [0.5, 0.9, 0],
         [-1.4, 0.5, 0.1],
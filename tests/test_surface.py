@@ -3195,11 +3195,6 @@ class TestRCC:
         result = surf.test_points(point)
         np.testing.assert_array_equal(result, expected)
 
-    # TODO dvp: see below
-
-    @pytest.mark.xfail(
-        reason="these tests fail sometimes in pytest, both in py8 and py7, but works fine in PyCharm"
-    )
     @pytest.mark.parametrize(
         "center, axis, rad, ans",
         [
@@ -3337,3 +3332,45 @@ def test_plane_is_close(a: Plane, b: Plane, expected: bool) -> None:
     else:
         assert not a.is_close_to(b)
         assert not b.is_close_to(a)
+
+
+def create_rotated_boxes(n, seed=1):
+    rng = np.random.default_rng(seed)
+    boxes = []
+    for _ in range(n):
+        center = rng.uniform(-15, 15, 3)
+        ex = rng.normal(size=3)
+        ex /= np.linalg.norm(ex)
+        ey = np.cross(ex, rng.normal(size=3))
+        ey /= np.linalg.norm(ey)
+        ez = np.cross(ex, ey)
+        boxes.append(Box(center, *rng.uniform(0.5, 8, 3), ex=ex, ey=ey, ez=ez))
+    return boxes
+
+
+@pytest.mark.parametrize(
+    "kind, params",
+    [
+        ("S", [1, 2, 3, 6]),
+        ("C/Z", [1, 2, 5]),
+        ("K/Z", [1, 2, 3, 0.25]),
+        ("K/Z", [1, 2, 3, 0.25, -1]),
+        ("RCC", [0, 0, -5, 0, 0, 10, 5]),
+        ("RCC", [1, -1, 0, 3, 4, 5, 4]),
+        ("BOX", [-5, -5, -5, 10, 0, 0, 0, 10, 0, 0, 0, 10]),
+        ("BOX", [0, 0, 0, 3, 4, 0, -8, 6, 0, 0, 0, 5]),
+        ("GQ", [1, 2, 1, 0.5, 0, -0.3, 1, 0, 0, -50]),
+        ("GQ", [1, -1, 0.5, 0, 0.2, 0, 0, 3, 0, 4]),
+        ("TZ", [1, 0, 0, 8, 2, 3]),
+        ("TX", [0, 0, 0, 3, 4, 5]),
+    ],
+)
+def test_box_test_rotated_boxes(kind, params):
+    surf = create_surface(kind, *params)
+    for box in create_rotated_boxes(50):
+        result = surf.test_box(box)
+        senses = surf.test_points(box.generate_random_points(20000))
+        if np.any(senses < 0) and np.any(senses > 0):
+            assert result == 0
+        elif result != 0:
+            assert np.all(senses == result)
@@ -2,6 +2,7 @@ from typing import Dict, List, Set, Union
 
 import tempfile
 import textwrap
+import tracemalloc
 
 from copy import deepcopy
 
@@ -11,6 +12,7 @@ import pytest
 from mckit.body import Body, Card, Shape
 from mckit.box import Box
 from mckit.material import Composition, Element, Material
+from mckit.overlaps import find_box_contacts, find_contacts
 from mckit.parser import ParseResult, from_file, from_text
 from mckit.surface import Sphere, Surface, create_surface
 from mckit.transformation import Transformation
@@ -67,6 +69,272 @@ def test_points(universe, case, points, answer):
     np.testing.assert_array_equal(result, answer)
 
 
+@pytest.mark.parametrize("chunk_size", [1, 2, 1000])
+def test_points_chunks(tmp_path, universe, chunk_size):
+    u = universe(1)
+    points = np.random.default_rng(0).uniform(-20, 20, (1000, 3))
+    expected = u.test_points(points)
+    assert expected.dtype == np.int32
+    source = np.memmap(tmp_path / "points", dtype=float, mode="w+", shape=points.shape)
+    source[:] = points
+    out = np.memmap(tmp_path / "cells", dtype=np.int32, mode="w+", shape=(1000,))
+    result = u.test_points(source, out=out, chunk_size=chunk_size)
+    assert result is out
+    np.testing.assert_array_equal(out, expected)
+    with pytest.raises(ValueError):
+        u.test_points(points, out=np.empty(10, dtype=np.int32))
+
+
+def test_points_memmap_memory(tmp_path, universe):
+    u = universe(1)
+    n = 200000
+    points = np.random.default_rng(0).uniform(-20, 20, (n, 3)).astype(np.float32)
+    expected = u.test_points(points[:1000])
+    source = np.memmap(
+        tmp_path / "points", dtype=np.float32, mode="w+", shape=points.shape
+    )
+    source[:] = points
+    out = np.memmap(tmp_path / "cells", dtype=np.int32, mode="w+", shape=(n,))
+    tracemalloc.start()
+    try:
+        result = u.test_points(source, out=out, chunk_size=10000)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert result is out
+    np.testing.assert_array_equal(out[:1000], expected)
+    # A float copy of the points would take 4.8 MB.
+    assert peak < 2 * 1024**2
+
+
+def test_points_lost():
+    u = Universe([Body(Shape("C", create_surface("SO", 1.0)), name=1)])
+    np.testing.assert_array_equal(u.test_points([[0, 0, 0], [0, 0, 2]]), [0, -1])
+
+
+def brute_force_test_points(u, points):
+    senses = np.array([c.shape.test_points(points) for c in u]).reshape(len(u), -1)
+    inside = senses == +1
+    result = np.where(inside.any(axis=0), np.argmax(inside, axis=0), -1)
+    return result, inside.sum(axis=0) > 1
+
+
+@pytest.mark.parametrize("case", [1, 2, 3])
+def test_points_locator(universe, case):
+    u = universe(case)
+    points = np.random.default_rng(0).uniform(-30, 30, (2000, 3))
+    result, claimed = u.test_points(points, multiple=True)
+    expected, expected_claimed = brute_force_test_points(u, points)
+    np.testing.assert_array_equal(result, expected)
+    np.testing.assert_array_equal(claimed, expected_claimed)
+
+
+def test_points_multiple():
+    s1 = create_surface("SO", 2.0, name=1)
+    s2 = create_surface("S", 1.0, 0, 0, 2.0, name=2)
+    u = Universe(
+        [
+            Body(Shape("C", s1), name=1),
+            Body(Shape("C", s2), name=2),
+            Body(Shape("I", s1, s2), name=3),
+        ]
+    )
+    points = [[-1.5, 0, 0], [1.5, 0, 0], [2.5, 0, 0], [5, 0, 0]]
+    result, claimed = u.test_points(points, multiple=True)
+    np.testing.assert_array_equal(result, [0, 0, 1, 2])
+    np.testing.assert_array_equal(claimed, [False, True, False, False])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 1000])
+def test_locate_points(universe, chunk_size):
+    u = universe(2)
+    assert u.fill_depth() == 2
+    points = [[-4, 0, 0], [0.5, 0, 0], [3.5, 0, 0], [10, 0, 0], [-2, 0, 2.5]]
+    path = u.locate_points(points, chunk_size=chunk_size)
+    assert path.dtype == np.int32
+    np.testing.assert_array_equal(path, [[0, 2], [1, 1], [1, 0], [2, -1], [0, 1]])
+    np.testing.assert_array_equal(path[:, 0], u.test_points(points))
+
+
+def test_locate_points_no_fill(universe):
+    u = universe(1)
+    assert u.fill_depth() == 1
+    points = np.random.default_rng(0).uniform(-20, 20, (100, 3))
+    np.testing.assert_array_equal(u.locate_points(points)[:, 0], u.test_points(points))
+
+
+@pytest.mark.parametrize("use_boxes", [False, True])
+def test_adjacency(universe, use_boxes):
+    u = universe(1)
+    adjacency = u.adjacency(use_boxes=use_boxes)
+    assert len(adjacency) == len(u)
+    for neighbours, expected in zip(adjacency, [[2], [2], [0, 1, 3], [2]]):
+        assert neighbours.dtype == np.int32
+        np.testing.assert_array_equal(neighbours, expected)
+
+
+def test_adjacency_boxes():
+    s1 = create_surface("PX", 0.0, name=1)
+    s2 = create_surface("SO", 1.0, name=2)
+    s3 = create_surface("S", 10.0, 0, 0, 1.0, name=3)
+    u = Universe(
+        [
+            Body(Shape("I", s1, Shape("C", s2)), name=1),
+            Body(Shape("I", s1, Shape("C", s3)), name=2),
+        ]
+    )
+    assert [list(n) for n in u.adjacency()] == [[1], [0]]
+    assert [list(n) for n in u.adjacency(use_boxes=True)] == [[], []]
+
+
+@pytest.mark.parametrize("case", [1, 2])
+@pytest.mark.parametrize("n", [1, 10, 1000])
+def test_track_points(universe, case, n):
+    u = universe(case)
+    t = np.linspace(0, 1, n)[:, None]
+    points = np.array([-15, -3, -12]) + t * np.array([30, 8, 24])
+    expected = u.test_points(points)
+    out = np.empty(n, dtype=np.int32)
+    assert u.track_points(points, out=out) is out
+    np.testing.assert_array_equal(out, expected)
+    np.testing.assert_array_equal(
+        u.track_points(points[::-1], adjacency=u.adjacency(use_boxes=True)),
+        expected[::-1],
+    )
+    with pytest.raises(ValueError):
+        u.track_points(points, out=np.empty(n + 1, dtype=np.int32))
+
+
+def test_track_points_lost():
+    u = Universe([Body(Shape("C", create_surface("SO", 1.0, name=1)), name=1)])
+    points = [[-2, 0, 0], [0, 0, 0], [0.5, 0, 0], [2, 0, 0], [3, 0, 0], [0, 0, 0]]
+    np.testing.assert_array_equal(u.track_points(points), [-1, 0, 0, -1, -1, 0])
+
+
+def test_check_overlaps():
+    u = from_file(data_filename_resolver("cli/data/overlapping_cubes.mcnp")).universe
+    report = u.check_overlaps(gap_points=10000, jobs=2)
+    assert not report.is_clean
+    assert [(o.first, o.second) for o in report.overlaps] == [(1, 2)]
+    overlap = report.overlaps[0]
+    assert overlap.volume == pytest.approx(1.0e5, rel=0.1)
+    assert np.all((overlap.points[:, 0] > 0) & (overlap.points[:, 0] < 10))
+    assert report.gap_points.shape[0] > 0
+    assert np.all(report.gap_points[:, 0] > 40)
+    report = u.check_overlaps(box=Box([0, 0, 0], 100, 100, 100), gap_points=10000)
+    assert report.gap_volume == pytest.approx(1.0e5, rel=0.1)
+
+
+def test_check_overlaps_clean(universe):
+    report = universe(1).check_overlaps(gap_points=1000)
+    assert report.is_clean
+    assert report.gap_volume == 0
+    # Touching cells can't be proved to be disjoint.
+    assert report.suspects == [(1, 2)]
+
+
+def test_check_overlaps_suspects():
+    outer = create_surface("SO", 10.0, name=1)
+    left = create_surface("PX", 1.0e-3, name=2)
+    right = create_surface("PX", 0.0, name=3)
+    u = Universe(
+        [
+            Body(Shape("I", Shape("C", outer), Shape("C", left)), name=1),
+            Body(Shape("I", Shape("C", outer), Shape("S", right)), name=2),
+        ]
+    )
+    report = u.check_overlaps(gap_points=0, n_points=100)
+    assert report.overlaps == []
+    assert report.suspects == [(0, 1)]
+    report = u.check_overlaps(gap_points=0, n_points=100000)
+    assert [(o.first, o.second) for o in report.overlaps] == [(0, 1)]
+    assert report.suspects == []
+
+
+def test_check_overlaps_seed():
+    u = from_file(data_filename_resolver("cli/data/overlapping_cubes.mcnp")).universe
+    first = u.check_overlaps(gap_points=1000, seed=1)
+    second = u.check_overlaps(gap_points=1000, seed=1, jobs=2)
+    other = u.check_overlaps(gap_points=1000, seed=2)
+    assert first.gap_volume == second.gap_volume
+    np.testing.assert_array_equal(first.gap_points, second.gap_points)
+    np.testing.assert_array_equal(first.overlaps[0].points, second.overlaps[0].points)
+    assert not np.array_equal(first.gap_points, other.gap_points)
+
+
+def test_find_box_contacts():
+    lower = np.array([[0, 0, 0], [1, 1, 1], [3, 0, 0], [0.5, 5, 0]], dtype=float)
+    upper = lower + 2
+    np.testing.assert_array_equal(find_box_contacts(lower, upper), [[0, 1], [1, 2]])
+
+
+SLAB_SIDES = (
+    create_surface("PY", 0.0, name=1),
+    create_surface("PY", 10.0, name=2),
+    create_surface("PZ", 0.0, name=3),
+    create_surface("PZ", 10.0, name=4),
+)
+
+
+def make_slab_universe(slabs, start_name):
+    """Creates universe of boxes 0 < y, z < 10 with the given x ranges."""
+    y0, y1, z0, z1 = SLAB_SIDES
+    cells = []
+    for k, (x0, x1) in enumerate(slabs):
+        s0 = create_surface("PX", x0, name=start_name + 2 * k)
+        s1 = create_surface("PX", x1, name=start_name + 2 * k + 1)
+        shape = Shape("I", s0, Shape("C", s1), y0, Shape("C", y1), z0, Shape("C", z1))
+        cells.append(Body(shape, name=start_name + k))
+    return Universe(cells, name_rule="clash")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("simplify", [False, True])
+@pytest.mark.parametrize(
+    "operation, expected",
+    [
+        ("subtract", [(10, [2, 5, 5], [7, 5, 5]), (11, [25, 5, 5], [15, 5, 5])]),
+        ("intersect", [(10, [7, 5, 5], [2, 5, 5])]),
+    ],
+)
+def test_cut(operation, expected, simplify, jobs):
+    u = make_slab_universe([(0, 10), (20, 30)], 10)
+    other = make_slab_universe([(5, 15), (-20, -10)], 20)
+    result = getattr(u, operation)(other, simplify=simplify, jobs=jobs)
+    assert result.name() == u.name()
+    assert [c.name() for c in result] == [name for name, _, _ in expected]
+    for c, (_, inside, outside) in zip(result, expected):
+        np.testing.assert_array_equal(c.shape.test_points([inside, outside]), [1, -1])
+    if operation == "subtract":
+        assert result[1].shape == u[1].shape
+    names = {s.name() for s in result.get_surfaces()}
+    assert names <= {1, 2, 3, 4, 10, 11, 12, 13, 20, 21}
+
+
+def test_cut_empty():
+    u = make_slab_universe([(0, 10), (20, 30)], 10)
+    other = make_slab_universe([(-5, 40)], 20)
+    assert len(u.subtract(other)) == 0
+    assert len(u.subtract(other, simplify=False)) == 2
+    assert len(u.intersect(make_slab_universe([(50, 60)], 20))) == 0
+
+
+def test_find_contacts():
+    u = make_slab_universe([(0, 10), (20, 30), (40, 50)], 10)
+    other = make_slab_universe([(5, 15), (8, 25), (50, 70)], 20)
+    contacts = find_contacts(u, other)
+    assert [list(c) for c in contacts] == [[0, 1], [1], []]
+
+
+def test_locator_cache():
+    u = Universe([Body(Shape("C", create_surface("SO", 1.0, name=1)), name=1)])
+    locator = u.locator()
+    assert u.locator() is locator
+    assert u.locator(tol=0.5) is not locator
+    u.add_cells(Body(Shape("C", create_surface("S", 5.0, 0, 0, 1.0, name=2)), name=2))
+    np.testing.assert_array_equal(u.test_points([[5, 0, 0.5], [0, 0, 3]]), [1, -1])
+
+
 _emp = Shape("R")
 
 
@@ -1066,6 +1334,26 @@ def test_simplify(universe, case, complexities, verbose):
         assert c.shape.complexity() == complexities[c.name()]
 
 
+@pytest.mark.parametrize(
+    "case, complexities", [(1, {1: 1, 2: 3, 3: 5, 4: 1}), (3, {1: 1, 2: 3, 4: 5, 5: 1})]
+)
+def test_simplify_shared(universe, case, complexities):
+    u = universe(case)
+    expected = universe(case)
+    u.simplify(min_volume=0.1, verbose=False, shared=True)
+    expected.simplify(min_volume=0.1, verbose=False)
+    assert [c.name() for c in u] == [c.name() for c in expected]
+    for c, e in zip(u, expected):
+        assert c.shape == e.shape
+        assert c.shape.complexity() == complexities[c.name()]
+
+
+def test_simplify_shared_wrong_options(universe):
+    u = universe(1)
+    with pytest.raises(ValueError):
+        u.simplify(min_volume=0.1, verbose=False, shared=True, progressive=True)
+
+
 @pytest.mark.parametrize(
     "case, box",
     [